@@ -0,0 +1,41 @@
+"""Standalone batch job worker.
+
+Processes jobs queued through /api/batch-jobs without serving HTTP, so bulk
+corrections don't compete with API workers. Start the API processes with
+BATCH_JOB_WORKER_EMBEDDED=false so they stop processing jobs themselves,
+then run as many workers as needed:
+
+    python batch_worker.py
+"""
+import asyncio
+import logging
+import signal
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+from services.service_container import init_container, shutdown_container
+from services.tracing import configure_tracing, shutdown_tracing
+
+
+async def main() -> None:
+    configure_tracing()
+    container = await init_container(worker=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    container.batch_jobs.start()
+    try:
+        await stop.wait()
+    finally:
+        # Finishes the current chunk; anything left is resumed by the next worker
+        await shutdown_container()
+        shutdown_tracing()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,313 @@
+"""Drive the API at a target request rate and report latency, throughput and cache/DB rates.
+
+By default the app runs in-process with mock providers (MOCK_PROVIDERS=true)
+and a throwaway SQLite database, so no API keys, Ollama or server are
+needed. Pass --base-url to load a running server instead (start it with
+MOCK_PROVIDERS=true for offline runs).
+
+Usage:
+    uv run --extra bench python -m benchmarks.load_test --rps 50 --duration 30 --output bench.json
+    uv run --extra bench python -m benchmarks.load_test --compare bench.json --fail-on-regression 20
+
+Latency is measured from each request's scheduled start, so a backed-up
+server shows up as latency instead of silently lowering the request rate.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SCENARIOS = ("correct", "stream", "batch", "history")
+
+SAMPLE_TEXTS = [
+    "お疲れ様です。明日の会議は10時からでよろしかったでしょうか。",
+    "資料を送りますので確認してください",
+    "来週の打ち合わせの件、日程を調整お願いします",
+    "先日はありがとうございました。引き続きよろしくお願いします",
+    "見積もりの件ですが、もう少し安くなりませんか",
+    "本日の打ち合わせは15時からに変更になりました",
+]
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+class ScenarioStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+
+    def summary(self, elapsed: float) -> dict:
+        ms = lambda value: round(value * 1000, 2) if value is not None else None
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "throughput_rps": round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": ms(sum(self.latencies) / len(self.latencies)) if self.latencies else None,
+            "p50_ms": ms(percentile(self.latencies, 50)),
+            "p95_ms": ms(percentile(self.latencies, 95)),
+            "p99_ms": ms(percentile(self.latencies, 99)),
+            "max_ms": ms(max(self.latencies)) if self.latencies else None,
+            "cache_hit_ratio": round(self.cache_hits / self.cache_lookups, 4) if self.cache_lookups else None
+        }
+
+class LoadTest:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        # A fixed pool of texts: its size controls how often the cache can answer
+        self.texts = [
+            f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]}（案件{i}）" for i in range(args.unique_texts)
+        ]
+        self.users = [f"bench-user-{i}" for i in range(args.users)]
+        self.stats = {name: ScenarioStats() for name in self.mix}
+        self.dropped = 0
+        self.in_flight = 0
+
+    def _correction_request(self) -> dict:
+        return {
+            "text": self.rng.choice(self.texts),
+            "user_id": self.rng.choice(self.users),
+            "preferred_model": self.args.model
+        }
+
+    async def _run_correct(self, stats: ScenarioStats) -> None:
+        response = await self.client.post("/api/correct", json=self._correction_request())
+        response.raise_for_status()
+        stats.cache_lookups += 1
+        stats.cache_hits += (response.json().get("meta") or {}).get("source") == "cache"
+
+    async def _run_stream(self, stats: ScenarioStats) -> None:
+        async with self.client.stream("POST", "/api/correct/stream", json=self._correction_request()) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["event"] == "error":
+                    raise RuntimeError(event.get("detail"))
+                if event["event"] == "done":
+                    stats.cache_lookups += 1
+                    stats.cache_hits += (event.get("meta") or {}).get("source") == "cache"
+
+    async def _run_batch(self, stats: ScenarioStats) -> None:
+        batch = [self._correction_request() for _ in range(self.args.batch_size)]
+        response = await self.client.post("/api/correct/batch", json=batch)
+        response.raise_for_status()
+        for item in response.json():
+            stats.cache_lookups += 1
+            stats.cache_hits += item["status"] == "cached"
+
+    async def _run_history(self, stats: ScenarioStats) -> None:
+        response = await self.client.get(
+            f"/api/user/{self.rng.choice(self.users)}/history", params={"limit": 20}
+        )
+        response.raise_for_status()
+
+    async def _run_one(self, scenario: str, scheduled: float) -> None:
+        stats = self.stats[scenario]
+        self.in_flight += 1
+        try:
+            await getattr(self, f"_run_{scenario}")(stats)
+        except Exception:
+            stats.errors += 1
+        finally:
+            self.in_flight -= 1
+            stats.latencies.append(time.perf_counter() - scheduled)
+
+    async def _history_rows_written(self) -> Optional[int]:
+        try:
+            response = await self.client.get("/api/admin/history-writer")
+            return response.json()["history_writer"]["written"]
+        except Exception:
+            return None
+
+    async def run(self) -> dict:
+        scenarios = list(self.mix)
+        weights = [self.mix[name] for name in scenarios]
+        rows_before = await self._history_rows_written()
+
+        # Warm-up requests are sent at the same rate but not recorded
+        if self.args.warmup > 0:
+            await self._drive(scenarios, weights, self.args.warmup, record=False)
+            self.stats = {name: ScenarioStats() for name in self.mix}
+            self.dropped = 0
+            rows_before = await self._history_rows_written()
+
+        elapsed = await self._drive(scenarios, weights, self.args.duration, record=True)
+        # Give the history writer a flush interval to catch up before reading its counters
+        await asyncio.sleep(self.args.settle)
+        rows_after = await self._history_rows_written()
+
+        all_latencies = [latency for stats in self.stats.values() for latency in stats.latencies]
+        totals = ScenarioStats()
+        totals.latencies = all_latencies
+        totals.errors = sum(stats.errors for stats in self.stats.values())
+        totals.cache_hits = sum(stats.cache_hits for stats in self.stats.values())
+        totals.cache_lookups = sum(stats.cache_lookups for stats in self.stats.values())
+        return {
+            "started_at": datetime.utcnow().isoformat(),
+            "config": {
+                "target": self.args.base_url or "in-process",
+                "rps": self.args.rps,
+                "duration_s": self.args.duration,
+                "mix": self.mix,
+                "unique_texts": self.args.unique_texts,
+                "users": self.args.users,
+                "batch_size": self.args.batch_size,
+                "model": self.args.model,
+                "seed": self.args.seed,
+                "mock_profiles": os.getenv("MOCK_PROVIDER_PROFILES")
+            },
+            "elapsed_s": round(elapsed, 3),
+            "dropped": self.dropped,
+            "scenarios": {name: stats.summary(elapsed) for name, stats in self.stats.items()},
+            "total": totals.summary(elapsed),
+            "history_rows_per_s": (
+                round((rows_after - rows_before) / elapsed, 2)
+                if rows_before is not None and rows_after is not None and elapsed else None
+            )
+        }
+
+    async def _drive(self, scenarios: List[str], weights: List[float], duration: float, record: bool) -> float:
+        """Open-loop arrivals at the target rate; requests beyond max_in_flight are dropped and counted"""
+        interval = 1.0 / self.args.rps
+        tasks = set()
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            scheduled = start + sent * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent += 1
+            if self.in_flight >= self.args.max_in_flight:
+                self.dropped += 1
+                continue
+            scenario = self.rng.choices(scenarios, weights)[0]
+            task = asyncio.create_task(self._run_one(scenario, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+@asynccontextmanager
+async def open_client(base_url: Optional[str], timeout: float):
+    import httpx
+
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+            yield client
+        return
+
+    # In-process: mock providers and a scratch database unless the caller configured otherwise
+    os.environ.setdefault("MOCK_PROVIDERS", "true")
+    os.environ.setdefault("LOCAL_LLM_WARMUP", "false")
+    os.environ.setdefault("BATCH_JOB_WORKER_EMBEDDED", "false")
+    scratch_dir = tempfile.TemporaryDirectory(prefix="correction-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{scratch_dir.name}/bench.db")
+    import main
+
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                yield client
+    finally:
+        scratch_dir.cleanup()
+
+def compare(result: dict, baseline: dict, max_regression: Optional[float]) -> bool:
+    """Print p95 and throughput changes against a baseline; False if p95 regressed past max_regression percent"""
+    ok = True
+    print(f"\n{'vs baseline':<12}{'p95':>12}{'Δp95':>10}{'rps':>10}{'Δrps':>10}")
+    for name, stats in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not base.get("p95_ms") or stats["p95_ms"] is None:
+            continue
+        p95_change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+        rps_change = (
+            (stats["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100
+            if base.get("throughput_rps") else 0.0
+        )
+        flag = ""
+        if max_regression is not None and p95_change > max_regression:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{name:<12}{stats['p95_ms']:>10.1f}ms{p95_change:>+9.1f}%{stats['throughput_rps']:>10.1f}{rps_change:>+9.1f}%{flag}")
+    return ok
+
+def print_report(result: dict) -> None:
+    print(f"{'scenario':<12}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'cache':>8}")
+    rows = list(result["scenarios"].items()) + [("total", result["total"])]
+    for name, stats in rows:
+        fmt = lambda value: f"{value:>8.1f}ms" if value is not None else f"{'-':>10}"
+        ratio = stats["cache_hit_ratio"]
+        print(
+            f"{name:<12}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>8.1f}"
+            f"{fmt(stats['p50_ms'])}{fmt(stats['p95_ms'])}{fmt(stats['p99_ms'])}"
+            f"{(f'{ratio:.0%}' if ratio is not None else '-'):>8}"
+        )
+    print(f"dropped: {result['dropped']}  history rows/s: {result['history_rows_per_s']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of unmeasured load first")
+    parser.add_argument("--settle", type=float, default=1.0, help="Seconds to wait for history flushes")
+    parser.add_argument("--mix", default="correct=7,stream=1,batch=1,history=1")
+    parser.add_argument("--unique-texts", type=int, default=200, help="Smaller pools mean more cache hits")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--model", default="openai-gpt4o")
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON from a previous --output")
+    parser.add_argument("--fail-on-regression", type=float, help="Exit 1 if any p95 grew by more than this percent")
+    args = parser.parse_args()
+
+    async with open_client(args.base_url, args.timeout) as client:
+        result = await LoadTest(client, args).run()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.fail_on_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
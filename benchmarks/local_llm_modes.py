@@ -0,0 +1,58 @@
+"""Compare LocalLLMService generation modes against a running Ollama server.
+
+Usage:
+    uv run python -m benchmarks.local_llm_modes --iterations 5 --model qwen2.5:3b-instruct
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from services.local_llm_service import LocalLLMService, LOCAL_LLM_MODES
+
+SAMPLE_TEXTS = [
+    "お疲れ様です。明日の会議は10時からでよろしかったでしょうか。",
+    "資料を送りますので確認してください",
+    "来週の打ち合わせの件、日程を調整お願いします",
+]
+
+async def run_mode(mode: str, model: str, iterations: int, concurrency: int) -> dict:
+    service = LocalLLMService(model_name=model, mode=mode, concurrency=concurrency)
+    # Warm up so model load time isn't attributed to the first mode
+    await service.correct_japanese_text(SAMPLE_TEXTS[0])
+
+    latencies = []
+    errors = 0
+    for i in range(iterations):
+        text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        start = time.perf_counter()
+        variants = await service.correct_japanese_text(text)
+        latencies.append(time.perf_counter() - start)
+        errors += sum(1 for v in variants if v.type == "error")
+
+    return {
+        "mode": mode,
+        "iterations": iterations,
+        "mean_s": statistics.mean(latencies),
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "error_variants": errors,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="qwen2.5:3b-instruct")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(LOCAL_LLM_MODES), choices=LOCAL_LLM_MODES)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'mean':>10}{'p50':>10}{'max':>10}{'errors':>8}")
+    for mode in args.modes:
+        result = await run_mode(mode, args.model, args.iterations, args.concurrency)
+        print(
+            f"{result['mode']:<12}{result['mean_s']:>9.2f}s{result['p50_s']:>9.2f}s"
+            f"{result['max_s']:>9.2f}s{result['error_variants']:>8}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import logging
+from datetime import timedelta
+from typing import List
+from sqlalchemy import delete, select
+from .models import CorrectionHistory, CorrectionRequest, CorrectionVariantRecord, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Variant rows of one legacy correction were written together within this window
+_GROUP_WINDOW = timedelta(seconds=5)
+
+def _same_correction(group: List[CorrectionHistory], row: CorrectionHistory) -> bool:
+    first = group[0]
+    return (
+        row.user_id == first.user_id
+        and row.original_text == first.original_text
+        and row.ai_model_used == first.ai_model_used
+        and abs(row.created_at - first.created_at) <= _GROUP_WINDOW
+        and row.correction_type not in {r.correction_type for r in group}
+    )
+
+def _group_rows(rows: List[CorrectionHistory]) -> List[List[CorrectionHistory]]:
+    groups: List[List[CorrectionHistory]] = []
+    for row in rows:
+        if groups and _same_correction(groups[-1], row):
+            groups[-1].append(row)
+        else:
+            groups.append([row])
+    return groups
+
+async def migrate_legacy_history(batch_size: int = 1000) -> int:
+    """Move legacy correction_history rows into correction_requests/correction_variants.
+
+    Each batch inserts the normalized rows and deletes the legacy ones in the
+    same transaction, so an interrupted migration resumes where it stopped.
+    Returns the number of legacy rows migrated.
+    """
+    migrated = 0
+    while True:
+        async with SessionLocal() as db:
+            rows = list((await db.scalars(
+                select(CorrectionHistory).order_by(CorrectionHistory.id).limit(batch_size)
+            )).all())
+            if not rows:
+                break
+
+            groups = _group_rows(rows)
+            # The last group may continue in the next batch; leave it for then
+            if len(rows) == batch_size and len(groups) > 1:
+                groups = groups[:-1]
+
+            for group in groups:
+                db.add(CorrectionRequest(
+                    user_id=group[0].user_id or "anonymous",
+                    original_text=group[0].original_text,
+                    ai_model_used=group[0].ai_model_used,
+                    created_at=group[0].created_at,
+                    variants=[
+                        CorrectionVariantRecord(
+                            position=position,
+                            corrected_text=row.corrected_text,
+                            correction_type=row.correction_type
+                        )
+                        for position, row in enumerate(group)
+                    ]
+                ))
+
+            moved_ids = [row.id for group in groups for row in group]
+            await db.execute(delete(CorrectionHistory).where(CorrectionHistory.id.in_(moved_ids)))
+            await db.commit()
+            migrated += len(moved_ids)
+
+    if migrated:
+        logger.info(f"Migrated {migrated} legacy history rows")
+    return migrated
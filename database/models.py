@@ -1,13 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, create_engine
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, Index, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import relationship
 from datetime import datetime
+import os
 
 Base = declarative_base()
 
 class CorrectionHistory(Base):
+    """Legacy denormalized history (one row per variant); migrated into CorrectionRequest"""
     __tablename__ = "correction_history"
-    
+
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True)
     original_text = Column(Text, nullable=False)
@@ -16,23 +19,135 @@ class CorrectionHistory(Base):
     ai_model_used = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Serves per-user listing ordered by (created_at, id) for keyset pagination
+        Index("ix_correction_history_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class CorrectionRequest(Base):
+    """One correction: the original text plus who, which model and how long"""
+    __tablename__ = "correction_requests"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    original_text = Column(Text, nullable=False)
+    ai_model_used = Column(String, nullable=False)
+    correction_style = Column(String)
+    processing_time_ms = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    variants = relationship(
+        "CorrectionVariantRecord",
+        back_populates="request",
+        cascade="all, delete-orphan",
+        order_by="CorrectionVariantRecord.position"
+    )
+
+    __table_args__ = (
+        Index("ix_correction_requests_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class CorrectionVariantRecord(Base):
+    """One suggested rewrite belonging to a CorrectionRequest"""
+    __tablename__ = "correction_variants"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(Integer, ForeignKey("correction_requests.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)
+    corrected_text = Column(Text, nullable=False)
+    correction_type = Column(String, nullable=False)
+
+    request = relationship("CorrectionRequest", back_populates="variants")
+
+class BatchJob(Base):
+    """A queued batch correction; workers claim it with a lease renewed by heartbeat_at"""
+    __tablename__ = "batch_jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="queued")
+    total_items = Column(Integer, nullable=False, default=0)
+    completed_items = Column(Integer, nullable=False, default=0)
+    failed_items = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_batch_jobs_status_created", "status", "created_at"),
+    )
+
+class BatchJobItem(Base):
+    """One message of a BatchJob and, once processed, its result"""
+    __tablename__ = "batch_job_items"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("batch_jobs.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    user_id = Column(String, nullable=False, default="anonymous")
+    preferred_model = Column(String)
+    correction_style = Column(String, nullable=False, default="default")
+    status = Column(String, nullable=False, default="pending")
+    result = Column(Text)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index("ix_batch_job_items_job_status_position", "job_id", "status", "position"),
+    )
+
 class UserSettings(Base):
     __tablename__ = "user_settings"
-    
+
     user_id = Column(String, primary_key=True, index=True)
     preferred_ai_model = Column(String, default="openai-gpt4o")
     default_correction_style = Column(String, default="polite")
 
-DATABASE_URL = "sqlite:///./correction_app.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Use sqlite+aiosqlite locally; postgresql+asyncpg://... works unchanged
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./correction_app.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+if IS_SQLITE:
+    engine = create_async_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        # WAL lets readers proceed while a write is in progress
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+else:
+    engine = create_async_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv("DATABASE_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DATABASE_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DATABASE_POOL_TIMEOUT", "10")),
+        pool_pre_ping=True
+    )
+
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def _create_missing_indexes(sync_conn):
+    # create_all skips tables that already exist, so add indexes introduced later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        if IS_SQLITE:
+            from .search_index import create_search_index
+            await conn.run_sync(create_search_index)
+    from .migrations import migrate_legacy_history
+    await migrate_legacy_history()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "correction_search"
+
+def user_match_term(user_id: str) -> str:
+    """The indexed form of a user id: wrapped in delimiters so it is always
+    long enough for the trigram tokenizer and "u1" cannot match "u10"."""
+    return f"<{user_id}>"
+
+# One row per correction request (rowid = correction_requests.id). The trigram
+# tokenizer matches any 3+ character substring, which suits Japanese text
+# without a word segmenter. user_id is indexed (as user_match_term) so a
+# search intersects with the user's postings instead of scanning every
+# user's matches. Triggers keep it in sync with the history tables.
+_SEARCH_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        original_text,
+        corrected_text,
+        user_id,
+        tokenize = 'trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS correction_search_request_insert
+    AFTER INSERT ON correction_requests BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, original_text, corrected_text, user_id)
+        VALUES (new.id, new.original_text, '', '<' || new.user_id || '>');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS correction_search_variant_insert
+    AFTER INSERT ON correction_variants BEGIN
+        UPDATE {SEARCH_TABLE}
+        SET corrected_text = CASE corrected_text
+            WHEN '' THEN new.corrected_text
+            ELSE corrected_text || char(10) || new.corrected_text
+        END
+        WHERE rowid = new.request_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS correction_search_request_delete
+    AFTER DELETE ON correction_requests BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END
+    """
+]
+
+_BACKFILL = f"""
+    INSERT INTO {SEARCH_TABLE}(rowid, original_text, corrected_text, user_id)
+    SELECT r.id, r.original_text, COALESCE(group_concat(v.corrected_text, char(10)), ''), '<' || r.user_id || '>'
+    FROM correction_requests r
+    LEFT JOIN correction_variants v ON v.request_id = r.id
+    GROUP BY r.id
+"""
+
+def create_search_index(sync_conn) -> None:
+    """Create the SQLite FTS5 history index and its triggers, backfilling it on first creation"""
+    exists = sync_conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE}
+    ).first()
+    for statement in _SEARCH_DDL:
+        sync_conn.execute(text(statement))
+    if not exists:
+        result = sync_conn.execute(text(_BACKFILL))
+        logger.info(f"Built history search index ({result.rowcount} corrections)")
@@ -1,8 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager, nullcontext
+from opentelemetry import propagate, trace
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import os
+import time
+import json
 from dotenv import load_dotenv
 import logging
 
@@ -11,8 +17,31 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+from services.correction_service import CorrectionService
+from services.history_service import HistoryService, InvalidCursorError
+from services.history_retention import HistoryRetentionService
+from services.batch_job_service import BatchJobService, JobNotFoundError
+from services.profiling import EventLoopMonitor, ProfilerRunningError, SamplingProfiler, SlowRequestLog
+from services.service_container import init_container, shutdown_container
+from services.metrics import HTTP_REQUEST_SECONDS, register_service_collector, unregister_service_collector
+from services.request_timing import current_timing, track_timing
+from services.tracing import configure_tracing, shutdown_tracing, tracer
 
-app = FastAPI(title="AI Message Correction API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_tracing()
+    # Build the service graph once per process and share it across requests
+    app.state.services = await init_container()
+    metrics_collector = register_service_collector(app.state.services)
+    try:
+        yield
+    finally:
+        unregister_service_collector(metrics_collector)
+        await shutdown_container()
+        shutdown_tracing()
+
+app = FastAPI(title="AI Message Correction API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,12 +51,116 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _route_path(request: Request) -> str:
+    # Label by route template so ids in the path don't create new series
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+async def _finish_after(body_iterator, finish):
+    """Yield the body through and call finish once the last chunk is sent (or the client goes away)"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        finish()
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    start_time = time.perf_counter()
+    status = 500
+    # Newer FastAPI versions (and ASGI instrumentation) open the server span themselves
+    owns_span = not trace.get_current_span().is_recording()
+    span = tracer.start_span(
+        f"{request.method} {request.url.path}",
+        # Continue the browser's trace when it sent a traceparent header
+        context=propagate.extract(request.headers),
+        kind=trace.SpanKind.SERVER,
+        attributes={"http.request.method": request.method, "url.path": request.url.path}
+    ) if owns_span else None
+
+    def finish():
+        route_path = _route_path(request)
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            route=route_path,
+            status=str(status)
+        ).observe(time.perf_counter() - start_time)
+        # A streamed body finishes outside the span's context; make it current again for the trace id
+        with trace.use_span(span) if owns_span else nullcontext():
+            request.app.state.services.slow_requests.observe(request, status, route_path, timing)
+        if owns_span:
+            span.update_name(f"{request.method} {route_path}")
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.response.status_code", status)
+            span.end()
+
+    streamed = False
+    try:
+        with trace.use_span(span) if owns_span else nullcontext():
+            # Services fill in the timing as the request passes through them
+            with track_timing() as timing:
+                response = await call_next(request)
+        status = response.status_code
+        # Without a Content-Length the endpoint is still streaming the body when the
+        # headers arrive here, so the request is only done once the body iterator is.
+        # Stage timings aren't known yet either, so streams get no Server-Timing header.
+        if "content-length" not in response.headers:
+            response.body_iterator = _finish_after(response.body_iterator, finish)
+            streamed = True
+        else:
+            response.headers["Server-Timing"] = timing.server_timing()
+        return response
+    finally:
+        if not streamed:
+            finish()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 class CorrectionRequest(BaseModel):
     text: str
     user_id: Optional[str] = "anonymous"
     preferred_model: Optional[str] = None
     correction_style: Optional[str] = "default"
 
+def get_correction_service(request: Request) -> CorrectionService:
+    """Dependency returning the process-wide CorrectionService"""
+    return request.app.state.services.correction_service
+
+def get_history_service(request: Request) -> HistoryService:
+    """Dependency returning the process-wide HistoryService"""
+    return request.app.state.services.history_service
+
+def get_history_retention(request: Request) -> HistoryRetentionService:
+    """Dependency returning the process-wide HistoryRetentionService"""
+    return request.app.state.services.history_retention
+
+def get_batch_jobs(request: Request) -> BatchJobService:
+    """Dependency returning the process-wide BatchJobService"""
+    return request.app.state.services.batch_jobs
+
+def get_profiler(request: Request) -> SamplingProfiler:
+    """Dependency returning the process-wide SamplingProfiler"""
+    return request.app.state.services.profiler
+
+def get_slow_requests(request: Request) -> SlowRequestLog:
+    """Dependency returning the process-wide SlowRequestLog"""
+    return request.app.state.services.slow_requests
+
+def get_loop_monitor(request: Request) -> EventLoopMonitor:
+    """Dependency returning the process-wide EventLoopMonitor"""
+    return request.app.state.services.loop_monitor
+
+class ProfilerStartRequest(BaseModel):
+    seconds: float = 30
+    interval_ms: Optional[float] = None
+    all_threads: bool = False
+
+class LocalModelPullRequest(BaseModel):
+    model_name: str = "qwen2.5:3b-instruct"
+
 class ModelSelectionRequest(BaseModel):
     user_id: str
     model_name: str
@@ -37,9 +170,31 @@ class CorrectionVariant(BaseModel):
     type: str
     reason: str
 
+class CorrectionMeta(BaseModel):
+    model: Optional[str] = None
+    source: Optional[str] = None
+    cache_tier: Optional[str] = None
+    fallback_from: Optional[str] = None
+    total_ms: float
+    provider_ms: Optional[float] = None
+    queue_ms: Optional[float] = None
+    tokens_in: int = 0
+    tokens_out: int = 0
+    stages_ms: Dict[str, float] = {}
+
 class CorrectionResponse(BaseModel):
     original_text: str
     variants: List[CorrectionVariant]
+    meta: Optional[CorrectionMeta] = None
+
+class BatchCorrectionResponse(CorrectionResponse):
+    status: str
+    error: Optional[str] = None
+
+def _correction_meta() -> Optional[CorrectionMeta]:
+    """Timing and routing details collected for the current request"""
+    timing = current_timing()
+    return CorrectionMeta(**timing.to_meta()) if timing is not None else None
 
 @app.get("/")
 async def root():
@@ -50,11 +205,11 @@ async def health_check():
     return {"status": "healthy"}
 
 @app.post("/api/correct", response_model=CorrectionResponse)
-async def correct_message(request: CorrectionRequest):
+async def correct_message(
+    request: CorrectionRequest,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
     try:
-        from services.correction_service import CorrectionService
-        
-        correction_service = CorrectionService()
         variants = await correction_service.correct_text(
             request.text, 
             request.user_id,
@@ -68,28 +223,63 @@ async def correct_message(request: CorrectionRequest):
                 text=v.text,
                 type=v.type,
                 reason=v.reason
-            ) for v in variants]
+            ) for v in variants],
+            meta=_correction_meta()
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/correct/stream")
+async def correct_message_stream(
+    request: CorrectionRequest,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
+    """Stream correction variants as NDJSON, one line per variant as soon as it is ready"""
+    async def generate():
+        try:
+            async for variant in correction_service.correct_text_stream(
+                request.text,
+                request.user_id,
+                request.preferred_model,
+                request.correction_style
+            ):
+                event = {
+                    "event": "variant",
+                    "variant": CorrectionVariant(
+                        text=variant.text,
+                        type=variant.type,
+                        reason=variant.reason
+                    ).model_dump()
+                }
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+            meta = _correction_meta()
+            yield json.dumps({
+                "event": "done",
+                "original_text": request.text,
+                "meta": meta.model_dump() if meta else None
+            }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Streaming correction failed: {str(e)}")
+            yield json.dumps({"event": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.get("/api/models")
-async def get_available_models():
+async def get_available_models(correction_service: CorrectionService = Depends(get_correction_service)):
     """Get available AI models"""
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         models = correction_service.get_available_models()
         return {"models": models}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/user/model")
-async def set_user_model(request: ModelSelectionRequest):
+async def set_user_model(
+    request: ModelSelectionRequest,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
     """Set user's preferred AI model"""
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         success = await correction_service.set_user_preferred_model(
             request.user_id, 
             request.model_name
@@ -103,82 +293,142 @@ async def set_user_model(request: ModelSelectionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/user/{user_id}/settings")
-async def get_user_settings(user_id: str):
+async def get_user_settings(
+    user_id: str,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
     """Get user settings including preferred model"""
     try:
-        from database.models import UserSettings, get_db
-        db = next(get_db())
-        
-        user_settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-        
-        if user_settings:
-            return {
-                "user_id": user_settings.user_id,
-                "preferred_ai_model": user_settings.preferred_ai_model,
-                "default_correction_style": user_settings.default_correction_style
-            }
-        else:
-            # Return default settings
-            return {
-                "user_id": user_id,
-                "preferred_ai_model": "openai-gpt4o",
-                "default_correction_style": "polite"
-            }
+        return await correction_service.get_user_settings(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.get("/api/user/{user_id}/history")
-async def get_correction_history(user_id: str, limit: int = 50, offset: int = 0):
-    """Get user's correction history with pagination"""
+async def get_correction_history(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    history_service: HistoryService = Depends(get_history_service)
+):
+    """Get user's correction history with pagination.
+    
+    Pass the returned next_cursor as cursor for constant-time paging; offset
+    paging is kept for existing clients.
+    """
     try:
-        from database.models import CorrectionHistory, get_db
-        db = next(get_db())
-        
-        history_query = db.query(CorrectionHistory).filter(
-            CorrectionHistory.user_id == user_id
-        ).order_by(CorrectionHistory.created_at.desc())
-        
-        total_count = history_query.count()
-        history_items = history_query.offset(offset).limit(limit).all()
-        
-        return {
-            "total_count": total_count,
-            "items": [
-                {
-                    "id": item.id,
-                    "original_text": item.original_text,
-                    "corrected_text": item.corrected_text,
-                    "correction_type": item.correction_type,
-                    "ai_model_used": item.ai_model_used,
-                    "created_at": item.created_at
-                }
-                for item in history_items
-            ]
-        }
+        return await history_service.get_history(user_id, limit, offset, cursor, include_total)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/user/{user_id}/history/search")
+async def search_correction_history(
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    history_service: HistoryService = Depends(get_history_service)
+):
+    """Search user's corrections; matches are wrapped in <mark> in the snippets"""
+    try:
+        return await history_service.search_history(user_id, q, limit, offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/user/{user_id}/history/grouped")
+async def get_grouped_correction_history(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    history_service: HistoryService = Depends(get_history_service)
+):
+    """Get user's corrections with their variants nested, newest first"""
+    try:
+        return await history_service.get_grouped_history(user_id, limit, cursor, include_total)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.get("/api/admin/health")
-async def get_service_health():
+async def get_service_health(correction_service: CorrectionService = Depends(get_correction_service)):
     """Get health status of all AI services"""
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         health_status = correction_service.get_service_health()
         return {"services": health_status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/admin/profiler/start")
+async def start_profiler(body: ProfilerStartRequest, profiler: SamplingProfiler = Depends(get_profiler)):
+    """Sample the event loop (or every thread) for the given number of seconds"""
+    try:
+        interval = body.interval_ms / 1000 if body.interval_ms else None
+        return {"profiler": profiler.start(body.seconds, interval, body.all_threads)}
+    except ProfilerRunningError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/admin/profiler/stop")
+async def stop_profiler(profiler: SamplingProfiler = Depends(get_profiler)):
+    """Stop the running profile early, keeping its samples"""
+    return {"profiler": profiler.stop()}
+
+@app.get("/api/admin/profiler")
+async def get_profiler_status(profiler: SamplingProfiler = Depends(get_profiler)):
+    """Get whether a profile is running and how many samples it has"""
+    return {"profiler": profiler.get_stats()}
+
+@app.get("/api/admin/profiler/flamegraph")
+async def download_flamegraph(
+    format: str = Query("svg", pattern="^(svg|collapsed)$"),
+    profiler: SamplingProfiler = Depends(get_profiler)
+):
+    """Download the last profile as an SVG flamegraph or as collapsed stacks (flamegraph.pl, speedscope)"""
+    if not profiler.has_profile():
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}"
+    if format == "collapsed":
+        return Response(
+            profiler.collapsed(), media_type="text/plain",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.folded"'}
+        )
+    return Response(
+        profiler.flamegraph_svg(), media_type="image/svg+xml",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.svg"'}
+    )
+
+@app.get("/api/admin/slow-requests")
+async def list_slow_requests(
+    limit: int = Query(50, ge=1, le=1000),
+    slow_requests: SlowRequestLog = Depends(get_slow_requests)
+):
+    """Get the most recent requests over SLOW_REQUEST_THRESHOLD_MS with their stage timings"""
+    return {"slow_requests": {**slow_requests.get_stats(), "entries": slow_requests.entries(limit)}}
+
+@app.post("/api/admin/slow-requests/clear")
+async def clear_slow_requests(slow_requests: SlowRequestLog = Depends(get_slow_requests)):
+    """Empty the slow request buffer"""
+    slow_requests.clear()
+    return {"message": "Slow request buffer cleared"}
+
+@app.get("/api/admin/event-loop")
+async def get_event_loop_stats(loop_monitor: EventLoopMonitor = Depends(get_loop_monitor)):
+    """Get event loop lag and the stacks of recent stalls"""
+    return {"event_loop": loop_monitor.get_stats()}
+
 @app.post("/api/admin/reset-circuit-breaker/{service_name}")
-async def reset_circuit_breaker(service_name: str):
+async def reset_circuit_breaker(
+    service_name: str,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
     """Reset circuit breaker for a specific service"""
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         success = correction_service.reset_service_circuit_breaker(service_name)
         
         if success:
@@ -188,23 +438,82 @@ async def reset_circuit_breaker(service_name: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/admin/local-llm")
+async def get_local_llm_status(correction_service: CorrectionService = Depends(get_correction_service)):
+    """Get local LLM model resolution and warm-up status"""
+    status = correction_service.get_local_llm_status()
+    if status is None:
+        raise HTTPException(status_code=503, detail="Local LLM service is not available")
+    return {"local_llm": status}
+
+@app.post("/api/admin/local-llm/refresh")
+async def refresh_local_llm(correction_service: CorrectionService = Depends(get_correction_service)):
+    """Rediscover installed local models"""
+    try:
+        status = await correction_service.refresh_local_models()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=503, detail="Local LLM service is not available")
+    return {"local_llm": status}
+
+@app.post("/api/admin/local-llm/pull")
+async def pull_local_llm_model(
+    request: LocalModelPullRequest,
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
+    """Pull a model onto the Ollama server (may take several minutes)"""
+    try:
+        status = await correction_service.pull_local_model(request.model_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=503, detail="Local LLM service is not available")
+    return {"local_llm": status}
+
+@app.get("/api/admin/routing")
+async def get_routing_stats(correction_service: CorrectionService = Depends(get_correction_service)):
+    """Get model routing mode, latency percentiles and hedging counts"""
+    return {"routing": correction_service.get_routing_stats()}
+
+@app.get("/api/admin/rate-limits")
+async def get_rate_limit_stats(correction_service: CorrectionService = Depends(get_correction_service)):
+    """Get per-provider in-flight calls, queue time and rejections"""
+    return {"rate_limits": correction_service.get_limiter_stats()}
+
+@app.get("/api/admin/history-writer")
+async def get_history_writer_stats(correction_service: CorrectionService = Depends(get_correction_service)):
+    """Get history writer queue depth and flush latency"""
+    return {"history_writer": correction_service.get_history_writer_stats()}
+
+@app.get("/api/admin/history-retention")
+async def get_history_retention_stats(history_retention: HistoryRetentionService = Depends(get_history_retention)):
+    """Get retention policy, last archival run and archive files"""
+    return {"history_retention": history_retention.get_stats()}
+
+@app.post("/api/admin/history-retention/run")
+async def run_history_retention(history_retention: HistoryRetentionService = Depends(get_history_retention)):
+    """Archive and delete history beyond the retention policy now"""
+    if not history_retention.enabled:
+        raise HTTPException(status_code=400, detail="History retention is disabled")
+    try:
+        return {"result": await history_retention.run()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/admin/cache-stats")
-async def get_cache_stats():
+async def get_cache_stats(correction_service: CorrectionService = Depends(get_correction_service)):
     """Get cache performance statistics"""  
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         cache_stats = await correction_service.get_cache_stats()
         return {"cache": cache_stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/admin/clear-cache")
-async def clear_cache():
+async def clear_cache(correction_service: CorrectionService = Depends(get_correction_service)):
     """Clear correction cache"""
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
         success = await correction_service.clear_cache()
         
         if success:
@@ -214,13 +523,17 @@ async def clear_cache():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/correct/batch")
-async def correct_messages_batch(requests: List[CorrectionRequest]):
-    """Batch correction endpoint for multiple messages"""
+@app.post("/api/correct/batch", response_model=List[BatchCorrectionResponse])
+async def correct_messages_batch(
+    requests: List[CorrectionRequest],
+    correction_service: CorrectionService = Depends(get_correction_service)
+):
+    """Batch correction endpoint for multiple messages.
+    
+    Each item carries its own status ("ok", "cached" or "error"), so one
+    failed message doesn't fail the batch.
+    """
     try:
-        from services.correction_service import CorrectionService
-        correction_service = CorrectionService()
-        
         batch_requests = [
             {
                 'text': req.text,
@@ -235,23 +548,89 @@ async def correct_messages_batch(requests: List[CorrectionRequest]):
         batch_results = await correction_service.correct_text_batch(batch_requests)
         
         return [
-            CorrectionResponse(
+            BatchCorrectionResponse(
                 original_text=req.text,
                 variants=[CorrectionVariant(
                     text=v.text,
                     type=v.type,
                     reason=v.reason
-                ) for v in variants]
+                ) for v in result["variants"]],
+                status=result["status"],
+                error=result["error"]
             )
-            for req, variants in zip(requests, batch_results)
+            for req, result in zip(requests, batch_results)
         ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/batch-jobs")
+async def submit_batch_job(
+    requests: List[CorrectionRequest],
+    batch_jobs: BatchJobService = Depends(get_batch_jobs)
+):
+    """Queue a large batch for background correction and return its job id"""
+    try:
+        return await batch_jobs.submit([req.model_dump() for req in requests])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch job submission error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/batch-jobs/{job_id}")
+async def get_batch_job(job_id: str, batch_jobs: BatchJobService = Depends(get_batch_jobs)):
+    """Job status and progress"""
+    try:
+        return await batch_jobs.get_job(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.on_event("startup")
-async def startup_event():
-    from database.models import create_tables
-    create_tables()
+@app.get("/api/batch-jobs/{job_id}/results")
+async def get_batch_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    batch_jobs: BatchJobService = Depends(get_batch_jobs)
+):
+    """Per-item results in submission order; can be fetched while the job is still running"""
+    try:
+        return await batch_jobs.get_results(job_id, offset=offset, limit=limit)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/batch-jobs/{job_id}/events")
+async def stream_batch_job(job_id: str, batch_jobs: BatchJobService = Depends(get_batch_jobs)):
+    """Stream job progress as NDJSON until the job completes, fails or is cancelled"""
+    try:
+        await batch_jobs.get_job(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def generate():
+        try:
+            async for job in batch_jobs.stream_progress(job_id):
+                yield json.dumps({"event": "progress", "job": job}, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Batch job stream error: {str(e)}")
+            yield json.dumps({"event": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/api/batch-jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str, batch_jobs: BatchJobService = Depends(get_batch_jobs)):
+    """Cancel a queued or running job; results already produced are kept"""
+    try:
+        return await batch_jobs.cancel(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,6 +3,7 @@ from .base_ai_service import BaseAIService
 from .openai_service import OpenAIService
 from .claude_service import ClaudeService
 from .local_llm_service import LocalLLMService
+from .mock_ai_service import MockAIService, load_mock_profiles, mock_providers_enabled
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,7 +27,14 @@ class AIModelFactory:
         """Get an AI service instance by model name"""
         if model_name not in cls._models:
             try:
-                if model_name == "openai-gpt4o":
+                if mock_providers_enabled():
+                    # Benchmarks and offline development: no API keys or Ollama needed
+                    profile = load_mock_profiles().get(model_name)
+                    if profile is None:
+                        logger.error(f"Unknown model: {model_name}")
+                        return None
+                    cls._models[model_name] = MockAIService(model_name, **profile)
+                elif model_name == "openai-gpt4o":
                     cls._models[model_name] = OpenAIService()
                 elif model_name == "claude-3-sonnet":
                     cls._models[model_name] = ClaudeService()
@@ -48,4 +56,14 @@ class AIModelFactory:
             model = cls.get_model(model_name)
             return model is not None
         except Exception:
-            return False
\ No newline at end of file
+            return False
+    
+    @classmethod
+    async def close_all(cls) -> None:
+        """Close every initialized AI service and forget the instances"""
+        for model_name, model in list(cls._models.items()):
+            try:
+                await model.close()
+            except Exception as e:
+                logger.error(f"Failed to close {model_name}: {str(e)}")
+        cls._models.clear()
@@ -1,10 +1,73 @@
+import json
 from abc import ABC, abstractmethod
-from typing import List
+from typing import AsyncIterator, List, Optional
 # from .openai_service import CorrectionVariant
 from .correction_variant import CorrectionVariant
+
+# System prompt for packed calls; the single-text SYSTEM_PROMPT asks for {"variants": [...]}
+PACKED_SYSTEM_PROMPT = """
+あなたは日本語ビジネス文書の添削専門家です。番号付きの複数の文章が与えられます。
+各文章をそれぞれ独立に、3つの方向性で添削してください：
+
+1. 丁寧な表現版: より敬語を使った丁寧な表現に変換
+2. カジュアル表現版: 親しみやすい表現に変換（ただしビジネス適切範囲内）
+3. 誤字修正+敬語版: 誤字脱字を修正し、適切な敬語表現に変換
+
+それぞれについて：
+- 修正後のテキスト
+- 修正タイプ（polite/casual/corrected）
+- 修正理由を簡潔に説明
+
+すべての文章への回答を1つのJSONにまとめ、idには文章の番号を入れてください：
+{
+  "results": [
+    {
+      "id": 1,
+      "variants": [
+        {"text": "修正後テキスト", "type": "polite", "reason": "修正理由"},
+        {"text": "修正後テキスト", "type": "casual", "reason": "修正理由"},
+        {"text": "修正後テキスト", "type": "corrected", "reason": "修正理由"}
+      ]
+    }
+  ]
+}
+"""
+
+def build_packed_prompt(texts: List[str]) -> str:
+    """User message asking for corrections of several numbered texts in one response"""
+    numbered = "\n\n".join(f"[{i}]\n{text}" for i, text in enumerate(texts, 1))
+    return (
+        f"以下の{len(texts)}件の文章をそれぞれ独立に添削してください。\n"
+        "回答は次のJSON形式にし、idには文章の番号を入れてください：\n"
+        '{"results": [{"id": 1, "variants": [{"text": "修正後テキスト", "type": "polite", "reason": "修正理由"}, ...]}, ...]}\n\n'
+        f"{numbered}"
+    )
+
+def parse_packed_results(content: str, count: int) -> List[Optional[List[CorrectionVariant]]]:
+    """Split a packed response back into per-text variants; None where a text wasn't answered"""
+    if "```" in content:
+        start = content.find("{")
+        end = content.rfind("}")
+        content = content[start:end + 1]
+    results: List[Optional[List[CorrectionVariant]]] = [None] * count
+    for result in json.loads(content).get("results", []):
+        try:
+            index = int(result["id"]) - 1
+            if 0 <= index < count and results[index] is None:
+                results[index] = [
+                    CorrectionVariant(text=v["text"], type=v["type"], reason=v["reason"])
+                    for v in result["variants"]
+                ] or None
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
 class BaseAIService(ABC):
     """Abstract base class for AI correction services"""
     
+    # Whether correct_japanese_texts can answer several texts in one call
+    supports_packing = False
+    
     @abstractmethod
     async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
         """Correct Japanese text and return correction variants"""
@@ -14,4 +77,25 @@ class BaseAIService(ABC):
     @abstractmethod
     def model_name(self) -> str:
         """Return the model name identifier"""
+        pass
+    
+    async def stream_correct_japanese_text(self, text: str) -> AsyncIterator[CorrectionVariant]:
+        """Yield correction variants as soon as each one is complete.
+        
+        Services without a streaming API fall back to yielding the full result.
+        """
+        for variant in await self.correct_japanese_text(text):
+            yield variant
+    
+    async def correct_japanese_texts(self, texts: List[str]) -> List[Optional[List[CorrectionVariant]]]:
+        """Correct several texts, with a single model call when supports_packing.
+        
+        Returns variants per text in order, or None for a text the model did
+        not answer, so the caller can retry it on its own. Services without
+        a packed prompt fall back to one call per text.
+        """
+        return [await self.correct_japanese_text(text) for text in texts]
+    
+    async def close(self) -> None:
+        """Release client resources held by the service"""
         pass
\ No newline at end of file
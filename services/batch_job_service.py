@@ -0,0 +1,415 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, or_, select, update
+from .correction_service import CorrectionService
+from .tracing import start_span
+from database.models import BatchJob, BatchJobItem, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+JOB_TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+class JobNotFoundError(LookupError):
+    """Raised when a batch job id does not exist"""
+
+class BatchJobService:
+    """Durable batch correction jobs stored in the database.
+
+    submit() only writes the job and its items; a worker loop (embedded in
+    the API process or run separately via batch_worker.py) claims queued
+    jobs and corrects their items chunk by chunk. While a job runs its
+    worker renews the heartbeat on a timer, so when a worker dies its job is
+    picked up by another worker once lease_seconds pass without a heartbeat,
+    and only the unfinished items are processed again. Results are only
+    saved while the worker still holds the lease.
+    """
+
+    def __init__(
+        self,
+        correction_service: CorrectionService,
+        chunk_size: int = 50,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 300.0,
+        max_items: int = 100000,
+        max_chunk_attempts: int = 5,
+        retry_delay: float = 5.0,
+        rate_limit_delay: float = 10.0,
+        rate_limit_timeout: float = 1800.0,
+        worker_id: Optional[str] = None
+    ):
+        self.correction_service = correction_service
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_items = max_items
+        self.max_chunk_attempts = max_chunk_attempts
+        self.retry_delay = retry_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.rate_limit_timeout = rate_limit_timeout
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.jobs_processed = 0
+        self.items_processed = 0
+
+    async def submit(self, requests: List[Dict]) -> Dict:
+        """Queue a batch and return its job id immediately"""
+        if not requests:
+            raise ValueError("Batch is empty")
+        if len(requests) > self.max_items:
+            raise ValueError(f"Batch too large: {len(requests)} items (max {self.max_items})")
+
+        job_id = uuid.uuid4().hex
+        async with SessionLocal() as db:
+            db.add(BatchJob(id=job_id, status="queued", total_items=len(requests)))
+            await db.flush()
+            await db.execute(insert(BatchJobItem), [
+                {
+                    "job_id": job_id,
+                    "position": position,
+                    "text": req.get("text", ""),
+                    "user_id": req.get("user_id") or "anonymous",
+                    "preferred_model": req.get("preferred_model"),
+                    "correction_style": req.get("correction_style") or "default"
+                }
+                for position, req in enumerate(requests)
+            ])
+            await db.commit()
+        return {"job_id": job_id, "status": "queued", "total_items": len(requests)}
+
+    async def get_job(self, job_id: str) -> Dict:
+        async with SessionLocal() as db:
+            job = await db.get(BatchJob, job_id)
+        if job is None:
+            raise JobNotFoundError(f"Job not found: {job_id}")
+        return self._job_to_dict(job)
+
+    def _job_to_dict(self, job: BatchJob) -> Dict:
+        done = job.completed_items + job.failed_items
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "total_items": job.total_items,
+            "completed_items": job.completed_items,
+            "failed_items": job.failed_items,
+            "progress": round(done / job.total_items, 4) if job.total_items else 1.0,
+            # While a job runs, error only ever holds the rate-limit note set by _set_throttled
+            "throttled": job.status == "running" and job.error is not None,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
+
+    async def get_results(self, job_id: str, offset: int = 0, limit: int = 100) -> Dict:
+        """Processed items in submission order; pending items are reported with status "pending" """
+        job = await self.get_job(job_id)
+        async with SessionLocal() as db:
+            items = (await db.scalars(
+                select(BatchJobItem)
+                .where(BatchJobItem.job_id == job_id)
+                .order_by(BatchJobItem.position)
+                .offset(offset)
+                .limit(limit)
+            )).all()
+        return {
+            "job": job,
+            "items": [
+                {
+                    "position": item.position,
+                    "original_text": item.text,
+                    "status": item.status,
+                    "variants": json.loads(item.result) if item.result else [],
+                    "error": item.error
+                }
+                for item in items
+            ]
+        }
+
+    async def cancel(self, job_id: str) -> Dict:
+        """Stop a job; items already corrected keep their results"""
+        async with SessionLocal() as db:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status.notin_(JOB_TERMINAL_STATUSES))
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            await db.commit()
+        return await self.get_job(job_id)
+
+    async def stream_progress(self, job_id: str, interval: float = 1.0) -> AsyncIterator[Dict]:
+        """Yield the job state whenever it changes, until the job finishes"""
+        last = None
+        while True:
+            job = await self.get_job(job_id)
+            state = (job["status"], job["completed_items"], job["failed_items"], job["throttled"])
+            if state != last:
+                last = state
+                yield job
+            if job["status"] in JOB_TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Run the worker loop in the background of this process"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Let the current chunk finish (up to timeout), then stop the worker loop"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # Unfinished items stay pending and are resumed once the lease expires
+            self._task.cancel()
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_forever(self) -> None:
+        logger.info(f"Batch job worker {self.worker_id} started")
+        while not self._stopping:
+            try:
+                job_id = await self._claim_job()
+                if job_id is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self._process_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Batch job worker error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+        logger.info(f"Batch job worker {self.worker_id} stopped")
+
+    async def _claim_job(self) -> Optional[str]:
+        """Take the oldest queued job, or a running one whose worker stopped heartbeating"""
+        now = datetime.utcnow()
+        claimable = or_(
+            BatchJob.status == "queued",
+            (BatchJob.status == "running") & (BatchJob.heartbeat_at < now - timedelta(seconds=self.lease_seconds))
+        )
+        async with SessionLocal() as db:
+            job_id = await db.scalar(
+                select(BatchJob.id).where(claimable).order_by(BatchJob.created_at).limit(1)
+            )
+            if job_id is None:
+                return None
+            # Conditional update so two workers can't both claim the same job
+            result = await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, claimable)
+                .values(status="running", worker_id=self.worker_id, heartbeat_at=now, started_at=func.coalesce(BatchJob.started_at, now))
+            )
+            await db.commit()
+        if result.rowcount != 1:
+            return None
+        logger.info(f"Worker {self.worker_id} claimed batch job {job_id}")
+        return job_id
+
+    async def _process_job(self, job_id: str) -> None:
+        # Renew the lease independently of chunk progress: one chunk may outlast lease_seconds
+        heartbeat = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            await self._process_chunks(job_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _keep_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with SessionLocal() as db:
+                    await db.execute(
+                        update(BatchJob)
+                        .where(BatchJob.id == job_id, BatchJob.status == "running", BatchJob.worker_id == self.worker_id)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"Batch job {job_id} heartbeat failed: {str(e)}")
+
+    async def _process_chunks(self, job_id: str) -> None:
+        attempts = 0
+        throttled_chunks = 0
+        # When items last got an answer; a job that makes none for rate_limit_timeout fails
+        last_progress = asyncio.get_running_loop().time()
+        stalled = False
+        while not self._stopping:
+            async with SessionLocal() as db:
+                job = await db.get(BatchJob, job_id)
+                if job is None or job.status != "running" or job.worker_id != self.worker_id:
+                    # Cancelled, or the lease was lost to another worker
+                    return
+                items = (await db.scalars(
+                    select(BatchJobItem)
+                    .where(BatchJobItem.job_id == job_id, BatchJobItem.status == "pending")
+                    .order_by(BatchJobItem.position)
+                    .limit(self.chunk_size)
+                )).all()
+
+            if not items:
+                await self._finish_job(job_id, "completed")
+                self.jobs_processed += 1
+                return
+
+            try:
+                with start_span("batch_job.chunk", {"batch_job.id": job_id, "batch_job.items": len(items)}):
+                    results = await self.correction_service.correct_text_batch([
+                        {
+                            "text": item.text,
+                            "user_id": item.user_id,
+                            "preferred_model": item.preferred_model,
+                            "correction_style": item.correction_style
+                        }
+                        for item in items
+                    ])
+                # Items refused by the provider limits stay pending and are tried again after a pause
+                answered = [(item, result) for item, result in zip(items, results) if not result.get("rate_limited")]
+                saved = await self._save_chunk(job_id, answered) if answered else True
+            except Exception as e:
+                # Usually transient (database, Redis); the chunk's items are still pending
+                attempts += 1
+                if attempts >= self.max_chunk_attempts:
+                    logger.error(f"Batch job {job_id} failed after {attempts} attempts: {str(e)}")
+                    await self._finish_job(job_id, "failed", str(e))
+                    return
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                logger.warning(
+                    f"Batch job {job_id} chunk failed (attempt {attempts}/{self.max_chunk_attempts}), "
+                    f"retrying in {delay:g}s: {str(e)}"
+                )
+                await self._wait(delay)
+                continue
+            if not saved:
+                async with SessionLocal() as db:
+                    status = await db.scalar(select(BatchJob.status).where(BatchJob.id == job_id))
+                if status == "cancelled":
+                    logger.info(f"Batch job {job_id} was cancelled; discarding its last chunk")
+                else:
+                    logger.warning(f"Worker {self.worker_id} lost the lease on batch job {job_id}; discarding its chunk")
+                return
+            attempts = 0
+            self.items_processed += len(answered)
+            now = asyncio.get_running_loop().time()
+            if answered:
+                last_progress = now
+                # Saving the chunk cleared the throttled note
+                stalled = False
+            if len(answered) < len(items):
+                if now - last_progress >= self.rate_limit_timeout:
+                    error = f"Rate limited for {self.rate_limit_timeout:g}s without progress"
+                    logger.error(f"Batch job {job_id} failed: {error}")
+                    await self._finish_job(job_id, "failed", error)
+                    return
+                throttled_chunks += 1
+                delay = min(self.rate_limit_delay * 2 ** (throttled_chunks - 1), self.lease_seconds)
+                logger.info(
+                    f"Batch job {job_id}: {len(items) - len(answered)} items hit the provider rate limit, "
+                    f"retrying them in {delay:g}s"
+                )
+                if not answered and not stalled:
+                    await self._set_throttled(job_id)
+                    stalled = True
+                await self._wait(delay)
+            else:
+                throttled_chunks = 0
+        # Stopping: hand the job back now instead of letting the lease run out
+        await self._release_job(job_id)
+
+    async def _wait(self, seconds: float) -> None:
+        """Sleep, but return early when the worker is asked to stop"""
+        deadline = asyncio.get_running_loop().time() + seconds
+        while not self._stopping:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, self.poll_interval))
+
+    async def _set_throttled(self, job_id: str) -> None:
+        """Show on the job that it is stalled on the provider rate limits; the next saved chunk clears it"""
+        async with SessionLocal() as db:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status == "running", BatchJob.worker_id == self.worker_id)
+                .values(error="Waiting for provider rate limits")
+            )
+            await db.commit()
+
+    async def _release_job(self, job_id: str) -> None:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status == "running", BatchJob.worker_id == self.worker_id)
+                .values(status="queued", worker_id=None, error=None)
+            )
+            await db.commit()
+        logger.info(f"Worker {self.worker_id} released batch job {job_id}")
+
+    async def _save_chunk(self, job_id: str, answered: List[Tuple[BatchJobItem, Dict]]) -> bool:
+        """Store a chunk's (item, result) pairs; False (and nothing saved) if this worker no longer holds the job"""
+        failed = sum(result["status"] == "error" for _, result in answered)
+        completed = len(answered) - failed
+        async with SessionLocal() as db:
+            # Update the job first: it only matches while the lease is ours, so a worker
+            # that lost it can't write items another worker is processing
+            owned = await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status == "running", BatchJob.worker_id == self.worker_id)
+                .values(
+                    completed_items=BatchJob.completed_items + completed,
+                    failed_items=BatchJob.failed_items + failed,
+                    heartbeat_at=datetime.utcnow(),
+                    error=None
+                )
+            )
+            if owned.rowcount != 1:
+                await db.rollback()
+                return False
+            for item, result in answered:
+                is_error = result["status"] == "error"
+                await db.execute(
+                    update(BatchJobItem)
+                    .where(BatchJobItem.id == item.id)
+                    .values(
+                        status="error" if is_error else "done",
+                        result=json.dumps(
+                            [{"text": v.text, "type": v.type, "reason": v.reason} for v in result["variants"]],
+                            ensure_ascii=False
+                        ),
+                        error=result["error"]
+                    )
+                )
+            await db.commit()
+        return True
+
+    async def _finish_job(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status == "running", BatchJob.worker_id == self.worker_id)
+                .values(status=status, error=error, finished_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    def get_stats(self) -> Dict:
+        return {
+            "worker_id": self.worker_id,
+            "running": self._task is not None and not self._task.done(),
+            "chunk_size": self.chunk_size,
+            "lease_seconds": self.lease_seconds,
+            "max_chunk_attempts": self.max_chunk_attempts,
+            "rate_limit_timeout": self.rate_limit_timeout,
+            "jobs_processed": self.jobs_processed,
+            "items_processed": self.items_processed
+        }
@@ -1,81 +1,246 @@
 import hashlib
 import json
-import redis
+import redis.asyncio as aioredis
 import asyncio
-from typing import List, Optional, Union
-from datetime import timedelta
+import time
+import uuid
+from typing import List, Optional, Sequence, Tuple
 import logging
 from .openai_service import CorrectionVariant
+from .memory_cache import MemoryCache
+from .metrics import record_cache_lookup
+from .tracing import start_span
+from .similarity_index import SimilarityIndex, canonicalize_text, substitute_differences
 
 logger = logging.getLogger(__name__)
 
+# Delete the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
 class CacheService:
-    def __init__(self, redis_url: str = "redis://localhost:6379", default_ttl: int = 3600):
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379",
+        default_ttl: int = 3600,
+        reconnect_interval: float = 30.0,
+        max_connections: int = 50,
+        socket_timeout: float = 1.0,
+        socket_connect_timeout: float = 1.0,
+        l1_max_entries: int = 1000,
+        l1_max_bytes: int = 16 * 1024 * 1024,
+        l1_ttl: float = 300.0,
+        canonicalize: bool = True,
+        similarity_index: Optional[SimilarityIndex] = None
+    ):
         self.redis_url = redis_url
         self.default_ttl = default_ttl
-        self._redis_client = None
-        self._fallback_cache = {}  # In-memory fallback when Redis is unavailable
-        
-    def _get_redis_client(self):
-        if self._redis_client is None:
+        self.reconnect_interval = reconnect_interval
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout
+        self._pool: Optional[aioredis.ConnectionPool] = None
+        self._redis_client: Optional[aioredis.Redis] = None
+        self._connect_lock = asyncio.Lock()
+        self._next_connect_attempt = 0.0
+        # L1: always consulted before Redis, and the only tier when Redis is unavailable
+        self._l1 = MemoryCache(max_entries=l1_max_entries, max_bytes=l1_max_bytes, default_ttl=l1_ttl)
+        self._l2_hits = 0
+        self._l2_misses = 0
+        # Key on canonical text so width, whitespace and final punctuation differences share an entry
+        self.canonicalize = canonicalize
+        # Optional second stage: serve near-duplicates of cached texts
+        self._similarity = similarity_index
+        self._similar_hits = 0
+        self._similar_rejected = 0
+
+    async def _get_redis_client(self) -> Optional[aioredis.Redis]:
+        if self._redis_client is not None or time.monotonic() < self._next_connect_attempt:
+            return self._redis_client
+
+        async with self._connect_lock:
+            # Another coroutine may have connected while we were waiting
+            if self._redis_client is not None or time.monotonic() < self._next_connect_attempt:
+                return self._redis_client
+
+            pool = aioredis.ConnectionPool.from_url(
+                self.redis_url,
+                decode_responses=True,
+                max_connections=self.max_connections,
+                socket_timeout=self.socket_timeout,
+                socket_connect_timeout=self.socket_connect_timeout
+            )
+            client = aioredis.Redis(connection_pool=pool)
             try:
-                self._redis_client = redis.Redis.from_url(self.redis_url, decode_responses=True)
                 # Test connection
-                self._redis_client.ping()
+                await client.ping()
+                self._pool = pool
+                self._redis_client = client
             except Exception as e:
                 logger.warning(f"Redis connection failed: {str(e)}. Using in-memory cache.")
-                self._redis_client = None
+                await pool.disconnect()
+                # Don't pay a connect attempt on every request while Redis is down
+                self._next_connect_attempt = time.monotonic() + self.reconnect_interval
         return self._redis_client
-    
+
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        if self._redis_client is not None:
+            try:
+                await self._redis_client.aclose()
+                await self._pool.disconnect()
+            except Exception as e:
+                logger.error(f"Redis close error: {str(e)}")
+            self._redis_client = None
+            self._pool = None
+
     def _generate_cache_key(self, text: str, model_name: str, correction_style: str = "default") -> str:
         """Generate a unique cache key for the correction request"""
+        if self.canonicalize:
+            # "v2": keys from before ? and ! were kept could mix questions with statements
+            text = f"v2|{canonicalize_text(text)}"
         content = f"{text}|{model_name}|{correction_style}"
         return f"correction:{hashlib.sha256(content.encode()).hexdigest()[:16]}"
-    
+
+    def _serialize_variants(self, variants: List[CorrectionVariant]) -> List[dict]:
+        return [
+            {"text": v.text, "type": v.type, "reason": v.reason}
+            for v in variants
+        ]
+
+    def _deserialize_variants(self, variants_data: List[dict]) -> List[CorrectionVariant]:
+        return [
+            CorrectionVariant(
+                text=v['text'],
+                type=v.get('type', 'correction'),
+                reason=v['reason']
+            )
+            for v in variants_data
+        ]
+
     async def get_cached_correction(
-        self, 
-        text: str, 
-        model_name: str, 
+        self,
+        text: str,
+        model_name: str,
         correction_style: str = "default"
     ) -> Optional[List[CorrectionVariant]]:
-        """Get cached correction variants"""
+        """Get cached correction variants, falling back to a near-duplicate when enabled"""
         cache_key = self._generate_cache_key(text, model_name, correction_style)
-        
+
         try:
-            redis_client = self._get_redis_client()
-            if redis_client:
-                cached_data = await asyncio.to_thread(redis_client.get, cache_key)
-                if cached_data:
-                    variants_data = json.loads(cached_data)
-                    return [
-                        CorrectionVariant(
-                            text=v['text'], 
-                            type=v.get('type', 'correction'), 
-                            reason=v['reason']
-                        )
-                        for v in variants_data
-                    ]
-            else:
-                # Use fallback in-memory cache
-                if cache_key in self._fallback_cache:
-                    variants_data = self._fallback_cache[cache_key]
-                    return [
-                        CorrectionVariant(
-                            text=v['text'], 
-                            type=v.get('type', 'correction'), 
-                            reason=v['reason']
-                        )
-                        for v in variants_data
-                    ]
+            cached_data = await self._get_payload(cache_key)
+            if cached_data:
+                return self._deserialize_variants(json.loads(cached_data))
+            return await self._get_similar_correction(text, model_name, correction_style)
         except Exception as e:
             logger.error(f"Cache retrieval error: {str(e)}")
-        
+
         return None
-    
+
+    async def _get_payload(self, cache_key: str) -> Optional[str]:
+        cached_data = self._l1.get(cache_key)
+        record_cache_lookup("l1", cached_data is not None)
+        if cached_data is None:
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                with start_span("cache.redis.get"):
+                    cached_data = await redis_client.get(cache_key)
+                self._record_l2_lookup(cached_data is not None)
+                if cached_data:
+                    # Read-through: keep hot entries off the network
+                    self._l1.set(cache_key, cached_data)
+        return cached_data
+
+    def _similarity_namespace(self, model_name: str, correction_style: str) -> str:
+        return f"{model_name}|{correction_style}"
+
+    async def _get_similar_correction(
+        self,
+        text: str,
+        model_name: str,
+        correction_style: str
+    ) -> Optional[List[CorrectionVariant]]:
+        """Reuse a cached near-duplicate, carrying the differing spans over into its variants"""
+        if self._similarity is None:
+            return None
+        match = self._similarity.query(self._similarity_namespace(model_name, correction_style), text)
+        if match is None:
+            record_cache_lookup("similar", False)
+            return None
+
+        cache_key, neighbour_text, _ = match
+        cached_data = await self._get_payload(cache_key)
+        if not cached_data:
+            # The neighbour's entry expired
+            self._similarity.discard(cache_key)
+            return None
+
+        variants = self._deserialize_variants(json.loads(cached_data))
+        adapted_texts = substitute_differences(
+            canonicalize_text(neighbour_text),
+            canonicalize_text(text),
+            [v.text for v in variants]
+        )
+        if adapted_texts is None:
+            self._similar_rejected += 1
+            record_cache_lookup("similar", False)
+            return None
+        self._similar_hits += 1
+        record_cache_lookup("similar", True)
+        return [
+            CorrectionVariant(text=adapted_text, type=v.type, reason=v.reason)
+            for adapted_text, v in zip(adapted_texts, variants)
+        ]
+
+    async def get_cached_corrections(
+        self,
+        requests: Sequence[Tuple[str, str, str]]
+    ) -> List[Optional[List[CorrectionVariant]]]:
+        """Get cached variants for many (text, model_name, correction_style) requests in one round trip"""
+        if not requests:
+            return []
+
+        cache_keys = [self._generate_cache_key(text, model, style) for text, model, style in requests]
+        results: List[Optional[List[CorrectionVariant]]] = [None] * len(cache_keys)
+
+        try:
+            missing = []
+            for i, cache_key in enumerate(cache_keys):
+                cached_data = self._l1.get(cache_key)
+                record_cache_lookup("l1", cached_data is not None)
+                if cached_data is not None:
+                    results[i] = self._deserialize_variants(json.loads(cached_data))
+                else:
+                    missing.append(i)
+
+            redis_client = await self._get_redis_client() if missing else None
+            if redis_client:
+                with start_span("cache.redis.mget", {"cache.keys": len(missing)}):
+                    cached_values = await redis_client.mget([cache_keys[i] for i in missing])
+                for i, cached_data in zip(missing, cached_values):
+                    self._record_l2_lookup(cached_data is not None)
+                    if cached_data:
+                        self._l1.set(cache_keys[i], cached_data)
+                        results[i] = self._deserialize_variants(json.loads(cached_data))
+
+            if self._similarity is not None:
+                for i in missing:
+                    if results[i] is None:
+                        text, model_name, correction_style = requests[i]
+                        results[i] = await self._get_similar_correction(text, model_name, correction_style)
+        except Exception as e:
+            logger.error(f"Bulk cache retrieval error: {str(e)}")
+
+        return results
+
     async def cache_correction(
-        self, 
-        text: str, 
-        model_name: str, 
+        self,
+        text: str,
+        model_name: str,
         variants: List[CorrectionVariant],
         correction_style: str = "default",
         ttl: Optional[int] = None
@@ -83,70 +248,237 @@ class CacheService:
         """Cache correction variants"""
         cache_key = self._generate_cache_key(text, model_name, correction_style)
         ttl = ttl or self.default_ttl
-        
-        variants_data = [
-            {"text": v.text, "type": v.type, "reason": v.reason}
-            for v in variants
-        ]
-        
+
+        payload = json.dumps(self._serialize_variants(variants), ensure_ascii=False)
+
         try:
-            redis_client = self._get_redis_client()
+            # Write-through: L1 first so this process sees the entry immediately
+            self._l1.set(cache_key, payload, ttl=min(ttl, self._l1.default_ttl))
+            if self._similarity is not None:
+                self._similarity.add(self._similarity_namespace(model_name, correction_style), text, cache_key)
+            redis_client = await self._get_redis_client()
             if redis_client:
-                await asyncio.to_thread(
-                    redis_client.setex,
-                    cache_key,
-                    ttl,
-                    json.dumps(variants_data, ensure_ascii=False)
-                )
-                return True
-            else:
-                # Use fallback in-memory cache with simple cleanup
-                self._fallback_cache[cache_key] = variants_data
-                # Keep only the last 100 entries to prevent memory bloat
-                if len(self._fallback_cache) > 100:
-                    oldest_key = next(iter(self._fallback_cache))
-                    del self._fallback_cache[oldest_key]
-                return True
+                with start_span("cache.redis.setex"):
+                    await redis_client.setex(cache_key, ttl, payload)
+            return True
         except Exception as e:
             logger.error(f"Cache storage error: {str(e)}")
             return False
-    
-    async def invalidate_cache(self, pattern: str = "correction:*") -> bool:
-        """Invalidate cached corrections by pattern"""
+
+    async def cache_corrections(
+        self,
+        entries: Sequence[Tuple[str, str, List[CorrectionVariant], str]],
+        ttl: Optional[int] = None
+    ) -> bool:
+        """Cache many (text, model_name, variants, correction_style) entries in one pipelined round trip"""
+        if not entries:
+            return True
+
+        ttl = ttl or self.default_ttl
+
+        try:
+            payloads = []
+            for text, model_name, variants, correction_style in entries:
+                cache_key = self._generate_cache_key(text, model_name, correction_style)
+                payload = json.dumps(self._serialize_variants(variants), ensure_ascii=False)
+                self._l1.set(cache_key, payload, ttl=min(ttl, self._l1.default_ttl))
+                if self._similarity is not None:
+                    self._similarity.add(self._similarity_namespace(model_name, correction_style), text, cache_key)
+                payloads.append((cache_key, payload))
+
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                with start_span("cache.redis.setex_many", {"cache.keys": len(payloads)}):
+                    async with redis_client.pipeline(transaction=False) as pipe:
+                        for cache_key, payload in payloads:
+                            pipe.setex(cache_key, ttl, payload)
+                        await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Bulk cache storage error: {str(e)}")
+            return False
+
+    async def try_lock(self, name: str, ttl: float = 30.0) -> Tuple[bool, Optional[str]]:
+        """Try to take a cross-process lock in Redis.
+
+        Returns (acquired, token). Without Redis there is nothing to coordinate
+        with, so the lock is always granted with a None token.
+        """
+        try:
+            redis_client = await self._get_redis_client()
+            if not redis_client:
+                return True, None
+            token = uuid.uuid4().hex
+            acquired = await redis_client.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000))
+            return bool(acquired), token if acquired else None
+        except Exception as e:
+            logger.error(f"Cache lock error: {str(e)}")
+            return True, None
+
+    async def release_lock(self, name: str, token: Optional[str]) -> None:
+        """Release a lock taken with try_lock"""
+        if token is None:
+            return
         try:
-            redis_client = self._get_redis_client()
+            redis_client = await self._get_redis_client()
             if redis_client:
-                keys = await asyncio.to_thread(redis_client.keys, pattern)
-                if keys:
-                    await asyncio.to_thread(redis_client.delete, *keys)
+                await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+        except Exception as e:
+            logger.error(f"Cache unlock error: {str(e)}")
+
+    async def wait_for_correction(
+        self,
+        text: str,
+        model_name: str,
+        correction_style: str = "default",
+        timeout: float = 30.0,
+        poll_interval: float = 0.1
+    ) -> Optional[List[CorrectionVariant]]:
+        """Wait for another process to cache a correction, polling Redis directly"""
+        cache_key = self._generate_cache_key(text, model_name, correction_style)
+        deadline = time.monotonic() + timeout
+
+        try:
+            while time.monotonic() < deadline:
+                redis_client = await self._get_redis_client()
+                if not redis_client:
+                    return None
+                cached_data = await redis_client.get(cache_key)
+                if cached_data:
+                    self._l1.set(cache_key, cached_data)
+                    return self._deserialize_variants(json.loads(cached_data))
+                # Stop waiting once the owner has released the lock
+                if not await redis_client.exists(f"lock:{cache_key}"):
+                    cached_data = await redis_client.get(cache_key)
+                    if cached_data:
+                        self._l1.set(cache_key, cached_data)
+                        return self._deserialize_variants(json.loads(cached_data))
+                    return None
+                await asyncio.sleep(poll_interval)
+        except Exception as e:
+            logger.error(f"Cache wait error: {str(e)}")
+
+        return None
+
+    def _record_l2_lookup(self, hit: bool):
+        record_cache_lookup("l2", hit)
+        if hit:
+            self._l2_hits += 1
+        else:
+            self._l2_misses += 1
+
+    def _l2_stats(self) -> dict:
+        lookups = self._l2_hits + self._l2_misses
+        return {
+            "hits": self._l2_hits,
+            "misses": self._l2_misses,
+            "hit_ratio": round(self._l2_hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _similarity_stats(self) -> dict:
+        if self._similarity is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            **self._similarity.get_stats(),
+            "hits": self._similar_hits,
+            "rejected": self._similar_rejected
+        }
+
+    async def run_script(self, script: str, keys: List[str], args: List) -> Optional[str]:
+        """Run a Lua script in Redis; None when Redis is unavailable"""
+        try:
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                return await redis_client.eval(script, len(keys), *keys, *args)
+        except Exception as e:
+            logger.error(f"Cache script error: {str(e)}")
+        return None
+
+    async def get_value(self, key: str) -> Optional[str]:
+        """Read a raw value from Redis, bypassing the correction tiers"""
+        try:
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                return await redis_client.get(key)
+        except Exception as e:
+            logger.error(f"Cache retrieval error: {str(e)}")
+        return None
+
+    async def set_value(self, key: str, value: str, ttl: Optional[int] = None) -> bool:
+        """Write a raw value to Redis, bypassing the correction tiers"""
+        try:
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                await redis_client.setex(key, ttl or self.default_ttl, value)
                 return True
-            else:
-                # Clear fallback cache
-                self._fallback_cache.clear()
+        except Exception as e:
+            logger.error(f"Cache storage error: {str(e)}")
+        return False
+
+    async def delete_value(self, key: str) -> bool:
+        """Delete a raw value from Redis"""
+        try:
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                await redis_client.delete(key)
                 return True
+        except Exception as e:
+            logger.error(f"Cache invalidation error: {str(e)}")
+        return False
+
+    async def invalidate_cache(self, pattern: str = "correction:*") -> bool:
+        """Invalidate cached corrections by pattern"""
+        try:
+            self._l1.clear()
+            if self._similarity is not None:
+                self._similarity.clear()
+            redis_client = await self._get_redis_client()
+            if redis_client:
+                # SCAN instead of KEYS so large keyspaces don't block Redis
+                batch = []
+                async for key in redis_client.scan_iter(match=pattern, count=500):
+                    batch.append(key)
+                    if len(batch) >= 500:
+                        await redis_client.delete(*batch)
+                        batch = []
+                if batch:
+                    await redis_client.delete(*batch)
+            return True
         except Exception as e:
             logger.error(f"Cache invalidation error: {str(e)}")
             return False
-    
+
     async def get_cache_stats(self) -> dict:
         """Get cache statistics"""
         try:
-            redis_client = self._get_redis_client()
+            redis_client = await self._get_redis_client()
             if redis_client:
-                info = await asyncio.to_thread(redis_client.info, "memory")
-                keys_count = await asyncio.to_thread(redis_client.dbsize)
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.info("memory")
+                    pipe.dbsize()
+                    info, keys_count = await pipe.execute()
                 return {
                     "type": "redis",
                     "keys_count": keys_count,
                     "memory_usage": info.get("used_memory_human", "unknown"),
-                    "connected": True
+                    "connected": True,
+                    "pool_max_connections": self.max_connections,
+                    "l1": self._l1.get_stats(),
+                    "l2": self._l2_stats(),
+                    "canonicalize": self.canonicalize,
+                    "similarity": self._similarity_stats()
                 }
             else:
                 return {
                     "type": "in_memory",
-                    "keys_count": len(self._fallback_cache),
+                    "keys_count": len(self._l1),
                     "memory_usage": "unknown",
-                    "connected": False
+                    "connected": False,
+                    "l1": self._l1.get_stats(),
+                    "l2": self._l2_stats(),
+                    "canonicalize": self.canonicalize,
+                    "similarity": self._similarity_stats()
                 }
         except Exception as e:
             logger.error(f"Cache stats error: {str(e)}")
@@ -156,4 +488,4 @@ class CacheService:
                 "memory_usage": "unknown",
                 "connected": False,
                 "error": str(e)
-            }
\ No newline at end of file
+            }
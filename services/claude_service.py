@@ -1,24 +1,17 @@
 import os
 import asyncio
-from typing import List
+from typing import AsyncIterator, List, Optional
 import logging
 from anthropic import AsyncAnthropic
 from .openai_service import CorrectionVariant
-from .base_ai_service import BaseAIService
+from .base_ai_service import PACKED_SYSTEM_PROMPT, BaseAIService, build_packed_prompt, parse_packed_results
+from .variant_stream_parser import VariantStreamParser
+from .metrics import observe_stage, record_token_usage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class ClaudeService(BaseAIService):
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-        
-        self.client = AsyncAnthropic(api_key=api_key)
-    
-    async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
-        system_prompt = """
+SYSTEM_PROMPT = """
 あなたは日本語ビジネス文書の添削専門家です。以下の文章を3つの方向性で添削してください：
 
 1. 丁寧な表現版: より敬語を使った丁寧な表現に変換
@@ -39,13 +32,24 @@ JSON形式で回答してください：
   ]
 }
 """
+
+class ClaudeService(BaseAIService):
+    supports_packing = True
+    
+    def __init__(self):
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
         
+        self.client = AsyncAnthropic(api_key=api_key)
+    
+    async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
         try:
             response = await self.client.messages.create(
                 model="claude-3-sonnet-20240229",
                 max_tokens=4000,
                 temperature=0.3,
-                system=system_prompt,
+                system=SYSTEM_PROMPT,
                 messages=[
                     {"role": "user", "content": f"以下の文章を添削してください：\n{text}"}
                 ]
@@ -53,27 +57,29 @@ JSON形式で回答してください：
             
             content = response.content[0].text
             logger.info(f"Claude response: {content}")
+            record_token_usage(self.model_name, response.usage.input_tokens, response.usage.output_tokens)
             
             import json
-            # Extract JSON from response if it's wrapped in markdown code blocks
-            if "```json" in content:
-                start = content.find("```json") + 7
-                end = content.find("```", start)
-                content = content[start:end].strip()
-            elif "```" in content:
-                start = content.find("```") + 3
-                end = content.rfind("```")
-                content = content[start:end].strip()
-            
-            result = json.loads(content)
-            
-            variants = []
-            for variant_data in result["variants"]:
-                variants.append(CorrectionVariant(
-                    text=variant_data["text"],
-                    type=variant_data["type"],
-                    reason=variant_data["reason"]
-                ))
+            with observe_stage("parse", self.model_name):
+                # Extract JSON from response if it's wrapped in markdown code blocks
+                if "```json" in content:
+                    start = content.find("```json") + 7
+                    end = content.find("```", start)
+                    content = content[start:end].strip()
+                elif "```" in content:
+                    start = content.find("```") + 3
+                    end = content.rfind("```")
+                    content = content[start:end].strip()
+                
+                result = json.loads(content)
+                
+                variants = []
+                for variant_data in result["variants"]:
+                    variants.append(CorrectionVariant(
+                        text=variant_data["text"],
+                        type=variant_data["type"],
+                        reason=variant_data["reason"]
+                    ))
             
             return variants
             
@@ -87,6 +93,46 @@ JSON形式で回答してください：
                 )
             ]
     
+    async def correct_japanese_texts(self, texts: List[str]) -> List[Optional[List[CorrectionVariant]]]:
+        response = await self.client.messages.create(
+            model="claude-3-sonnet-20240229",
+            max_tokens=4000,
+            temperature=0.3,
+            system=PACKED_SYSTEM_PROMPT,
+            messages=[
+                {"role": "user", "content": build_packed_prompt(texts)}
+            ]
+        )
+        record_token_usage(self.model_name, response.usage.input_tokens, response.usage.output_tokens)
+        with observe_stage("parse", self.model_name):
+            return parse_packed_results(response.content[0].text, len(texts))
+    
+    async def stream_correct_japanese_text(self, text: str) -> AsyncIterator[CorrectionVariant]:
+        # The parser skips any markdown fence before the "variants" key
+        parser = VariantStreamParser()
+        async with self.client.messages.stream(
+            model="claude-3-sonnet-20240229",
+            max_tokens=4000,
+            temperature=0.3,
+            system=SYSTEM_PROMPT,
+            messages=[
+                {"role": "user", "content": f"以下の文章を添削してください：\n{text}"}
+            ]
+        ) as stream:
+            async for delta in stream.text_stream:
+                for variant_data in parser.feed(delta):
+                    yield CorrectionVariant(
+                        text=variant_data["text"],
+                        type=variant_data["type"],
+                        reason=variant_data["reason"]
+                    )
+            usage = (await stream.get_final_message()).usage
+            record_token_usage(self.model_name, usage.input_tokens, usage.output_tokens)
+    
     @property
     def model_name(self) -> str:
-        return "claude-3-sonnet"
\ No newline at end of file
+        return "claude-3-sonnet"
+    
+    async def close(self) -> None:
+        """Close the underlying HTTP client"""
+        await self.client.close()
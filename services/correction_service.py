@@ -1,22 +1,59 @@
-from typing import List, Optional, Dict
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Dict, Tuple
 from .correction_variant import CorrectionVariant
 from .ai_model_factory import AIModelFactory
 from .cache_service import CacheService
-from .error_handler import error_handler
-from database.models import CorrectionHistory, UserSettings, get_db
-from sqlalchemy.orm import Session
+from .single_flight import SingleFlight
+from .local_llm_service import LocalLLMService
+from .error_handler import AIServiceError, CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, RateLimitedVariants, error_handler, raise_for_error_variants
+from .model_router import ModelRouter
+from .rate_limiter import ProviderLimiters, RateLimitExceeded
+from .history_writer import HistoryWriter
+from .metrics import CORRECTION_SECONDS, PROVIDER_CALLS, observe_stage, observe_stage_seconds, style_label
+from .request_timing import current_timing
+from .tracing import set_span_attributes, start_span
+from .user_settings_cache import UserSettingsCache
+from database.models import UserSettings, SessionLocal
 import logging
 import time
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+def _is_usable(variants: List[CorrectionVariant]) -> bool:
+    """A packed item was answered when it has at least one non-error variant"""
+    return bool(variants) and not all(v.type == "error" for v in variants)
+
 class CorrectionService:
-    def __init__(self):
-        self.ai_factory = AIModelFactory()
-        self.cache_service = CacheService()
-        self.batch_requests = []
-        self.batch_timeout = 0.5  # 500ms batch window
+    def __init__(
+        self,
+        ai_factory: Optional[AIModelFactory] = None,
+        cache_service: Optional[CacheService] = None,
+        history_writer: Optional[HistoryWriter] = None,
+        settings_cache: Optional[UserSettingsCache] = None,
+        distributed_single_flight: bool = False,
+        single_flight_lock_ttl: float = 30.0,
+        router: Optional[ModelRouter] = None,
+        limiters: Optional[ProviderLimiters] = None,
+        batch_concurrency: int = 8,
+        batch_max_items: int = 1000,
+        batch_pack_size: int = 4,
+        batch_pack_max_chars: int = 150
+    ):
+        self.ai_factory = ai_factory or AIModelFactory()
+        self.cache_service = cache_service or CacheService()
+        self.history_writer = history_writer or HistoryWriter()
+        self.settings_cache = settings_cache or UserSettingsCache()
+        self.router = router or ModelRouter()
+        self.limiters = limiters or ProviderLimiters()
+        self._single_flight = SingleFlight()
+        # Also coordinate duplicate requests across worker processes via a Redis lock
+        self.distributed_single_flight = distributed_single_flight
+        self.single_flight_lock_ttl = single_flight_lock_ttl
+        self.batch_concurrency = batch_concurrency
+        self.batch_max_items = batch_max_items
+        # Short texts are packed this many to a prompt when the provider supports it (1 disables)
+        self.batch_pack_size = batch_pack_size
+        self.batch_pack_max_chars = batch_pack_max_chars
     
     async def correct_text(
         self, 
@@ -25,6 +62,17 @@ class CorrectionService:
         preferred_model: Optional[str] = None,
         correction_style: str = "default",
         use_cache: bool = True
+    ) -> List[CorrectionVariant]:
+        with start_span("correction", {"correction.style": correction_style, "correction.text_length": len(text)}):
+            return await self._correct_text(text, user_id, preferred_model, correction_style, use_cache)
+    
+    async def _correct_text(
+        self,
+        text: str,
+        user_id: str,
+        preferred_model: Optional[str],
+        correction_style: str,
+        use_cache: bool
     ) -> List[CorrectionVariant]:
         if not text.strip():
             return [CorrectionVariant(
@@ -33,99 +81,373 @@ class CorrectionService:
                 reason="空のテキストは添削できません"
             )]
         
+        start_time = time.perf_counter()
+        
         # Get user's preferred model or use default
-        model_name = preferred_model or self._get_user_preferred_model(user_id)
+        model_name = preferred_model or await self._get_user_preferred_model(user_id)
         
         # Check cache first
         if use_cache:
-            cached_variants = await self.cache_service.get_cached_correction(text, model_name, correction_style)
+            with observe_stage("cache_lookup", model_name):
+                cached_variants = await self.cache_service.get_cached_correction(text, model_name, correction_style)
             if cached_variants:
                 logger.info(f"Cache hit for text: {text[:50]}...")
+                self._record_outcome(model_name, correction_style, "cache", start_time)
                 return cached_variants
         
-        # Get AI service instance with fallback logic
+        # Concurrent identical requests share a single upstream call
+        cache_key = self.cache_service._generate_cache_key(text, model_name, correction_style)
+        variants, history_model, processing_time = await self._single_flight.do(
+            cache_key,
+            self._generate_correction,
+            text,
+            model_name,
+            correction_style,
+            use_cache
+        )
+        
+        # Queue history rows for the background bulk writer
+        if history_model:
+            with observe_stage("history_enqueue", history_model):
+                self.history_writer.enqueue(
+                    text, variants, user_id, history_model, correction_style, processing_time
+                )
+        
+        timing = current_timing()
+        if all(v.type == "error" for v in variants):
+            source = "error"
+        elif history_model:
+            source = "provider"
+        elif timing is not None and timing.fallback_from:
+            source = "fallback"
+        else:
+            # Another caller's (or worker's) result
+            source = "shared"
+        self._record_outcome(history_model or model_name, correction_style, source, start_time)
+        
+        # Hand each caller its own copies of the shared result
+        return [variant.model_copy() for variant in variants]
+    
+    def _record_outcome(self, model_name: str, correction_style: str, source: str, start_time: float) -> None:
+        """Observe end-to-end latency and note where the answer came from in the request timing"""
+        CORRECTION_SECONDS.labels(
+            model=model_name, style=style_label(correction_style), source=source
+        ).observe(time.perf_counter() - start_time)
+        set_span_attributes({"correction.model": model_name, "correction.source": source})
+        timing = current_timing()
+        if timing is not None:
+            timing.source = source
+            # A fallback already recorded the model that answered
+            if timing.model is None:
+                timing.model = model_name
+    
+    async def _generate_correction(
+        self,
+        text: str,
+        model_name: str,
+        correction_style: str,
+        use_cache: bool
+    ) -> Tuple[List[CorrectionVariant], Optional[str], Optional[float]]:
+        """Call the AI service for a cache miss.
+        
+        Returns the variants, the model to record in history (None when the
+        result should not be saved: fallback or another worker's result) and
+        the provider processing time in seconds.
+        """
+        cache_key = self.cache_service._generate_cache_key(text, model_name, correction_style)
+        lock_token = None
+        if use_cache and self.distributed_single_flight:
+            acquired, lock_token = await self.cache_service.try_lock(cache_key, ttl=self.single_flight_lock_ttl)
+            if not acquired:
+                # Another worker is already calling the LLM for this text
+                cached_variants = await self.cache_service.wait_for_correction(
+                    text, model_name, correction_style, timeout=self.single_flight_lock_ttl
+                )
+                if cached_variants:
+                    return cached_variants, None, None
+        
+        try:
+            # Get AI service instance with fallback logic
+            ai_service, actual_model = await self._get_ai_service_with_fallback(model_name)
+            if not ai_service:
+                return [CorrectionVariant(
+                    text=text,
+                    type="error",
+                    reason="利用可能なAIモデルがありません"
+                )], None, None
+            
+            # Record start time for performance monitoring
+            start_time = time.time()
+            
+            try:
+                if self.router.hedge:
+                    # A slow primary is raced against a second model instead of retried
+                    variants, actual_model = await self._call_with_hedge(ai_service, actual_model, text)
+                else:
+                    # Use error handler with retry logic; a half-open probe gets a single attempt
+                    is_probe = error_handler.get_circuit_state(actual_model) == CIRCUIT_HALF_OPEN
+                    variants = await error_handler.retry_with_backoff(
+                        self._call_ai_service,
+                        ai_service,
+                        actual_model,
+                        text,
+                        max_retries=0 if is_probe else 2
+                    )
+                error_handler.record_success(actual_model)
+                processing_time = time.time() - start_time
+                
+                # Cache under the requested model, which is what lookups use
+                if use_cache and variants:
+                    await self.cache_service.cache_correction(text, model_name, variants, correction_style)
+                
+                return variants, actual_model, processing_time
+                
+            except Exception as e:
+                logger.error(f"Correction error: {str(e)}")
+                # Use error handler for comprehensive fallback
+                fallback_models = [m for m in self.router.rank(model_name) if m != actual_model]
+                
+                return await error_handler.handle_ai_service_error(
+                    actual_model, 
+                    e, 
+                    text, 
+                    fallback_models,
+                    call=self._call_ai_service
+                ), None, None
+        finally:
+            await self.cache_service.release_lock(cache_key, lock_token)
+    
+    async def _call_ai_service(self, ai_service, model_name: str, text: str) -> List[CorrectionVariant]:
+        async def call():
+            # Providers report failures as error variants; raise so retries and the breaker see them
+            return raise_for_error_variants(await ai_service.correct_japanese_text(text))
+        return await self._instrumented_call(model_name, text, call)
+    
+    async def _instrumented_call(self, model_name: str, text: str, call: Callable[[], Awaitable[Any]], attributes: Optional[dict] = None) -> Any:
+        """Run one provider call under its limiter, with the span, routing samples and call metrics every call gets"""
+        with start_span("llm.call", {"llm.model": model_name, **(attributes or {})}):
+            # Queue for the provider's budget first; the wait is not part of its latency
+            queued_at = time.perf_counter()
+            async with self.limiters.acquire(model_name, text):
+                start_time = time.perf_counter()
+                observe_stage_seconds("queue_wait", model_name, start_time - queued_at)
+                try:
+                    result = await call()
+                except asyncio.CancelledError:
+                    # A cancelled hedge loser took at least this long; keep that in its latency profile
+                    self.router.record(model_name, time.perf_counter() - start_time, ok=True)
+                    PROVIDER_CALLS.labels(model=model_name, outcome="cancelled").inc()
+                    raise
+                except Exception:
+                    latency = time.perf_counter() - start_time
+                    self.router.record(model_name, latency, ok=False)
+                    observe_stage_seconds("provider_call", model_name, latency)
+                    PROVIDER_CALLS.labels(model=model_name, outcome="error").inc()
+                    raise
+                latency = time.perf_counter() - start_time
+                self.router.record(model_name, latency, ok=True)
+                observe_stage_seconds("provider_call", model_name, latency)
+                PROVIDER_CALLS.labels(model=model_name, outcome="ok").inc()
+                return result
+    
+    def _get_hedge_target(self, primary_model: str) -> tuple:
+        """The best healthy model other than the primary, without spending a half-open probe on it"""
+        for candidate in self.router.rank(primary_model):
+            if candidate == primary_model:
+                continue
+            if error_handler.get_circuit_state(candidate) != CIRCUIT_CLOSED or not self.router.is_healthy(candidate):
+                continue
+            ai_service = self.ai_factory.get_model(candidate)
+            if ai_service:
+                return ai_service, candidate
+        return None, None
+    
+    async def _call_with_hedge(self, ai_service, model_name: str, text: str) -> Tuple[List[CorrectionVariant], str]:
+        """Call model_name, and if it hasn't answered by its latency percentile also call a second model.
+        
+        The first successful answer wins and the other call is cancelled.
+        Returns the variants and the model that produced them; raises the
+        primary's error if every call failed.
+        """
+        hedge_service, hedge_model = self._get_hedge_target(model_name)
+        if hedge_service is None:
+            return await self._call_ai_service(ai_service, model_name, text), model_name
+        
+        primary = asyncio.create_task(self._call_ai_service(ai_service, model_name, text))
+        tasks = {primary: model_name}
+        try:
+            await asyncio.wait({primary}, timeout=self.router.hedge_delay(model_name))
+            if not primary.done():
+                logger.info(f"{model_name} slower than its p{self.router.hedge_percentile:g}, hedging to {hedge_model}")
+                tasks[asyncio.create_task(self._call_ai_service(hedge_service, hedge_model, text))] = hedge_model
+            
+            primary_error = None
+            hedge_error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            self.router.record_hedge(won=task is not primary)
+                        if primary_error is not None:
+                            self._record_call_error(model_name, primary_error)
+                        return task.result(), tasks[task]
+                    if task is primary:
+                        primary_error = task.exception()
+                    else:
+                        hedge_error = task.exception()
+                        self._record_call_error(hedge_model, hedge_error)
+            
+            if len(tasks) > 1:
+                self.router.record_hedge(won=False)
+            raise primary_error or hedge_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _record_call_error(self, model_name: str, error: Exception):
+        """Count a failed call against the model's circuit, unless our own limiter refused it"""
+        if isinstance(error, RateLimitExceeded):
+            error_handler.release_probe(model_name)
+        else:
+            error_handler.record_failure(model_name, error)
+    
+    async def correct_text_stream(
+        self,
+        text: str,
+        user_id: str = "anonymous",
+        preferred_model: Optional[str] = None,
+        correction_style: str = "default",
+        use_cache: bool = True
+    ) -> AsyncIterator[CorrectionVariant]:
+        """Yield correction variants as soon as the AI service completes each one"""
+        if not text.strip():
+            yield CorrectionVariant(
+                text=text,
+                type="error",
+                reason="空のテキストは添削できません"
+            )
+            return
+        
+        request_start = time.perf_counter()
+        model_name = preferred_model or await self._get_user_preferred_model(user_id)
+        
+        if use_cache:
+            with observe_stage("cache_lookup", model_name):
+                cached_variants = await self.cache_service.get_cached_correction(text, model_name, correction_style)
+            if cached_variants:
+                logger.info(f"Cache hit for text: {text[:50]}...")
+                self._record_outcome(model_name, correction_style, "cache", request_start)
+                for variant in cached_variants:
+                    yield variant
+                return
+        
         ai_service, actual_model = await self._get_ai_service_with_fallback(model_name)
         if not ai_service:
-            return [CorrectionVariant(
+            yield CorrectionVariant(
                 text=text,
                 type="error",
                 reason="利用可能なAIモデルがありません"
-            )]
+            )
+            return
         
-        # Record start time for performance monitoring
+        variants = []
         start_time = time.time()
-        
         try:
-            # Use error handler with retry logic
-            variants = await error_handler.retry_with_backoff(
-                ai_service.correct_japanese_text,
-                text,
-                max_retries=2
-            )
-            
-            # Add performance info to variants
-            processing_time = time.time() - start_time
-            for variant in variants:
-                variant.reason += f" (処理時間: {processing_time:.2f}秒)"
-            
-            # Cache the results
-            if use_cache and variants:
-                await self.cache_service.cache_correction(text, actual_model, variants, correction_style)
-            
-            # Save to history asynchronously
-            asyncio.create_task(self._save_correction_history_async(text, variants, user_id, actual_model))
-            
-            return variants
-            
+            async with self.limiters.acquire(actual_model, text):
+                with observe_stage("provider_call", actual_model):
+                    async for variant in ai_service.stream_correct_japanese_text(text):
+                        variants.append(variant)
+                        yield variant
         except Exception as e:
-            logger.error(f"Correction error: {str(e)}")
-            # Use error handler for comprehensive fallback
-            fallback_models = ["openai-gpt4o", "claude-3-sonnet", "local-llm"]
-            if actual_model in fallback_models:
-                fallback_models.remove(actual_model)
+            logger.error(f"Streaming correction error: {str(e)}")
+            if variants:
+                # Part of the result is already on the wire, so don't switch models mid-stream
+                yield CorrectionVariant(
+                    text=text,
+                    type="error",
+                    reason=f"AI処理エラー: {str(e)}"
+                )
+                return
             
-            return await error_handler.handle_ai_service_error(
-                actual_model, 
-                e, 
-                text, 
-                fallback_models
+            fallback_models = [m for m in self.router.rank(model_name) if m != actual_model]
+            fallback_variants = await error_handler.handle_ai_service_error(
+                actual_model, e, text, fallback_models, call=self._call_ai_service
             )
+            failed = all(v.type == "error" for v in fallback_variants)
+            self._record_outcome(actual_model, correction_style, "error" if failed else "fallback", request_start)
+            for variant in fallback_variants:
+                yield variant
+            return
+        
+        if not variants:
+            error_handler.record_failure(actual_model, AIServiceError("empty streamed response"))
+            yield CorrectionVariant(
+                text=text,
+                type="error",
+                reason="AIの応答から修正候補を取得できませんでした"
+            )
+            return
+        
+        if all(v.type == "error" for v in variants):
+            # Already streamed to the client as is; just keep it out of the cache and count it
+            error_handler.record_failure(actual_model, AIServiceError(variants[0].reason))
+            self._record_outcome(actual_model, correction_style, "error", request_start)
+            return
+        error_handler.record_success(actual_model)
+        self._record_outcome(actual_model, correction_style, "provider", request_start)
+        
+        # Write the assembled result through to the cache and history
+        if use_cache:
+            await self.cache_service.cache_correction(text, model_name, variants, correction_style)
+        with observe_stage("history_enqueue", actual_model):
+            self.history_writer.enqueue(
+                text, variants, user_id, actual_model, correction_style, time.time() - start_time
+            )
+    
+    async def get_user_settings(self, user_id: str) -> Dict[str, str]:
+        """Get user settings, falling back to defaults for unknown users"""
+        settings = await self.settings_cache.get(user_id)
+        if settings is not None:
+            return settings
+        
+        with start_span("db.get_user_settings"):
+            async with SessionLocal() as db:
+                user_settings = await db.get(UserSettings, user_id)
+        
+        settings = self._settings_to_dict(user_id, user_settings)
+        # Unknown users are cached too, so anonymous traffic doesn't hit the DB
+        await self.settings_cache.set(user_id, settings)
+        return settings
     
-    def _get_user_preferred_model(self, user_id: str) -> str:
-        """Get user's preferred AI model from database"""
+    def _settings_to_dict(self, user_id: str, user_settings: Optional[UserSettings]) -> Dict[str, str]:
+        if user_settings:
+            return {
+                "user_id": user_settings.user_id,
+                "preferred_ai_model": user_settings.preferred_ai_model or "openai-gpt4o",
+                "default_correction_style": user_settings.default_correction_style or "polite"
+            }
+        # Return default settings
+        return {
+            "user_id": user_id,
+            "preferred_ai_model": "openai-gpt4o",
+            "default_correction_style": "polite"
+        }
+    
+    async def _get_user_preferred_model(self, user_id: str) -> str:
+        """Get user's preferred AI model"""
         try:
-            db = next(get_db())
-            user_settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-            if user_settings and user_settings.preferred_ai_model:
-                return user_settings.preferred_ai_model
+            with observe_stage("settings_lookup"):
+                settings = await self.get_user_settings(user_id)
+            return settings["preferred_ai_model"]
         except Exception as e:
             logger.error(f"Error getting user preferences: {e}")
-        finally:
-            db.close()
         
         return "openai-gpt4o"  # Default model
     
-    def _save_correction_history(self, original_text: str, variants: List[CorrectionVariant], user_id: str, model_name: str):
-        try:
-            db = next(get_db())
-            
-            for variant in variants:
-                if variant.type != "error":
-                    history = CorrectionHistory(
-                        user_id=user_id,
-                        original_text=original_text,
-                        corrected_text=variant.text,
-                        correction_type=variant.type,
-                        ai_model_used=model_name
-                    )
-                    db.add(history)
-            
-            db.commit()
-        except Exception as e:
-            logger.error(f"History save error: {e}")
-        finally:
-            db.close()
-    
+
     def get_available_models(self) -> Dict[str, str]:
         """Get available AI models"""
         logger.info(f"ai_factory: {self.ai_factory}...")
@@ -138,77 +460,247 @@ class CorrectionService:
             return False
         
         try:
-            db = next(get_db())
-            user_settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
-            
-            if user_settings:
-                user_settings.preferred_ai_model = model_name
-            else:
-                user_settings = UserSettings(
-                    user_id=user_id,
-                    preferred_ai_model=model_name
-                )
-                db.add(user_settings)
-            
-            db.commit()
+            async with SessionLocal() as db:
+                user_settings = await db.get(UserSettings, user_id)
+                
+                if user_settings:
+                    user_settings.preferred_ai_model = model_name
+                else:
+                    user_settings = UserSettings(
+                        user_id=user_id,
+                        preferred_ai_model=model_name
+                    )
+                    db.add(user_settings)
+                
+                await db.commit()
+                settings = self._settings_to_dict(user_id, user_settings)
+            # Write-through so the next lookup on this worker skips the DB
+            await self.settings_cache.set(user_id, settings)
             return True
         except Exception as e:
             logger.error(f"Error setting user preference: {e}")
             return False
-        finally:
-            db.close()
     
     async def _get_ai_service_with_fallback(self, model_name: str) -> tuple:
-        """Get AI service with fallback logic"""
-        ai_service = self.ai_factory.get_model(model_name)
-        if ai_service:
-            return ai_service, model_name
-        
-        # Try fallback models in order of preference
-        fallback_models = ["openai-gpt4o", "claude-3-sonnet", "local-llm"]
-        for fallback in fallback_models:
-            if fallback != model_name:
-                ai_service = self.ai_factory.get_model(fallback)
-                if ai_service:
-                    logger.warning(f"Model {model_name} not available, using {fallback}")
-                    return ai_service, fallback
+        """Pick the first configured model, in router order, whose circuit breaker allows a call.
+        
+        The breaker is consulted before calling, so an open circuit costs no
+        timeout or retries: requests go straight to the next healthy model.
+        """
+        for candidate in self.router.rank(model_name):
+            ai_service = self.ai_factory.get_model(candidate)
+            if not ai_service:
+                continue
+            if not error_handler.allow_request(candidate):
+                logger.info(f"Circuit breaker open for {candidate}, skipping")
+                continue
+            if candidate != model_name:
+                logger.warning(f"Model {model_name} not available, using {candidate}")
+            return ai_service, candidate
         
         return None, None
     
-    async def _save_correction_history_async(self, original_text: str, variants: List[CorrectionVariant], user_id: str, model_name: str):
-        """Asynchronously save correction history"""
+    async def correct_text_batch(self, requests: List[Dict]) -> List[Dict]:
+        """Correct many texts with as few upstream calls as possible.
+        
+        Identical (text, model, style) requests are corrected once, cache
+        lookups go out in one bulk call, and misses run through at most
+        batch_concurrency workers, with short texts packed several to a prompt
+        when the provider supports it. Returns one {"status", "variants",
+        "error", "rate_limited"} dict per request, in order; status is "ok",
+        "cached" or "error", and rate_limited marks errors caused only by the
+        provider limits, which are worth retrying later.
+        """
+        if len(requests) > self.batch_max_items:
+            raise ValueError(f"Batch too large: {len(requests)} items (max {self.batch_max_items})")
+        
+        with start_span("correction.batch", {"batch.size": len(requests)}):
+            return await self._correct_text_batch(requests)
+    
+    async def _correct_text_batch(self, requests: List[Dict]) -> List[Dict]:
+        results: List[Optional[Dict]] = [None] * len(requests)
+        # cache key -> (text, model_name, correction_style, use_cache), and the requests sharing it
+        unique: Dict[str, Tuple[str, str, str, bool]] = {}
+        groups: Dict[str, List[int]] = {}
+        preferred_models: Dict[str, str] = {}
+        for i, req in enumerate(requests):
+            text = req.get('text', '')
+            if not text.strip():
+                results[i] = {"status": "error", "variants": [], "error": "空のテキストは添削できません", "rate_limited": False}
+                continue
+            user_id = req.get('user_id', 'anonymous')
+            model_name = req.get('preferred_model')
+            if not model_name:
+                if user_id not in preferred_models:
+                    preferred_models[user_id] = await self._get_user_preferred_model(user_id)
+                model_name = preferred_models[user_id]
+            correction_style = req.get('correction_style', 'default')
+            cache_key = self.cache_service._generate_cache_key(text, model_name, correction_style)
+            unique.setdefault(cache_key, (text, model_name, correction_style, req.get('use_cache', True)))
+            groups.setdefault(cache_key, []).append(i)
+        
+        # cache key -> (variants, history model, processing time); history model is None for cache hits
+        outcomes: Dict[str, Tuple[List[CorrectionVariant], Optional[str], Optional[float]]] = {}
+        cacheable = [key for key, (_, _, _, use_cache) in unique.items() if use_cache]
+        cached = await self.cache_service.get_cached_corrections([unique[key][:3] for key in cacheable])
+        for key, variants in zip(cacheable, cached):
+            if variants:
+                outcomes[key] = (variants, None, None)
+        
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        async def run(unit: List[str]):
+            async with semaphore:
+                if len(unit) > 1:
+                    unit = await self._correct_packed(unit, unique, outcomes)
+                await asyncio.gather(*[self._correct_batch_item(key, unique[key], outcomes) for key in unit])
+        
+        await asyncio.gather(*[run(unit) for unit in self._plan_batch_units(
+            [key for key in unique if key not in outcomes], unique
+        )])
+        
+        for key, indexes in groups.items():
+            variants, history_model, processing_time = outcomes[key]
+            failed = all(v.type == "error" for v in variants)
+            for i in indexes:
+                results[i] = {
+                    "status": "error" if failed else ("ok" if history_model else "cached"),
+                    "variants": [variant.model_copy() for variant in variants],
+                    "error": variants[0].reason if failed and variants else None,
+                    "rate_limited": failed and isinstance(variants, RateLimitedVariants)
+                }
+                if history_model:
+                    req = requests[i]
+                    self.history_writer.enqueue(
+                        req.get('text', ''), variants, req.get('user_id', 'anonymous'),
+                        history_model, unique[key][2], processing_time
+                    )
+        return results
+    
+    def _plan_batch_units(self, keys: List[str], unique: Dict[str, Tuple]) -> List[List[str]]:
+        """Group cache misses into work units: packs of short texts sharing model and style, or single texts"""
+        units: List[List[str]] = []
+        packable: Dict[Tuple, List[str]] = {}
+        for key in keys:
+            text, model_name, correction_style, use_cache = unique[key]
+            if self.batch_pack_size > 1 and len(text) <= self.batch_pack_max_chars:
+                packable.setdefault((model_name, correction_style, use_cache), []).append(key)
+            else:
+                units.append([key])
+        for pack_keys in packable.values():
+            units.extend(
+                pack_keys[i:i + self.batch_pack_size]
+                for i in range(0, len(pack_keys), self.batch_pack_size)
+            )
+        return units
+    
+    async def _correct_batch_item(self, key: str, item: Tuple, outcomes: Dict) -> None:
+        text, model_name, correction_style, use_cache = item
         try:
-            await asyncio.to_thread(self._save_correction_history, original_text, variants, user_id, model_name)
-        except Exception as e:
-            logger.error(f"Async history save error: {e}")
-    
-    async def correct_text_batch(self, requests: List[Dict]) -> List[List[CorrectionVariant]]:
-        """Process multiple correction requests in batch"""
-        tasks = []
-        for req in requests:
-            task = self.correct_text(
-                text=req.get('text', ''),
-                user_id=req.get('user_id', 'anonymous'),
-                preferred_model=req.get('preferred_model'),
-                correction_style=req.get('correction_style', 'default'),
-                use_cache=req.get('use_cache', True)
+            outcomes[key] = await self._single_flight.do(
+                key, self._generate_correction, text, model_name, correction_style, use_cache
             )
-            tasks.append(task)
+        except Exception as e:
+            logger.error(f"Batch correction error: {str(e)}")
+            outcomes[key] = ([CorrectionVariant(text=text, type="error", reason=f"AI処理エラー: {str(e)}")], None, None)
+    
+    async def _correct_packed(self, keys: List[str], unique: Dict[str, Tuple], outcomes: Dict) -> List[str]:
+        """Correct several short texts in one call; returns the keys still left for single calls"""
+        texts = [unique[key][0] for key in keys]
+        _, model_name, correction_style, use_cache = unique[keys[0]]
+        ai_service, actual_model = await self._get_ai_service_with_fallback(model_name)
+        if ai_service is None:
+            return keys
+        if not ai_service.supports_packing:
+            # No call is made, so a half-open probe granted for it must go back
+            error_handler.release_probe(actual_model)
+            return keys
         
-        return await asyncio.gather(*tasks)
+        async def call():
+            results = await ai_service.correct_japanese_texts(texts)
+            # Like a single call: a response with nothing usable is a failed call
+            if not any(_is_usable(variants) for variants in results):
+                raise AIServiceError("packed response had no usable results")
+            return results
+        
+        start_time = time.time()
+        try:
+            packed = await self._instrumented_call(actual_model, "".join(texts), call, {"llm.packed_texts": len(texts)})
+        except Exception as e:
+            logger.warning(f"Packed correction via {actual_model} failed, correcting individually: {str(e)}")
+            if isinstance(e, RateLimitExceeded):
+                error_handler.release_probe(actual_model)
+            else:
+                error_handler.record_failure(actual_model, e)
+            return keys
+        processing_time = time.time() - start_time
+        
+        answered = [
+            (key, variants) for key, variants in zip(keys, packed) if _is_usable(variants)
+        ]
+        error_handler.record_success(actual_model)
+        for key, variants in answered:
+            outcomes[key] = (variants, actual_model, processing_time)
+        if use_cache and answered:
+            await self.cache_service.cache_corrections(
+                [(unique[key][0], model_name, variants, correction_style) for key, variants in answered]
+            )
+        return [key for key in keys if key not in outcomes]
     
     async def get_cache_stats(self) -> dict:
         """Get cache performance statistics"""
-        return await self.cache_service.get_cache_stats()
+        cache_stats = await self.cache_service.get_cache_stats()
+        cache_stats["single_flight"] = self._single_flight.get_stats()
+        cache_stats["user_settings"] = self.settings_cache.get_stats()
+        return cache_stats
     
     async def clear_cache(self) -> bool:
         """Clear correction cache"""
         return await self.cache_service.invalidate_cache()
     
+    def get_history_writer_stats(self) -> Dict:
+        """Get history writer queue and flush statistics"""
+        return self.history_writer.get_stats()
+    
     def get_service_health(self) -> Dict:
         """Get health status of all AI services"""
         return error_handler.get_service_health()
     
+    def get_routing_stats(self) -> Dict:
+        """Get routing mode, per-model latency percentiles and hedging counts"""
+        return self.router.get_stats()
+    
+    def get_limiter_stats(self) -> Dict:
+        """Get per-provider in-flight, queue and rejection counts"""
+        return self.limiters.get_stats()
+    
+    def _get_local_llm_service(self) -> Optional[LocalLLMService]:
+        service = self.ai_factory.get_model("local-llm")
+        return service if isinstance(service, LocalLLMService) else None
+    
+    def get_local_llm_status(self) -> Optional[Dict]:
+        """Get model resolution and warm-up state of the local LLM"""
+        service = self._get_local_llm_service()
+        return service.get_status() if service else None
+    
+    async def refresh_local_models(self) -> Optional[Dict]:
+        """Rediscover installed local models and warm up the resolved one"""
+        service = self._get_local_llm_service()
+        if not service:
+            return None
+        await service.refresh_models()
+        await service.warm_up()
+        return service.get_status()
+    
+    async def pull_local_model(self, model_name: str) -> Optional[Dict]:
+        """Pull a model onto the Ollama server and warm it up"""
+        service = self._get_local_llm_service()
+        if not service:
+            return None
+        await service.pull_model(model_name)
+        await service.warm_up()
+        return service.get_status()
+    
     def reset_service_circuit_breaker(self, service_name: str) -> bool:
         """Reset circuit breaker for a specific service"""
         try:
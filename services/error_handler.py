@@ -1,68 +1,115 @@
 import logging
+import os
 import traceback
-from typing import List, Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from datetime import datetime, timedelta
 import asyncio
 from .openai_service import CorrectionVariant
+from .rate_limiter import RateLimitExceeded
+from .request_timing import current_timing
+from .tracing import start_span
 
 logger = logging.getLogger(__name__)
 
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+class AIServiceError(Exception):
+    """Raised when an AI service answers with error variants only"""
+
+def raise_for_error_variants(variants: List[CorrectionVariant]) -> List[CorrectionVariant]:
+    """Turn an all-error result into an exception so retries and the circuit breaker see it"""
+    if not variants or all(v.type == "error" for v in variants):
+        raise AIServiceError(variants[0].reason if variants else "AIの応答から修正候補を取得できませんでした")
+    return variants
+
+class RateLimitedVariants(list):
+    """Error variants returned because the provider budgets were exhausted, not because a call failed.
+    
+    Callers that can wait (queued batch jobs) retry these later instead of
+    keeping the error.
+    """
+
+# (service, service_name, text) -> variants, raising on failure
+FallbackCall = Callable[[Any, str, str], Awaitable[List[CorrectionVariant]]]
+
 class ErrorHandler:
     def __init__(self):
         self.error_counts = {}
         self.last_errors = {}
         self.max_retries = 3
         self.retry_delay = 1.0
-        self.circuit_breaker_threshold = 5
-        self.circuit_breaker_timeout = 300  # 5 minutes
+        self.circuit_breaker_threshold = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
+        self.circuit_breaker_timeout = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "300"))  # error counting window
+        # How long an open circuit rejects calls before letting a single probe through
+        self.circuit_breaker_open_seconds = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "60"))
+        # A probe that never reports back (e.g. cancelled) is replaced after this long
+        self.circuit_breaker_probe_timeout = float(os.getenv("CIRCUIT_BREAKER_PROBE_TIMEOUT", "60"))
+        self.circuit_states = {}
         
     async def handle_ai_service_error(
         self, 
         service_name: str, 
         error: Exception, 
         text: str,
-        fallback_services: List[str] = None
+        fallback_services: List[str] = None,
+        call: Optional[FallbackCall] = None
     ) -> List[CorrectionVariant]:
-        """Handle AI service errors with fallback and circuit breaker logic"""
+        """Handle AI service errors with fallback and circuit breaker logic.
+        
+        call(service, service_name, text) makes each fallback call; callers
+        pass their rate-limited, instrumented call path so fallback traffic
+        counts against the fallback provider's budget.
+        """
         
         # Log the error
         logger.error(f"AI service error in {service_name}: {str(error)}")
         
-        # Update error tracking
-        self._update_error_tracking(service_name, error)
+        # Update error tracking; our own throttling says nothing about the provider's health
+        if isinstance(error, RateLimitExceeded):
+            self.release_probe(service_name)
+        else:
+            self._update_error_tracking(service_name, error)
         
         # Check if service is in circuit breaker state
         if self._is_circuit_breaker_open(service_name):
             logger.warning(f"Circuit breaker open for {service_name}")
-            return await self._try_fallback_services(text, fallback_services or [])
+            return self._mark_rate_limited(
+                await self._try_fallback_services(text, fallback_services or [], service_name, call), error
+            )
         
         # Try fallback services
         if fallback_services:
             for fallback_service in fallback_services:
-                if not self._is_circuit_breaker_open(fallback_service):
+                from .ai_model_factory import AIModelFactory
+                fallback_ai = AIModelFactory.get_model(fallback_service)
+                if fallback_ai and self.allow_request(fallback_service):
                     try:
-                        from .ai_model_factory import AIModelFactory
-                        fallback_ai = AIModelFactory.get_model(fallback_service)
-                        if fallback_ai:
-                            logger.info(f"Trying fallback service: {fallback_service}")
-                            variants = await fallback_ai.correct_japanese_text(text)
-                            # Add fallback notification to variants
-                            for variant in variants:
-                                variant.reason += f" (フォールバック: {service_name} → {fallback_service})"
-                            return variants
+                        logger.info(f"Trying fallback service: {fallback_service}")
+                        variants = await self._call_fallback(fallback_ai, fallback_service, text, service_name, call)
+                        self.record_success(fallback_service)
+                        self._record_fallback(service_name, fallback_service)
+                        return variants
                     except Exception as fallback_error:
                         logger.error(f"Fallback service {fallback_service} also failed: {str(fallback_error)}")
-                        self._update_error_tracking(fallback_service, fallback_error)
+                        self._record_fallback_error(fallback_service, fallback_error)
                         continue
         
         # Return error variants if all services fail
-        return [
+        return self._mark_rate_limited([
             CorrectionVariant(
                 text=text,
                 type="error",
                 reason=f"すべてのAIサービスでエラーが発生しました: {str(error)}"
             )
-        ]
+        ], error)
+    
+    def _mark_rate_limited(self, variants: List[CorrectionVariant], error: Exception) -> List[CorrectionVariant]:
+        """Flag a failed result whose cause was our own throttling of the primary model"""
+        if isinstance(error, RateLimitExceeded) and all(v.type == "error" for v in variants):
+            return RateLimitedVariants(variants)
+        return variants
     
     async def retry_with_backoff(
         self, 
@@ -73,13 +120,15 @@ class ErrorHandler:
         **kwargs
     ):
         """Retry function with exponential backoff"""
-        max_retries = max_retries or self.max_retries
+        max_retries = self.max_retries if max_retries is None else max_retries
         
         for attempt in range(max_retries + 1):
             try:
-                return await func(*args, **kwargs)
+                with start_span("retry.attempt", {"retry.attempt": attempt + 1, "retry.max_retries": max_retries}):
+                    return await func(*args, **kwargs)
             except Exception as e:
-                if attempt == max_retries:
+                # Retrying past a rate limit only adds load
+                if attempt == max_retries or isinstance(e, RateLimitExceeded):
                     raise e
                 
                 delay = base_delay * (2 ** attempt)
@@ -115,30 +164,119 @@ class ErrorHandler:
             'error': str(error),
             'type': type(error).__name__
         }
+        
+        state = self.circuit_states.get(service_name)
+        if state and state['state'] == CIRCUIT_HALF_OPEN:
+            # The probe failed: stay away for another open period
+            self._set_circuit_state(service_name, CIRCUIT_OPEN)
+        elif len(self.error_counts[service_name]) >= self.circuit_breaker_threshold:
+            if not state or state['state'] != CIRCUIT_OPEN:
+                logger.warning(f"Circuit breaker opened for {service_name}")
+            self._set_circuit_state(service_name, CIRCUIT_OPEN)
+    
+    def record_failure(self, service_name: str, error: Exception):
+        """Record a failed call to a service"""
+        self._update_error_tracking(service_name, error)
+    
+    def record_success(self, service_name: str):
+        """Record a successful call; a successful half-open probe closes the circuit"""
+        state = self.circuit_states.get(service_name)
+        if state and state['state'] != CIRCUIT_CLOSED:
+            logger.info(f"Circuit breaker closed for {service_name}")
+            self.error_counts[service_name] = []
+            self._set_circuit_state(service_name, CIRCUIT_CLOSED)
+    
+    def _set_circuit_state(self, service_name: str, state: str):
+        self.circuit_states[service_name] = {'state': state, 'since': datetime.now()}
+    
+    def get_circuit_state(self, service_name: str) -> str:
+        """Current state, moving an expired open circuit to half-open"""
+        state = self.circuit_states.get(service_name)
+        if not state:
+            return CIRCUIT_CLOSED
+        if state['state'] == CIRCUIT_OPEN:
+            if datetime.now() - state['since'] >= timedelta(seconds=self.circuit_breaker_open_seconds):
+                self.circuit_states[service_name] = {'state': CIRCUIT_HALF_OPEN, 'since': datetime.now(), 'probe_started': None}
+        return self.circuit_states[service_name]['state']
+    
+    def allow_request(self, service_name: str) -> bool:
+        """Whether a call to the service may go ahead now.
+        
+        Closed circuits always allow calls and open ones never do. A half-open
+        circuit lets exactly one probe through; its outcome (record_success or
+        record_failure) closes or re-opens the circuit.
+        """
+        state = self.get_circuit_state(service_name)
+        if state == CIRCUIT_CLOSED:
+            return True
+        if state == CIRCUIT_OPEN:
+            return False
+        circuit = self.circuit_states[service_name]
+        probe_started = circuit.get('probe_started')
+        if probe_started and datetime.now() - probe_started < timedelta(seconds=self.circuit_breaker_probe_timeout):
+            return False
+        circuit['probe_started'] = datetime.now()
+        logger.info(f"Circuit breaker half-open for {service_name}, sending probe")
+        return True
+    
+    def release_probe(self, service_name: str):
+        """Let another call probe a half-open circuit when this one never reached the provider"""
+        circuit = self.circuit_states.get(service_name)
+        if circuit and circuit['state'] == CIRCUIT_HALF_OPEN:
+            circuit['probe_started'] = None
     
     def _is_circuit_breaker_open(self, service_name: str) -> bool:
         """Check if circuit breaker is open for a service"""
-        if service_name not in self.error_counts:
-            return False
-        
-        recent_errors = self.error_counts[service_name]
-        return len(recent_errors) >= self.circuit_breaker_threshold
+        return self.get_circuit_state(service_name) == CIRCUIT_OPEN
+    
+    def _record_fallback(self, failed_service: Optional[str], fallback_service: str):
+        """Note the fallback in the request timing metadata instead of the variant reasons"""
+        logger.info(f"Fallback: {failed_service} → {fallback_service}")
+        timing = current_timing()
+        if timing is not None:
+            timing.fallback_from = failed_service
+            timing.model = fallback_service
+    
+    async def _call_fallback(
+        self,
+        service,
+        service_name: str,
+        text: str,
+        failed_service: Optional[str],
+        call: Optional[FallbackCall]
+    ) -> List[CorrectionVariant]:
+        with start_span("fallback", {"fallback.from": failed_service, "fallback.to": service_name}):
+            if call is not None:
+                return await call(service, service_name, text)
+            return raise_for_error_variants(await service.correct_japanese_text(text))
     
-    async def _try_fallback_services(self, text: str, fallback_services: List[str]) -> List[CorrectionVariant]:
+    def _record_fallback_error(self, service_name: str, error: Exception):
+        """A throttled fallback is skipped without counting against the provider's circuit"""
+        if isinstance(error, RateLimitExceeded):
+            self.release_probe(service_name)
+        else:
+            self._update_error_tracking(service_name, error)
+    
+    async def _try_fallback_services(
+        self,
+        text: str,
+        fallback_services: List[str],
+        failed_service: Optional[str] = None,
+        call: Optional[FallbackCall] = None
+    ) -> List[CorrectionVariant]:
         """Try fallback services in order"""
         for service_name in fallback_services:
-            if not self._is_circuit_breaker_open(service_name):
+            from .ai_model_factory import AIModelFactory
+            service = AIModelFactory.get_model(service_name)
+            if service and self.allow_request(service_name):
                 try:
-                    from .ai_model_factory import AIModelFactory
-                    service = AIModelFactory.get_model(service_name)
-                    if service:
-                        variants = await service.correct_japanese_text(text)
-                        for variant in variants:
-                            variant.reason += f" (フォールバック利用)"
-                        return variants
+                    variants = await self._call_fallback(service, service_name, text, failed_service, call)
+                    self.record_success(service_name)
+                    self._record_fallback(failed_service, service_name)
+                    return variants
                 except Exception as e:
                     logger.error(f"Fallback service {service_name} failed: {str(e)}")
-                    self._update_error_tracking(service_name, e)
+                    self._record_fallback_error(service_name, e)
                     continue
         
         # All fallback services failed
@@ -156,15 +294,21 @@ class ErrorHandler:
         
         for service_name in ['openai-gpt4o', 'claude-3-sonnet', 'local-llm']:
             recent_errors = self.error_counts.get(service_name, [])
-            is_circuit_open = self._is_circuit_breaker_open(service_name)
+            circuit_state = self.get_circuit_state(service_name)
+            is_circuit_open = circuit_state == CIRCUIT_OPEN
             last_error = self.last_errors.get(service_name)
+            next_retry_at = None
+            if is_circuit_open:
+                next_retry_at = self.circuit_states[service_name]['since'] + timedelta(seconds=self.circuit_breaker_open_seconds)
             
             health_status[service_name] = {
                 'status': 'down' if is_circuit_open else 'up',
                 'recent_error_count': len(recent_errors),
                 'circuit_breaker_open': is_circuit_open,
+                'circuit_state': circuit_state,
                 'last_error': last_error,
-                'next_retry_available': not is_circuit_open
+                'next_retry_available': not is_circuit_open,
+                'next_retry_at': next_retry_at
             }
         
         return health_status
@@ -175,6 +319,7 @@ class ErrorHandler:
             self.error_counts[service_name] = []
         if service_name in self.last_errors:
             del self.last_errors[service_name]
+        self.circuit_states.pop(service_name, None)
         logger.info(f"Circuit breaker reset for {service_name}")
 
 # Global error handler instance
@@ -0,0 +1,232 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import selectinload
+from database.models import CorrectionRequest, CorrectionVariantRecord, SessionLocal
+from .cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+class HistoryRetentionService:
+    """Archive and delete history beyond the retention policy.
+
+    Corrections older than max_age_days, or beyond a user's newest
+    max_rows_per_user, are appended to monthly gzip JSONL files under
+    archive_dir and then deleted. Work is done in batches of batch_size with a
+    commit per batch, so the SQLite write lock is only held briefly. With a
+    cache_service, each run also takes a Redis lock so only one process
+    archives at a time; otherwise a second process would archive the same
+    rows again.
+    """
+
+    def __init__(
+        self,
+        archive_dir: str = "./history_archive",
+        max_age_days: int = 0,
+        max_rows_per_user: int = 0,
+        batch_size: int = 500,
+        interval: float = 3600.0,
+        batch_pause: float = 0.05,
+        cache_service: Optional[CacheService] = None,
+        lock_ttl: float = 3600.0
+    ):
+        self.archive_dir = archive_dir
+        # 0 disables the corresponding limit
+        self.max_age_days = max_age_days
+        self.max_rows_per_user = max_rows_per_user
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self.cache_service = cache_service
+        # Longer than any run, so the lock can't expire while rows are being archived
+        self.lock_ttl = lock_ttl
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.archived_total = 0
+        self.last_run: Optional[Dict] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_rows_per_user > 0
+
+    def start(self) -> None:
+        """Run the retention job periodically in the background"""
+        if self.enabled and self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def close(self) -> None:
+        """Stop the background job"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"History retention error: {str(e)}")
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self) -> Dict:
+        """Apply the retention policy once; concurrent calls wait for the running one.
+
+        Returns {"skipped": True} when another process holds the retention lock.
+        """
+        async with self._lock:
+            token = None
+            if self.cache_service:
+                acquired, token = await self.cache_service.try_lock("history-retention", ttl=self.lock_ttl)
+                if not acquired:
+                    logger.info("History retention is running in another process; skipping this run")
+                    return {"skipped": True}
+            try:
+                return await self._run_locked()
+            finally:
+                if self.cache_service:
+                    await self.cache_service.release_lock("history-retention", token)
+
+    async def _run_locked(self) -> Dict:
+        start_time = time.perf_counter()
+        started_at = datetime.utcnow()
+        archived_by_age = 0
+        archived_by_count = 0
+        if self.max_age_days > 0:
+            archived_by_age = await self._archive_older_than(started_at - timedelta(days=self.max_age_days))
+        if self.max_rows_per_user > 0:
+            archived_by_count = await self._archive_over_user_limit()
+
+        self.runs += 1
+        self.archived_total += archived_by_age + archived_by_count
+        self.last_run = {
+            "started_at": started_at.isoformat(),
+            "archived_by_age": archived_by_age,
+            "archived_by_count": archived_by_count,
+            "duration_ms": round((time.perf_counter() - start_time) * 1000, 2)
+        }
+        if archived_by_age or archived_by_count:
+            logger.info(f"History retention archived {archived_by_age + archived_by_count} corrections")
+        return self.last_run
+
+    async def _archive_older_than(self, cutoff: datetime) -> int:
+        archived = 0
+        while True:
+            ids = await self._select_ids(
+                select(CorrectionRequest.id)
+                .where(CorrectionRequest.created_at < cutoff)
+                .order_by(CorrectionRequest.id)
+                .limit(self.batch_size)
+            )
+            if not ids:
+                return archived
+            archived += await self._archive_batch(ids)
+
+    async def _archive_over_user_limit(self) -> int:
+        async with SessionLocal() as db:
+            user_ids = (await db.scalars(
+                select(CorrectionRequest.user_id)
+                .group_by(CorrectionRequest.user_id)
+                .having(func.count() > self.max_rows_per_user)
+            )).all()
+
+        archived = 0
+        for user_id in user_ids:
+            while True:
+                # Everything past the newest max_rows_per_user, oldest batch first via the user index
+                ids = await self._select_ids(
+                    select(CorrectionRequest.id)
+                    .where(CorrectionRequest.user_id == user_id)
+                    .order_by(CorrectionRequest.created_at.desc(), CorrectionRequest.id.desc())
+                    .offset(self.max_rows_per_user)
+                    .limit(self.batch_size)
+                )
+                if not ids:
+                    break
+                archived += await self._archive_batch(ids)
+        return archived
+
+    async def _select_ids(self, query) -> List[int]:
+        async with SessionLocal() as db:
+            return list((await db.scalars(query)).all())
+
+    async def _archive_batch(self, ids: List[int]) -> int:
+        async with SessionLocal() as db:
+            requests = (await db.scalars(
+                select(CorrectionRequest)
+                .where(CorrectionRequest.id.in_(ids))
+                .options(selectinload(CorrectionRequest.variants))
+            )).all()
+
+            # Archive first: a crash before the delete leaves duplicates in the archive, never lost rows
+            await asyncio.to_thread(self._write_archive, [self._to_record(request) for request in requests])
+
+            await db.execute(delete(CorrectionVariantRecord).where(CorrectionVariantRecord.request_id.in_(ids)))
+            await db.execute(delete(CorrectionRequest).where(CorrectionRequest.id.in_(ids)))
+            await db.commit()
+
+        # Let request traffic in between batches
+        await asyncio.sleep(self.batch_pause)
+        return len(requests)
+
+    def _to_record(self, request: CorrectionRequest) -> Dict:
+        return {
+            "id": request.id,
+            "user_id": request.user_id,
+            "original_text": request.original_text,
+            "ai_model_used": request.ai_model_used,
+            "correction_style": request.correction_style,
+            "processing_time_ms": request.processing_time_ms,
+            "created_at": request.created_at.isoformat(),
+            "variants": [
+                {"corrected_text": variant.corrected_text, "correction_type": variant.correction_type}
+                for variant in request.variants
+            ]
+        }
+
+    def _write_archive(self, records: List[Dict]) -> None:
+        by_month: Dict[str, List[Dict]] = {}
+        for record in records:
+            by_month.setdefault(record["created_at"][:7], []).append(record)
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for month, month_records in by_month.items():
+            # Appending adds a gzip member; concatenated members read back as one stream
+            path = os.path.join(self.archive_dir, f"history-{month}.jsonl.gz")
+            with gzip.open(path, "at", encoding="utf-8") as archive:
+                for record in month_records:
+                    archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def list_archives(self) -> List[Dict]:
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return [
+            {"file": name, "bytes": os.path.getsize(os.path.join(self.archive_dir, name))}
+            for name in sorted(os.listdir(self.archive_dir))
+            if name.endswith(".jsonl.gz")
+        ]
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "max_age_days": self.max_age_days,
+            "max_rows_per_user": self.max_rows_per_user,
+            "batch_size": self.batch_size,
+            "interval_seconds": self.interval,
+            "archive_dir": self.archive_dir,
+            "runs": self.runs,
+            "archived_total": self.archived_total,
+            "last_run": self.last_run,
+            "archives": self.list_archives()
+        }
@@ -0,0 +1,307 @@
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.orm import selectinload
+from .memory_cache import MemoryCache
+from database.models import CorrectionRequest, CorrectionVariantRecord, SessionLocal, IS_SQLITE
+from database.search_index import SEARCH_TABLE, user_match_term
+
+logger = logging.getLogger(__name__)
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+# The trigram tokenizer cannot match terms shorter than this
+MIN_INDEXED_TERM_LENGTH = 3
+
+_SEARCH_QUERY = text(f"""
+    SELECT r.id, r.original_text, r.ai_model_used, r.correction_style, r.created_at,
+           snippet({SEARCH_TABLE}, 0, '<mark>', '</mark>', '…', 16) AS original_snippet,
+           snippet({SEARCH_TABLE}, 1, '<mark>', '</mark>', '…', 16) AS corrected_snippet,
+           bm25({SEARCH_TABLE}, 1.0, 1.0, 0.0) AS score
+    FROM {SEARCH_TABLE}
+    JOIN correction_requests r ON r.id = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH :match AND r.user_id = :user_id
+    ORDER BY score
+    LIMIT :limit OFFSET :offset
+""")
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+def _highlight(value: str, terms: List[str], context: int = 16) -> str:
+    """Mark the first matching term with some surrounding context, like FTS5 snippet()"""
+    for term in terms:
+        index = value.find(term)
+        if index != -1:
+            start = max(index - context, 0)
+            end = min(index + len(term) + context, len(value))
+            return (
+                ("…" if start > 0 else "")
+                + value[start:index] + "<mark>" + term + "</mark>" + value[index + len(term):end]
+                + ("…" if end < len(value) else "")
+            )
+    return value[:context * 2]
+
+class HistoryService:
+    """Read access to correction history"""
+
+    def __init__(self, count_cache_ttl: float = 30.0):
+        # Per-user totals; approximate for up to count_cache_ttl seconds
+        self._count_cache = MemoryCache(max_entries=10000, default_ttl=count_cache_ttl)
+
+    def encode_cursor(self, created_at: datetime, request_id: int, position: Optional[int] = None) -> str:
+        payload = {"c": created_at.isoformat(), "r": request_id}
+        if position is not None:
+            payload["p"] = position
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> Dict:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return {
+                "created_at": datetime.fromisoformat(payload["c"]),
+                "request_id": int(payload["r"]),
+                "position": int(payload["p"]) if "p" in payload else None
+            }
+        except Exception as e:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+    def _after_request(self, cursor: Dict):
+        """Rows strictly after the cursor's request in (created_at, id) descending order"""
+        created_at, request_id = cursor["created_at"], cursor["request_id"]
+        return and_(
+            CorrectionRequest.created_at <= created_at,
+            or_(
+                CorrectionRequest.created_at < created_at,
+                and_(CorrectionRequest.created_at == created_at, CorrectionRequest.id < request_id)
+            )
+        )
+
+    async def count_history(self, user_id: str, grouped: bool = False, use_cache: bool = False) -> int:
+        """Count a user's variants (or corrections when grouped), optionally from the short-lived cache"""
+        cache_key = f"{'requests' if grouped else 'variants'}:{user_id}"
+        if use_cache:
+            cached = self._count_cache.get(cache_key)
+            if cached is not None:
+                return int(cached)
+
+        if grouped:
+            query = select(func.count()).select_from(CorrectionRequest).where(CorrectionRequest.user_id == user_id)
+        else:
+            query = (
+                select(func.count())
+                .select_from(CorrectionVariantRecord)
+                .join(CorrectionRequest, CorrectionVariantRecord.request_id == CorrectionRequest.id)
+                .where(CorrectionRequest.user_id == user_id)
+            )
+        async with SessionLocal() as db:
+            total_count = await db.scalar(query)
+        self._count_cache.set(cache_key, str(total_count))
+        return total_count
+
+    async def get_history(
+        self,
+        user_id: str,
+        limit: int = 50,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        include_total: bool = True
+    ) -> Dict:
+        """List a user's history one item per variant, newest first.
+
+        With a cursor, the page starts right after the cursor's row using the
+        (user_id, created_at, id) index, so every page costs the same. Without
+        one, the legacy offset paging is used.
+        """
+        query = (
+            select(CorrectionVariantRecord, CorrectionRequest)
+            .join(CorrectionRequest, CorrectionVariantRecord.request_id == CorrectionRequest.id)
+            .where(CorrectionRequest.user_id == user_id)
+            .order_by(
+                CorrectionRequest.created_at.desc(),
+                CorrectionRequest.id.desc(),
+                CorrectionVariantRecord.position
+            )
+            .limit(limit + 1)
+        )
+        if cursor:
+            position = self.decode_cursor(cursor)
+            query = query.where(or_(
+                self._after_request(position),
+                and_(
+                    CorrectionRequest.id == position["request_id"],
+                    CorrectionVariantRecord.position > (position["position"] or 0)
+                )
+            ))
+        elif offset:
+            query = query.offset(offset)
+
+        async with SessionLocal() as db:
+            rows = (await db.execute(query)).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        result = {
+            "items": [
+                {
+                    "id": variant.id,
+                    "original_text": request.original_text,
+                    "corrected_text": variant.corrected_text,
+                    "correction_type": variant.correction_type,
+                    "ai_model_used": request.ai_model_used,
+                    "created_at": request.created_at
+                }
+                for variant, request in rows
+            ],
+            "next_cursor": None
+        }
+        if has_more and rows:
+            last_variant, last_request = rows[-1]
+            result["next_cursor"] = self.encode_cursor(last_request.created_at, last_request.id, last_variant.position)
+        if include_total:
+            # Offset callers get an exact count as before; cursor callers accept a cached one
+            result["total_count"] = await self.count_history(user_id, use_cache=cursor is not None)
+        return result
+
+    async def get_grouped_history(
+        self,
+        user_id: str,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        include_total: bool = True
+    ) -> Dict:
+        """List a user's corrections newest first, each with its variants"""
+        query = (
+            select(CorrectionRequest)
+            .where(CorrectionRequest.user_id == user_id)
+            .options(selectinload(CorrectionRequest.variants))
+            .order_by(CorrectionRequest.created_at.desc(), CorrectionRequest.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            query = query.where(self._after_request(self.decode_cursor(cursor)))
+
+        async with SessionLocal() as db:
+            requests: List[CorrectionRequest] = list((await db.scalars(query)).all())
+
+        has_more = len(requests) > limit
+        requests = requests[:limit]
+
+        result = {
+            "items": [
+                {
+                    "id": request.id,
+                    "original_text": request.original_text,
+                    "ai_model_used": request.ai_model_used,
+                    "correction_style": request.correction_style,
+                    "processing_time_ms": request.processing_time_ms,
+                    "created_at": request.created_at,
+                    "variants": [
+                        {
+                            "id": variant.id,
+                            "corrected_text": variant.corrected_text,
+                            "correction_type": variant.correction_type
+                        }
+                        for variant in request.variants
+                    ]
+                }
+                for request in requests
+            ],
+            "next_cursor": (
+                self.encode_cursor(requests[-1].created_at, requests[-1].id) if has_more and requests else None
+            )
+        }
+        if include_total:
+            result["total_count"] = await self.count_history(user_id, grouped=True, use_cache=cursor is not None)
+        return result
+
+    async def search_history(self, user_id: str, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """Search a user's corrections by original or corrected text, best matches first.
+
+        Uses the FTS5 trigram index on SQLite. Terms shorter than three
+        characters (and other databases) fall back to a LIKE scan limited to
+        the user's own rows.
+        """
+        terms = query.split()
+        if not terms:
+            return {"items": [], "query": query}
+
+        if IS_SQLITE and all(len(term) >= MIN_INDEXED_TERM_LENGTH for term in terms):
+            # Quote each term as a phrase so FTS5 syntax in user input is matched literally.
+            # The user term narrows the match to the user's rows inside the index;
+            # the r.user_id filter drops trigram false positives.
+            match = " AND ".join(
+                [f"user_id:{_fts_phrase(user_match_term(user_id))}"]
+                + [f"{{original_text corrected_text}}:{_fts_phrase(term)}" for term in terms]
+            )
+            async with SessionLocal() as db:
+                rows = (await db.execute(
+                    _SEARCH_QUERY,
+                    {"match": match, "user_id": user_id, "limit": limit, "offset": offset}
+                )).mappings().all()
+            items = [dict(row) for row in rows]
+        else:
+            items = await self._search_history_like(user_id, terms, limit, offset)
+
+        variants = await self._load_variants([item["id"] for item in items])
+        for item in items:
+            if isinstance(item["created_at"], str):
+                item["created_at"] = datetime.fromisoformat(item["created_at"])
+            item["variants"] = variants.get(item["id"], [])
+        return {"items": items, "query": query}
+
+    async def _search_history_like(self, user_id: str, terms: List[str], limit: int, offset: int) -> List[Dict]:
+        query = (
+            select(CorrectionRequest)
+            .where(CorrectionRequest.user_id == user_id)
+            .where(*[
+                or_(
+                    CorrectionRequest.original_text.contains(term, autoescape=True),
+                    CorrectionRequest.variants.any(CorrectionVariantRecord.corrected_text.contains(term, autoescape=True))
+                )
+                for term in terms
+            ])
+            .options(selectinload(CorrectionRequest.variants))
+            .order_by(CorrectionRequest.created_at.desc(), CorrectionRequest.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        async with SessionLocal() as db:
+            requests = (await db.scalars(query)).all()
+        return [
+            {
+                "id": request.id,
+                "original_text": request.original_text,
+                "ai_model_used": request.ai_model_used,
+                "correction_style": request.correction_style,
+                "created_at": request.created_at,
+                "original_snippet": _highlight(request.original_text, terms),
+                "corrected_snippet": _highlight("\n".join(v.corrected_text for v in request.variants), terms),
+                "score": None
+            }
+            for request in requests
+        ]
+
+    async def _load_variants(self, request_ids: List[int]) -> Dict[int, List[Dict]]:
+        if not request_ids:
+            return {}
+        async with SessionLocal() as db:
+            records = (await db.scalars(
+                select(CorrectionVariantRecord)
+                .where(CorrectionVariantRecord.request_id.in_(request_ids))
+                .order_by(CorrectionVariantRecord.request_id, CorrectionVariantRecord.position)
+            )).all()
+        variants: Dict[int, List[Dict]] = {}
+        for record in records:
+            variants.setdefault(record.request_id, []).append({
+                "id": record.id,
+                "corrected_text": record.corrected_text,
+                "correction_type": record.correction_type
+            })
+        return variants
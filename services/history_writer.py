@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+from opentelemetry import trace
+from sqlalchemy import insert
+from .correction_variant import CorrectionVariant
+from .tracing import tracer
+from database.models import CorrectionRequest, CorrectionVariantRecord, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DROP_POLICIES = ("drop_newest", "drop_oldest")
+
+class HistoryWriter:
+    """Buffer corrections and flush them to history with bulk inserts.
+
+    A flush happens every batch_size corrections or flush_interval seconds,
+    whichever comes first, and costs one insert for the requests plus one for
+    their variants. When the queue is full, corrections are dropped according
+    to drop_policy so the request path never waits on the database.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        drop_policy: str = "drop_newest"
+    ):
+        if drop_policy not in HISTORY_DROP_POLICIES:
+            raise ValueError(f"Unknown history drop policy: {drop_policy}")
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def start(self) -> None:
+        """Start the background flush task (called lazily on first enqueue)"""
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued and stop the background task"""
+        if self._worker is None:
+            return
+        # The sentinel queues behind every pending row, so the worker flushes them all first
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    def enqueue(
+        self,
+        original_text: str,
+        variants: List[CorrectionVariant],
+        user_id: str,
+        model_name: str,
+        correction_style: Optional[str] = None,
+        processing_time: Optional[float] = None
+    ) -> bool:
+        """Queue a correction for history; returns False if it was dropped or had nothing to save"""
+        saved_variants = [
+            {
+                "position": position,
+                "corrected_text": variant.text,
+                "correction_type": variant.type
+            }
+            for position, variant in enumerate(v for v in variants if v.type != "error")
+        ]
+        if not saved_variants:
+            return False
+
+        self.start()
+        item = {
+            "request": {
+                "user_id": user_id,
+                "original_text": original_text,
+                "ai_model_used": model_name,
+                "correction_style": correction_style,
+                "processing_time_ms": processing_time * 1000 if processing_time is not None else None,
+                "created_at": datetime.utcnow()
+            },
+            "variants": saved_variants,
+            # Lets the flush span link back to the requests it writes
+            "span_context": trace.get_current_span().get_span_context()
+        }
+        if self._queue.full():
+            if self.drop_policy == "drop_newest":
+                self.dropped += 1
+                return False
+            # drop_oldest: make room by discarding the oldest buffered correction
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+        self.enqueued += 1
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                items.append(item)
+            await self._flush(items)
+            if stopping:
+                return
+
+    async def _flush(self, items: List[dict]) -> None:
+        start_time = time.perf_counter()
+        links = [trace.Link(item["span_context"]) for item in items if item["span_context"].is_valid]
+        try:
+            with tracer.start_as_current_span("history.flush", links=links, attributes={"history.rows": len(items)}):
+                async with SessionLocal() as db:
+                    request_ids = (await db.scalars(
+                        insert(CorrectionRequest).returning(CorrectionRequest.id, sort_by_parameter_order=True),
+                        [item["request"] for item in items]
+                    )).all()
+                    variant_rows = [
+                        {**variant, "request_id": request_id}
+                        for request_id, item in zip(request_ids, items)
+                        for variant in item["variants"]
+                    ]
+                    await db.execute(insert(CorrectionVariantRecord), variant_rows)
+                    await db.commit()
+            self.written += len(items)
+        except Exception as e:
+            logger.error(f"History flush error ({len(items)} corrections): {e}")
+            self.failed += len(items)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "drop_policy": self.drop_policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "avg_flush_ms": round(self._total_flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2)
+        }
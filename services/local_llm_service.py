@@ -1,105 +1,311 @@
+import os
+import json
+import time
 import ollama
 import asyncio
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from .base_ai_service import BaseAIService
+from .metrics import observe_stage, record_token_usage
 from .openai_service import CorrectionVariant
+from .variant_stream_parser import VariantStreamParser
 
 logger = logging.getLogger(__name__)
 
+# sequential: one prompt per variant, one at a time
+# parallel:   one prompt per variant, dispatched concurrently
+# json:       a single prompt producing all three variants as JSON
+LOCAL_LLM_MODES = ("sequential", "parallel", "json")
+
+# Metrics use the factory key like every other series (and MODEL_PRICES), not model_name
+METRICS_MODEL = "local-llm"
+
 class LocalLLMService(BaseAIService):
-    def __init__(self, model_name: str = "llama3.2:latest"):
+    def __init__(
+        self,
+        model_name: str = "llama3.2:latest",
+        mode: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        refresh_interval: Optional[float] = None
+    ):
         self.local_model = model_name
-        self._client = None
+        self.mode = mode or os.getenv("LOCAL_LLM_MODE", "parallel")
+        if self.mode not in LOCAL_LLM_MODES:
+            raise ValueError(f"Unknown local LLM mode: {self.mode}")
+        # Match the number of requests Ollama serves at once per model
+        self.concurrency = concurrency or int(
+            os.getenv("LOCAL_LLM_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "3"))
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # How long Ollama keeps the model resident after each request
+        self.keep_alive = keep_alive or os.getenv("LOCAL_LLM_KEEP_ALIVE", "30m")
+        self.refresh_interval = refresh_interval or float(os.getenv("LOCAL_LLM_REFRESH_INTERVAL", "300"))
+        self._async_client = None
+        self._installed_models: List[str] = []
+        self._resolved_model: Optional[str] = None
+        self._last_refresh: Optional[float] = None
+        self._warmed_up = False
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._warm_up_task: Optional[asyncio.Task] = None
         
     @property
     def model_name(self) -> str:
         return f"local-{self.local_model}"
     
-    def _get_client(self):
-        if self._client is None:
-            self._client = ollama.Client()
-        return self._client
+    def _get_async_client(self):
+        if self._async_client is None:
+            self._async_client = ollama.AsyncClient()
+        return self._async_client
+    
+    async def refresh_models(self) -> Optional[str]:
+        """Rediscover installed models and pick the one to use"""
+        available_models = await self._get_async_client().list()
+        model_names = [model['model'] for model in available_models.get('models', [])]
+        
+        # Use a fallback model if the preferred one isn't available
+        resolved_model = None
+        if self.local_model in model_names:
+            resolved_model = self.local_model
+        else:
+            # Try common Japanese models
+            fallback_models = ['qwen2.5:3b-instruct', 'llama3.2:latest', 'gemma2:2b-instruct']
+            for fallback in fallback_models:
+                if fallback in model_names:
+                    resolved_model = fallback
+                    break
+        
+        if resolved_model != self._resolved_model:
+            logger.info(f"Local LLM model resolved to {resolved_model}")
+            # A different model has to be loaded again
+            self._warmed_up = False
+        self._installed_models = model_names
+        self._resolved_model = resolved_model
+        self._last_refresh = time.time()
+        return resolved_model
+    
+    async def _resolve_model(self) -> str:
+        """Return the cached model, discovering it once if startup hasn't yet"""
+        if self._resolved_model is None:
+            await self.refresh_models()
+        if self._resolved_model is None:
+            raise RuntimeError("利用可能なローカルモデルがありません。管理APIからモデルを取得してください")
+        return self._resolved_model
+    
+    async def warm_up(self) -> bool:
+        """Load the model into memory so the first user request doesn't pay for it"""
+        try:
+            actual_model = await self._resolve_model()
+            await self._get_async_client().chat(
+                model=actual_model,
+                messages=[{'role': 'user', 'content': 'こんにちは'}],
+                options={'num_predict': 1},
+                keep_alive=self.keep_alive
+            )
+            self._warmed_up = True
+            logger.info(f"Local LLM {actual_model} warmed up")
+            return True
+        except Exception as e:
+            logger.warning(f"Local LLM warm-up failed: {str(e)}")
+            return False
+    
+    async def pull_model(self, model_name: str) -> Optional[str]:
+        """Pull a model onto the Ollama server, then re-resolve (admin operation)"""
+        logger.info(f"Pulling {model_name} model...")
+        await self._get_async_client().pull(model_name)
+        return await self.refresh_models()
+    
+    async def start(self) -> None:
+        """Resolve the model, warm it up and keep the model list fresh in the background"""
+        try:
+            await self.refresh_models()
+        except Exception as e:
+            logger.warning(f"Local LLM model discovery failed: {str(e)}")
+        if self._warm_up_task is None:
+            # Warm up in the background so a slow model load doesn't delay startup
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_models()
+                if self._resolved_model and not self._warmed_up:
+                    await self.warm_up()
+            except Exception as e:
+                logger.warning(f"Local LLM model refresh failed: {str(e)}")
+    
+    async def close(self) -> None:
+        """Stop background tasks"""
+        for task in (self._refresh_task, self._warm_up_task):
+            if task is not None:
+                task.cancel()
+        self._refresh_task = None
+        self._warm_up_task = None
+    
+    def get_status(self) -> dict:
+        return {
+            "preferred_model": self.local_model,
+            "resolved_model": self._resolved_model,
+            "installed_models": self._installed_models,
+            "last_refresh": self._last_refresh,
+            "warmed_up": self._warmed_up,
+            "mode": self.mode,
+            "concurrency": self.concurrency,
+            "keep_alive": self.keep_alive
+        }
+    
+    def _create_prompts(self, text: str) -> List[str]:
+        """Create prompts for different correction styles"""
+        return [
+            self._create_formal_prompt(text),
+            self._create_casual_prompt(text),
+            self._create_error_correction_prompt(text)
+        ]
+    
+    def _build_variant(self, index: int, content: str, actual_model: str) -> CorrectionVariant:
+        corrected_text = content.strip()
+        
+        # Extract just the corrected text if the model includes explanation
+        lines = corrected_text.split('\n')
+        for line in lines:
+            if line.strip() and not line.startswith('理由') and not line.startswith('説明'):
+                corrected_text = line.strip()
+                break
+        
+        type = ["polite", "casual", "corrected"][index]
+        variant_type = ["丁寧な表現", "カジュアル表現", "誤字・文法修正"][index]
+        reason = f"ローカルLLM({actual_model})による{variant_type}"
+        
+        return CorrectionVariant(
+            text=corrected_text,
+            type=type,
+            reason=reason
+        )
+    
+    async def _generate_variant(self, index: int, prompt: str, text: str, actual_model: str) -> CorrectionVariant:
+        """Run one per-variant prompt, bounded by the configured concurrency"""
+        try:
+            async with self._semaphore:
+                response = await self._get_async_client().chat(
+                    model=actual_model,
+                    messages=[{'role': 'user', 'content': prompt}],
+                    options={'temperature': 0.3, 'num_predict': 200},
+                    keep_alive=self.keep_alive
+                )
+            record_token_usage(METRICS_MODEL, response.get('prompt_eval_count'), response.get('eval_count'))
+            return self._build_variant(index, response['message']['content'], actual_model)
+        except Exception as e:
+            logger.error(f"Error generating variant {index+1}: {str(e)}")
+            # Fallback to original text with error message
+            return CorrectionVariant(
+                text=text,
+                type="error",
+                reason=f"ローカルLLM処理エラー: {str(e)}"
+            )
+    
+    def _build_json_variants(self, variants_data: List[dict], actual_model: str) -> List[CorrectionVariant]:
+        return [
+            CorrectionVariant(
+                text=variant_data["text"],
+                type=variant_data.get("type", "corrected"),
+                reason=f"ローカルLLM({actual_model}): {variant_data.get('reason', '')}"
+            )
+            for variant_data in variants_data
+        ]
+    
+    async def _correct_with_json_prompt(self, text: str, actual_model: str) -> List[CorrectionVariant]:
+        """Generate all three variants in a single JSON-mode generation"""
+        async with self._semaphore:
+            response = await self._get_async_client().chat(
+                model=actual_model,
+                messages=[{'role': 'user', 'content': self._create_json_prompt(text)}],
+                format='json',
+                options={'temperature': 0.3, 'num_predict': 600},
+                keep_alive=self.keep_alive
+            )
+        record_token_usage(METRICS_MODEL, response.get('prompt_eval_count'), response.get('eval_count'))
+        with observe_stage("parse", METRICS_MODEL):
+            result = json.loads(response['message']['content'])
+            return self._build_json_variants(result["variants"], actual_model)
     
     async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
         try:
-            client = self._get_client()
+            actual_model = await self._resolve_model()
             
-            # Check if model is available locally
-            available_models = await asyncio.to_thread(client.list)
-            model_names = [model['model'] for model in available_models.get('models', [])]
-            # Use a fallback model if the preferred one isn't available
-            actual_model = self.local_model
-            # logger.info(f"actual_model: {actual_model}")
-            if self.local_model not in model_names:
-                # Try common Japanese models
-                fallback_models = ['qwen2.5:3b-instruct', 'llama3.2:latest', 'gemma2:2b-instruct']
-                for fallback in fallback_models:
-                    if fallback in model_names:
-                        actual_model = fallback
-                        break
-                else:
-                    # If no suitable model found, pull a lightweight one
-                    logger.info(f"Pulling {self.local_model} model...")
-                    await asyncio.to_thread(client.pull, 'qwen2.5:3b-instruct')
-                    actual_model = 'qwen2.5:3b-instruct'
+            if self.mode == "json":
+                return await self._correct_with_json_prompt(text, actual_model)
             
-            # Create prompts for different correction styles
-            prompts = [
-                self._create_formal_prompt(text),
-                self._create_casual_prompt(text),
-                self._create_error_correction_prompt(text)
-            ]
+            prompts = self._create_prompts(text)
+            if self.mode == "parallel":
+                return list(await asyncio.gather(*[
+                    self._generate_variant(i, prompt, text, actual_model)
+                    for i, prompt in enumerate(prompts)
+                ]))
             
             variants = []
-            
             for i, prompt in enumerate(prompts):
-                try:
-                    response = await asyncio.to_thread(
-                        client.chat,
-                        model=actual_model,
-                        messages=[{'role': 'user', 'content': prompt}],
-                        options={'temperature': 0.3, 'num_predict': 200}
-                    )
-                    
-                    corrected_text = response['message']['content'].strip()
-                    
-                    # Extract just the corrected text if the model includes explanation
-                    lines = corrected_text.split('\n')
-                    for line in lines:
-                        if line.strip() and not line.startswith('理由') and not line.startswith('説明'):
-                            corrected_text = line.strip()
-                            break
-                    
-                    type = ["polite", "casual", "corrected"][i]
-                    variant_type = ["丁寧な表現", "カジュアル表現", "誤字・文法修正"][i]
-                    reason = f"ローカルLLM({actual_model})による{variant_type}"
-                    
-                    variants.append(CorrectionVariant(
-                        text=corrected_text,
-                        type=type,
-                        reason=reason
-                    ))
-                    
-                except Exception as e:
-                    logger.error(f"Error generating variant {i+1}: {str(e)}")
-                    # Fallback to original text with error message
-                    variants.append(CorrectionVariant(
-                        text=text,
-                        reason=f"ローカルLLM処理エラー: {str(e)}"
-                    ))
-            
+                variants.append(await self._generate_variant(i, prompt, text, actual_model))
             return variants
             
         except Exception as e:
             logger.error(f"Local LLM service error: {str(e)}")
             # Return fallback variants
             return [
-                CorrectionVariant(text=text, reason=f"ローカルLLMエラー: {str(e)}"),
-                CorrectionVariant(text=text, reason="ローカルLLM利用不可"),
-                CorrectionVariant(text=text, reason="オフライン処理失敗")
+                CorrectionVariant(text=text, type="error", reason=f"ローカルLLMエラー: {str(e)}"),
+                CorrectionVariant(text=text, type="error", reason="ローカルLLM利用不可"),
+                CorrectionVariant(text=text, type="error", reason="オフライン処理失敗")
             ]
     
+    async def stream_correct_japanese_text(self, text: str) -> AsyncIterator[CorrectionVariant]:
+        actual_model = await self._resolve_model()
+        async_client = self._get_async_client()
+        
+        if self.mode == "json":
+            parser = VariantStreamParser()
+            async with self._semaphore:
+                async for part in await async_client.chat(
+                    model=actual_model,
+                    messages=[{'role': 'user', 'content': self._create_json_prompt(text)}],
+                    format='json',
+                    options={'temperature': 0.3, 'num_predict': 600},
+                    keep_alive=self.keep_alive,
+                    stream=True
+                ):
+                    for variant in self._build_json_variants(parser.feed(part['message']['content']), actual_model):
+                        yield variant
+            return
+        
+        prompts = self._create_prompts(text)
+        if self.mode == "parallel":
+            # Yield variants in completion order
+            tasks = [
+                asyncio.create_task(self._generate_variant(i, prompt, text, actual_model))
+                for i, prompt in enumerate(prompts)
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+            return
+        
+        for i, prompt in enumerate(prompts):
+            content = ""
+            async with self._semaphore:
+                async for part in await async_client.chat(
+                    model=actual_model,
+                    messages=[{'role': 'user', 'content': prompt}],
+                    options={'temperature': 0.3, 'num_predict': 200},
+                    keep_alive=self.keep_alive,
+                    stream=True
+                ):
+                    content += part['message']['content']
+            yield self._build_variant(i, content, actual_model)
+    
     def _create_formal_prompt(self, text: str) -> str:
         return f"""以下の日本語テキストを、ビジネスシーンに適した丁寧で正式な表現に修正してください。敬語を適切に使用し、フォーマルな文体にしてください。
 
@@ -120,12 +326,23 @@ class LocalLLMService(BaseAIService):
 原文: {text}
 
 修正されたテキストのみを出力してください。説明は不要です。"""
+
+    def _create_json_prompt(self, text: str) -> str:
+        return f"""以下の日本語テキストを3つの方向性で添削してください。
+
+1. polite: ビジネスシーンに適した丁寧で正式な表現
+2. casual: 親しみやすくカジュアルな表現
+3. corrected: 誤字・脱字・文法エラーのみを修正した表現
+
+原文: {text}
+
+次のJSON形式のみで回答してください：
+{{"variants": [{{"text": "修正後テキスト", "type": "polite", "reason": "修正理由"}}, {{"text": "修正後テキスト", "type": "casual", "reason": "修正理由"}}, {{"text": "修正後テキスト", "type": "corrected", "reason": "修正理由"}}]}}"""
     
     async def is_available(self) -> bool:
         """Check if the local LLM service is available"""
         try:
-            client = self._get_client()
-            await asyncio.to_thread(client.list)
+            await self._get_async_client().list()
             return True
         except Exception as e:
             logger.error(f"Local LLM not available: {str(e)}")
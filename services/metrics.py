@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+from .request_timing import current_timing
+from .tracing import set_span_attributes, start_span
+
+# Styles sent by the frontend; anything else is reported as "other" to bound label cardinality
+KNOWN_STYLES = ("default", "polite", "casual", "corrected", "business")
+
+# USD per million tokens (input, output); override or extend with MODEL_PRICES
+DEFAULT_MODEL_PRICES = {
+    "openai-gpt4o": {"input": 2.5, "output": 10.0},
+    "claude-3-sonnet": {"input": 3.0, "output": 15.0},
+    "local-llm": {"input": 0.0, "output": 0.0}
+}
+MODEL_PRICES = {**DEFAULT_MODEL_PRICES, **json.loads(os.getenv("MODEL_PRICES", "{}"))}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+CORRECTION_SECONDS = Histogram(
+    "correction_duration_seconds",
+    "End-to-end correction latency inside CorrectionService (source: cache, provider, fallback, shared, error)",
+    ["model", "style", "source"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "correction_stage_duration_seconds",
+    "Latency of each correction stage",
+    ["stage", "model"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "correction_cache_lookups_total",
+    "Correction cache lookups by tier and result",
+    ["tier", "result"]
+)
+PROVIDER_CALLS = Counter(
+    "llm_provider_calls_total",
+    "Provider calls by outcome",
+    ["model", "outcome"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by providers",
+    ["model", "direction"]
+)
+LLM_COST = Counter(
+    "llm_cost_usd_total",
+    "Estimated provider cost from token usage and MODEL_PRICES",
+    ["model"]
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop monitor's timer fired; high values mean something blocked the loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+def style_label(correction_style: Optional[str]) -> str:
+    return correction_style if correction_style in KNOWN_STYLES else "other"
+
+def observe_stage_seconds(stage: str, model: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current request's timing"""
+    STAGE_SECONDS.labels(stage=stage, model=model).observe(seconds)
+    timing = current_timing()
+    if timing is not None:
+        timing.add_stage(stage, seconds)
+
+@contextmanager
+def observe_stage(stage: str, model: str = ""):
+    """Time a block as a stage (and trace it as a span), including when it raises"""
+    start_time = time.perf_counter()
+    try:
+        with start_span(stage, {"llm.model": model or None}):
+            yield
+    finally:
+        observe_stage_seconds(stage, model, time.perf_counter() - start_time)
+
+def record_cache_lookup(tier: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(tier=tier, result="hit" if hit else "miss").inc()
+    if not hit:
+        return
+    # Last hit wins: a near-duplicate hit reads its neighbour from L1/L2 first
+    set_span_attributes({"cache.tier": tier})
+    timing = current_timing()
+    if timing is not None:
+        timing.cache_tier = tier
+
+def record_token_usage(model: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+    """Count tokens and their estimated cost; providers call this with the usage from each response"""
+    input_tokens = input_tokens or 0
+    output_tokens = output_tokens or 0
+    LLM_TOKENS.labels(model=model, direction="input").inc(input_tokens)
+    LLM_TOKENS.labels(model=model, direction="output").inc(output_tokens)
+    set_span_attributes({"llm.usage.input_tokens": input_tokens, "llm.usage.output_tokens": output_tokens})
+    timing = current_timing()
+    if timing is not None:
+        timing.add_tokens(input_tokens, output_tokens)
+    prices = MODEL_PRICES.get(model)
+    if prices:
+        LLM_COST.labels(model=model).inc(
+            (input_tokens * prices.get("input", 0.0) + output_tokens * prices.get("output", 0.0)) / 1_000_000
+        )
+
+class ServiceStateCollector(Collector):
+    """Gauges read from the live services at scrape time (breakers, in-flight calls, queues)"""
+
+    def __init__(self, container):
+        self.container = container
+
+    def collect(self):
+        circuit = GaugeMetricFamily(
+            "circuit_breaker_state",
+            "1 for the current breaker state of each model",
+            labels=["model", "state"]
+        )
+        for model_name, health in self.container.error_handler.get_service_health().items():
+            for state in ("closed", "open", "half_open"):
+                circuit.add_metric([model_name, state], 1.0 if health["circuit_state"] == state else 0.0)
+        yield circuit
+
+        in_flight = GaugeMetricFamily("llm_provider_in_flight", "Provider calls in progress", labels=["model"])
+        waiting = GaugeMetricFamily("llm_provider_waiting", "Calls queued for a provider's limits", labels=["model"])
+        for model_name, stats in self.container.correction_service.get_limiter_stats().items():
+            in_flight.add_metric([model_name], stats["in_flight"])
+            waiting.add_metric([model_name], stats["waiting"])
+        yield in_flight
+        yield waiting
+
+        history = self.container.history_writer.get_stats()
+        yield GaugeMetricFamily("history_writer_queue_depth", "History rows waiting to be written", value=history["queue_depth"])
+        yield CounterMetricFamily("history_writer_rows_written", "History rows written", value=history["written"])
+        yield CounterMetricFamily("history_writer_rows_dropped", "History rows dropped because the queue was full", value=history["dropped"])
+        yield GaugeMetricFamily("cache_l1_entries", "Entries in the in-process correction cache", value=len(self.container.cache_service._l1))
+
+def register_service_collector(container) -> ServiceStateCollector:
+    collector = ServiceStateCollector(container)
+    REGISTRY.register(collector)
+    return collector
+
+def unregister_service_collector(collector: ServiceStateCollector) -> None:
+    REGISTRY.unregister(collector)
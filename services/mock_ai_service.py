@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import random
+from typing import AsyncIterator, List, Optional
+from .base_ai_service import BaseAIService
+from .correction_variant import CorrectionVariant
+from .metrics import observe_stage, record_token_usage
+from .rate_limiter import PROMPT_OVERHEAD_TOKENS
+
+# Rough shape of the real providers: median latency, log-normal spread, error rate, output speed
+DEFAULT_MOCK_PROFILES = {
+    "openai-gpt4o": {"latency_ms": 900, "latency_sigma": 0.35, "error_rate": 0.01, "tokens_per_second": 60},
+    "claude-3-sonnet": {"latency_ms": 1200, "latency_sigma": 0.4, "error_rate": 0.01, "tokens_per_second": 50},
+    "local-llm": {"latency_ms": 2500, "latency_sigma": 0.25, "error_rate": 0.0, "tokens_per_second": 25}
+}
+
+def mock_providers_enabled() -> bool:
+    return os.getenv("MOCK_PROVIDERS", "false").lower() == "true"
+
+def load_mock_profiles() -> dict:
+    """Default profiles with MOCK_PROVIDER_PROFILES (JSON, per model) merged over them"""
+    overrides = json.loads(os.getenv("MOCK_PROVIDER_PROFILES", "{}"))
+    return {
+        model_name: {**profile, **overrides.get(model_name, {})}
+        for model_name, profile in DEFAULT_MOCK_PROFILES.items()
+    }
+
+class MockAIService(BaseAIService):
+    """Deterministic stand-in for a provider, for benchmarks and offline development.
+
+    Latencies are drawn from a log-normal distribution around latency_ms and
+    failures happen at error_rate, both from a generator seeded by seed and
+    the model name, so the same request sequence always sees the same
+    latencies and errors. Corrections are derived from the input text.
+    """
+
+    supports_packing = True
+
+    def __init__(
+        self,
+        model_name: str,
+        latency_ms: float = 900,
+        latency_sigma: float = 0.35,
+        error_rate: float = 0.0,
+        tokens_per_second: float = 60,
+        seed: Optional[int] = None
+    ):
+        self._model_name = model_name
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        seed = int(os.getenv("MOCK_SEED", "42")) if seed is None else seed
+        self._rng = random.Random(f"{seed}:{model_name}")
+        self.calls = 0
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    def _sample_latency(self) -> float:
+        return self.latency_ms / 1000 * self._rng.lognormvariate(0, self.latency_sigma)
+
+    def _fails(self) -> bool:
+        return self._rng.random() < self.error_rate
+
+    def _build_variants(self, text: str) -> List[CorrectionVariant]:
+        stripped = text.rstrip("。.!?！？ ")
+        return [
+            CorrectionVariant(text=f"{stripped}でございます。", type="polite", reason="より丁寧な表現に変換（モック）"),
+            CorrectionVariant(text=f"{stripped}だよ！", type="casual", reason="親しみやすい表現に変換（モック）"),
+            CorrectionVariant(text=f"{stripped}です。", type="corrected", reason="誤字を修正し適切な敬語に変換（モック）")
+        ]
+
+    def _record_usage(self, texts: List[str]) -> None:
+        input_tokens = PROMPT_OVERHEAD_TOKENS // 2 + sum(len(text) for text in texts)
+        record_token_usage(self.model_name, input_tokens, sum(3 * len(text) + 60 for text in texts))
+
+    async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
+        self.calls += 1
+        await asyncio.sleep(self._sample_latency())
+        if self._fails():
+            # Real providers report failures as error variants, not exceptions
+            return [CorrectionVariant(text=text, type="error", reason="AI処理エラー: mock provider failure")]
+        self._record_usage([text])
+        with observe_stage("parse", self.model_name):
+            return self._build_variants(text)
+
+    async def correct_japanese_texts(self, texts: List[str]) -> List[Optional[List[CorrectionVariant]]]:
+        self.calls += 1
+        # A packed prompt costs more output time, but shares the round trip
+        await asyncio.sleep(self._sample_latency() * (1 + 0.25 * (len(texts) - 1)))
+        if self._fails():
+            raise RuntimeError("mock provider failure")
+        self._record_usage(texts)
+        return [self._build_variants(text) for text in texts]
+
+    async def stream_correct_japanese_text(self, text: str) -> AsyncIterator[CorrectionVariant]:
+        self.calls += 1
+        # Time to first token, then each variant at the configured output rate
+        await asyncio.sleep(self._sample_latency() * 0.3)
+        if self._fails():
+            raise RuntimeError("mock provider failure")
+        for variant in self._build_variants(text):
+            await asyncio.sleep((len(variant.text) + len(variant.reason) + 20) / self.tokens_per_second)
+            yield variant
+        self._record_usage([text])
@@ -0,0 +1,158 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from .error_handler import CIRCUIT_OPEN, error_handler
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ("preference", "adaptive")
+FALLBACK_MODELS = ["openai-gpt4o", "claude-3-sonnet", "local-llm"]
+
+class ModelStats:
+    """Rolling latency and outcome samples for one model"""
+
+    def __init__(self, window: int):
+        # (latency seconds, succeeded)
+        self._samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.last_updated: Optional[float] = None
+
+    def record(self, latency: float, ok: bool) -> None:
+        self._samples.append((latency, ok))
+        self.last_updated = time.time()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, math.ceil(p / 100 * len(latencies)) - 1))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+class ModelRouter:
+    """Order candidate models for a request.
+
+    In "preference" mode the requested model comes first, followed by the
+    fixed fallback order. In "adaptive" mode, models in the adaptive pool are
+    ranked by rolling p95 latency among those that are healthy (circuit not
+    open, error rate within bounds). The requested model keeps first place
+    unless it is unhealthy or more than switch_ratio times slower than the
+    fastest alternative. Models outside the pool (e.g. the offline local LLM)
+    are never swapped in or out by latency.
+    """
+
+    def __init__(
+        self,
+        mode: str = "preference",
+        adaptive_models: Optional[List[str]] = None,
+        window: int = 200,
+        min_samples: int = 20,
+        max_error_rate: float = 0.5,
+        switch_ratio: float = 1.5,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_default_delay: float = 2.0,
+        hedge_min_delay: float = 0.05
+    ):
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode: {mode}")
+        self.mode = mode
+        self.adaptive_models = adaptive_models or ["openai-gpt4o", "claude-3-sonnet"]
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.switch_ratio = switch_ratio
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self._stats: Dict[str, ModelStats] = {}
+        self.hedges_issued = 0
+        self.hedge_wins = 0
+
+    def _get_stats(self, model_name: str) -> ModelStats:
+        if model_name not in self._stats:
+            self._stats[model_name] = ModelStats(self.window)
+        return self._stats[model_name]
+
+    def record(self, model_name: str, latency: float, ok: bool) -> None:
+        self._get_stats(model_name).record(latency, ok)
+
+    def record_hedge(self, won: bool) -> None:
+        self.hedges_issued += 1
+        if won:
+            self.hedge_wins += 1
+
+    def _p95(self, model_name: str) -> Optional[float]:
+        stats = self._stats.get(model_name)
+        if stats is None or len(stats) < self.min_samples:
+            return None
+        return stats.percentile(95)
+
+    def is_healthy(self, model_name: str) -> bool:
+        if error_handler.get_circuit_state(model_name) == CIRCUIT_OPEN:
+            return False
+        stats = self._stats.get(model_name)
+        if stats is None or len(stats) < self.min_samples:
+            return True
+        return stats.error_rate() <= self.max_error_rate
+
+    def rank(self, model_name: str) -> List[str]:
+        """Candidate models for a request, best first"""
+        preference = [model_name] + [m for m in FALLBACK_MODELS if m != model_name]
+        if self.mode != "adaptive" or model_name not in self.adaptive_models:
+            return preference
+
+        def sort_key(candidate: str):
+            p95 = self._p95(candidate)
+            # Healthy first, then by p95; models without enough samples rank after measured ones
+            return (not self.is_healthy(candidate), p95 is None, p95 or 0.0)
+
+        pool = sorted((m for m in preference if m in self.adaptive_models), key=sort_key)
+        requested_p95 = self._p95(model_name)
+        best_p95 = self._p95(pool[0])
+        keep_requested = self.is_healthy(model_name) and (
+            requested_p95 is None or best_p95 is None or requested_p95 <= best_p95 * self.switch_ratio
+        )
+        if keep_requested:
+            pool.remove(model_name)
+            pool.insert(0, model_name)
+        return pool + [m for m in preference if m not in self.adaptive_models]
+
+    def hedge_delay(self, model_name: str) -> float:
+        """How long to wait for a model before hedging to another"""
+        stats = self._stats.get(model_name)
+        delay = None
+        if stats is not None and len(stats) >= self.min_samples:
+            delay = stats.percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_default_delay
+        return max(delay, self.hedge_min_delay)
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "adaptive_models": self.adaptive_models,
+            "hedge": self.hedge,
+            "hedges_issued": self.hedges_issued,
+            "hedge_wins": self.hedge_wins,
+            "models": {
+                model_name: {
+                    "samples": len(stats),
+                    "p50_ms": round(stats.percentile(50) * 1000, 1) if stats.percentile(50) is not None else None,
+                    "p95_ms": round(stats.percentile(95) * 1000, 1) if stats.percentile(95) is not None else None,
+                    "p99_ms": round(stats.percentile(99) * 1000, 1) if stats.percentile(99) is not None else None,
+                    "error_rate": round(stats.error_rate(), 4),
+                    "healthy": self.is_healthy(model_name)
+                }
+                for model_name, stats in self._stats.items()
+            }
+        }
@@ -1,26 +1,19 @@
 import os
 from openai import AsyncOpenAI
-from typing import List
+from typing import AsyncIterator, List, Optional
 from pydantic import BaseModel
 import logging
-from .base_ai_service import BaseAIService
+from .base_ai_service import PACKED_SYSTEM_PROMPT, BaseAIService, build_packed_prompt, parse_packed_results
+from .variant_stream_parser import VariantStreamParser
 from .correction_variant import CorrectionVariant
+from .metrics import observe_stage, record_token_usage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 
-class OpenAIService(BaseAIService):
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-        self.client = AsyncOpenAI(api_key=api_key)
-    
-    async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
-        system_prompt = """
+SYSTEM_PROMPT = """
 あなたは日本語ビジネス文書の添削専門家です。以下の文章を3つの方向性で添削してください：
 
 1. 丁寧な表現版: より敬語を使った丁寧な表現に変換
@@ -41,12 +34,23 @@ JSON形式で回答してください：
   ]
 }
 """
-        
+
+class OpenAIService(BaseAIService):
+    supports_packing = True
+    
+    def __init__(self):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+        self.client = AsyncOpenAI(api_key=api_key)
+    
+    async def correct_japanese_text(self, text: str) -> List[CorrectionVariant]:
         try:
             response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": f"以下の文章を添削してください：\n{text}"}
                 ],
                 response_format={"type": "json_object"},
@@ -56,17 +60,20 @@ JSON形式で回答してください：
             content = response.choices[0].message.content
             logging.info(f"Response: {content}")
             # print(f"Content repr: {repr(content)}")
+            if response.usage:
+                record_token_usage(self.model_name, response.usage.prompt_tokens, response.usage.completion_tokens)
 
             import json
-            result = json.loads(content)
-            
-            variants = []
-            for variant_data in result["variants"]:
-                variants.append(CorrectionVariant(
-                    text=variant_data["text"],
-                    type=variant_data["type"],
-                    reason=variant_data["reason"]
-                ))
+            with observe_stage("parse", self.model_name):
+                result = json.loads(content)
+                
+                variants = []
+                for variant_data in result["variants"]:
+                    variants.append(CorrectionVariant(
+                        text=variant_data["text"],
+                        type=variant_data["type"],
+                        reason=variant_data["reason"]
+                    ))
             
             return variants
             
@@ -79,6 +86,55 @@ JSON形式で回答してください：
                 )
             ]
     
+    async def correct_japanese_texts(self, texts: List[str]) -> List[Optional[List[CorrectionVariant]]]:
+        response = await self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+                {"role": "user", "content": build_packed_prompt(texts)}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            max_tokens=10000
+        )
+        if response.usage:
+            record_token_usage(self.model_name, response.usage.prompt_tokens, response.usage.completion_tokens)
+        with observe_stage("parse", self.model_name):
+            return parse_packed_results(response.choices[0].message.content, len(texts))
+    
+    async def stream_correct_japanese_text(self, text: str) -> AsyncIterator[CorrectionVariant]:
+        parser = VariantStreamParser()
+        stream = await self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"以下の文章を添削してください：\n{text}"}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            max_tokens=10000,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                # Sent in a final chunk without choices
+                record_token_usage(self.model_name, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                for variant_data in parser.feed(delta):
+                    yield CorrectionVariant(
+                        text=variant_data["text"],
+                        type=variant_data["type"],
+                        reason=variant_data["reason"]
+                    )
+    
     @property
     def model_name(self) -> str:
-        return "openai-gpt4o"
\ No newline at end of file
+        return "openai-gpt4o"
+    
+    async def close(self) -> None:
+        """Close the underlying HTTP client"""
+        await self.client.close()
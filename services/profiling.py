@@ -0,0 +1,307 @@
+import asyncio
+import html
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from opentelemetry import trace
+from .metrics import EVENT_LOOP_LAG_SECONDS
+from .request_timing import RequestTiming
+
+logger = logging.getLogger(__name__)
+
+class ProfilerRunningError(RuntimeError):
+    """A profile is already being recorded"""
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """On-demand sampling profiler for the running process.
+
+    A background thread snapshots the stack of the event loop thread (or of
+    every thread) at a fixed interval and counts identical stacks, so the
+    overhead is bounded by the interval and nothing is traced per call. The
+    result is kept until the next profile starts and can be rendered as
+    collapsed stacks or an SVG flamegraph.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 300):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._started_at: Optional[datetime] = None
+        self._finished_at: Optional[datetime] = None
+        self._settings: dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: Optional[float] = None, all_threads: bool = False) -> dict:
+        """Start sampling for the given number of seconds; call from the event loop thread"""
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self.max_seconds}")
+        interval = interval or self.interval
+        if not 0.001 <= interval <= 1:
+            raise ValueError("interval must be between 1ms and 1s")
+        if self.running:
+            raise ProfilerRunningError("A profile is already running")
+
+        with self._lock:
+            self._stacks = Counter()
+            self._samples = 0
+        self._started_at = datetime.utcnow()
+        self._finished_at = None
+        self._settings = {"seconds": seconds, "interval_ms": interval * 1000, "all_threads": all_threads}
+        self._stop.clear()
+        target = None if all_threads else threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._run, args=(time.monotonic() + seconds, interval, target),
+            name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Sampling profiler started for {seconds}s")
+        return self.get_stats()
+
+    def stop(self) -> dict:
+        """Stop early; the samples collected so far are kept"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.get_stats()
+
+    def _run(self, deadline: float, interval: float, target: Optional[int]) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            sampled = {target: frames.get(target)} if target is not None else frames
+            with self._lock:
+                for thread_id, frame in sampled.items():
+                    if frame is None or thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                    self._stacks[";".join(reversed(stack))] += 1
+                self._samples += 1
+        self._finished_at = datetime.utcnow()
+        logger.info(f"Sampling profiler finished with {self._samples} samples")
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def flamegraph_svg(self) -> str:
+        with self._lock:
+            stacks = dict(self._stacks)
+        title = f"Profile {self._started_at:%Y-%m-%d %H:%M:%S} UTC, {self._samples} samples" if self._started_at else "Profile"
+        return render_flamegraph(stacks, title)
+
+    def has_profile(self) -> bool:
+        return self._samples > 0
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self._started_at.isoformat() if self._started_at else None,
+            "finished_at": self._finished_at.isoformat() if self._finished_at else None,
+            "samples": self._samples,
+            "unique_stacks": len(self._stacks),
+            **self._settings
+        }
+
+def render_flamegraph(stacks: Dict[str, int], title: str, width: int = 1200) -> str:
+    """Render collapsed stacks as a self-contained SVG flamegraph (root at the bottom)"""
+    root = {"count": 0, "children": {}}
+    depth = 0
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        frames = stack.split(";")
+        depth = max(depth, len(frames))
+        for name in frames:
+            node = node["children"].setdefault(name, {"count": 0, "children": {}})
+            node["count"] += count
+
+    row, top = 16, 30
+    height = top + depth * row + 10
+    total = root["count"] or 1
+    rects = []
+
+    def place(name: str, node: dict, x: float, level: int) -> None:
+        frame_width = node["count"] / total * width
+        if frame_width < 0.5:
+            return
+        y = height - 10 - (level + 1) * row
+        # Warm colours, stable per frame name so repeated profiles are comparable
+        hue = zlib.crc32(name.encode()) % 55
+        label = html.escape(name)
+        tooltip = f"{label} — {node['count']} samples ({node['count'] / total:.1%})"
+        chars = int(frame_width / 7)
+        text = html.escape(name if len(name) <= chars else name[:max(chars - 2, 0)] + "..") if chars >= 3 else ""
+        rects.append(
+            f'<g><title>{tooltip}</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{frame_width:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row - 4}">{text}</text></g>'
+        )
+        child_x = x
+        for child_name, child in sorted(node["children"].items()):
+            place(child_name, child, child_x, level + 1)
+            child_x += child["count"] / total * width
+
+    x = 0.0
+    for name, node in sorted(root["children"].items()):
+        place(name, node, x, 0)
+        x += node["count"] / total * width
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<text x="{width / 2}" y="18" text-anchor="middle" font-size="14">{html.escape(title)}</text>'
+        + "".join(rects) + "</svg>\n"
+    )
+
+class SlowRequestLog:
+    """Ring buffer of requests slower than a threshold, with their stage timings"""
+
+    def __init__(self, threshold: float = 2.0, capacity: int = 100):
+        self.threshold = threshold
+        self._entries: deque = deque(maxlen=capacity)
+        self.captured = 0
+
+    def observe(self, request, status: int, route: str, timing: RequestTiming) -> None:
+        elapsed = timing.elapsed()
+        if elapsed < self.threshold:
+            return
+        span_context = trace.get_current_span().get_span_context()
+        self._entries.append({
+            "at": datetime.utcnow().isoformat(),
+            "method": request.method,
+            "path": request.url.path,
+            "route": route,
+            "query": str(request.url.query) or None,
+            "path_params": dict(request.path_params),
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "trace_id": format(span_context.trace_id, "032x") if span_context.is_valid else None,
+            "timing": timing.to_meta()
+        })
+        self.captured += 1
+
+    def entries(self, limit: Optional[int] = None) -> List[dict]:
+        """Newest first"""
+        entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "capacity": self._entries.maxlen,
+            "buffered": len(self._entries),
+            "captured": self.captured
+        }
+
+class EventLoopMonitor:
+    """Measures event loop lag and logs what the loop was running when it stalled.
+
+    A task sleeps for interval and records how late it woke up. A watchdog
+    thread notices when that task hasn't run for longer than threshold and
+    snapshots the loop thread's stack while it is still blocked, so the log
+    points at the blocking call rather than at whatever ran afterwards.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, max_stalls: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = 0.0
+        self._blocked_stack: Optional[List[str]] = None
+        self._stalls: deque = deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _tick(self) -> None:
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._heartbeat - self.interval)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, lag: float) -> None:
+        stack, self._blocked_stack = self._blocked_stack, None
+        self.stall_count += 1
+        self._stalls.append({"at": datetime.utcnow().isoformat(), "lag_ms": round(lag * 1000, 1), "stack": stack})
+        if stack:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms in:\n" + "".join(stack))
+        else:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms (too short to capture the stack)")
+
+    def _watch(self) -> None:
+        # Check often enough to catch any stall longer than the threshold while it is happening
+        check_interval = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(check_interval):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled >= self.threshold and self._blocked_stack is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    # The innermost frames are the blocking call; keep the last 15
+                    self._blocked_stack = traceback.format_stack(frame)[-15:]
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stall_count,
+            "recent_stalls": list(reversed(self._stalls))
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from .cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+# System prompt plus three variants of output, on top of the text itself
+PROMPT_OVERHEAD_TOKENS = 600
+
+DEFAULT_PROVIDER_LIMITS = {
+    "openai-gpt4o": {"max_concurrency": 20, "requests_per_minute": 500, "tokens_per_minute": 150000},
+    "claude-3-sonnet": {"max_concurrency": 10, "requests_per_minute": 50, "tokens_per_minute": 40000},
+    "local-llm": {"max_concurrency": 4, "requests_per_minute": 0, "tokens_per_minute": 0}
+}
+
+# Refill then take; returns the seconds to wait (as a string to keep the fraction), 0 when granted
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Rough token cost of one correction (Japanese is about one token per character)"""
+    return PROMPT_OVERHEAD_TOKENS + 4 * len(text)
+
+class RateLimitExceeded(Exception):
+    """Raised when a provider call would wait longer than the limiter allows"""
+
+class TokenBucket:
+    """Per-minute budget refilled continuously; kept in Redis when shared across workers"""
+
+    def __init__(self, name: str, per_minute: int, cache_service: Optional[CacheService] = None):
+        self.name = name
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.cache_service = cache_service
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _try_take_local(self, amount: float) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    async def _try_take(self, amount: float) -> float:
+        if self.cache_service is not None:
+            wait = await self.cache_service.run_script(
+                _TOKEN_BUCKET_SCRIPT,
+                [f"ratelimit:{self.name}"],
+                [self.capacity, self.rate, time.time(), amount]
+            )
+            if wait is not None:
+                return float(wait)
+        return self._try_take_local(amount)
+
+    async def take(self, amount: float, deadline: float) -> None:
+        """Wait until amount is available, or raise RateLimitExceeded if that would pass deadline"""
+        amount = min(amount, self.capacity)
+        while True:
+            wait = await self._try_take(amount)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"{self.name} budget exhausted")
+            await asyncio.sleep(wait)
+
+class ProviderLimiter:
+    """Bound in-flight calls, requests/min and tokens/min for one provider.
+
+    max_concurrency is enforced per worker process; the per-minute budgets
+    are shared through Redis when a cache service is given and reachable.
+    A limit of 0 disables it. Callers that would wait longer than max_wait
+    get RateLimitExceeded instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 0,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_wait: float = 10.0,
+        cache_service: Optional[CacheService] = None
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._requests = TokenBucket(f"{name}:requests", requests_per_minute, cache_service) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(f"{name}:tokens", tokens_per_minute, cache_service) if tokens_per_minute > 0 else None
+        self.waiting = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.rejected = 0
+        self._total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    @asynccontextmanager
+    async def acquire(self, tokens: int = 0):
+        start_time = time.monotonic()
+        deadline = start_time + self.max_wait
+        holds_slot = False
+        self.waiting += 1
+        try:
+            if self._semaphore is not None:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    raise RateLimitExceeded(f"{self.name} concurrency limit reached")
+                holds_slot = True
+            if self._requests is not None:
+                await self._requests.take(1, deadline)
+            if self._tokens is not None and tokens:
+                await self._tokens.take(tokens, deadline)
+        except BaseException as e:
+            if holds_slot:
+                self._semaphore.release()
+            if isinstance(e, RateLimitExceeded):
+                self.rejected += 1
+                logger.warning(f"Rate limit for {self.name}: {str(e)}")
+            raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start_time
+        self.acquired += 1
+        self._total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if holds_slot:
+                self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self._requests.capacity if self._requests else 0,
+            "tokens_per_minute": self._tokens.capacity if self._tokens else 0,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "avg_queue_ms": round(self._total_wait / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "max_queue_ms": round(self.max_wait_seen * 1000, 2)
+        }
+
+class ProviderLimiters:
+    """ProviderLimiter per model name; models without a configuration are unlimited"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, dict]] = None,
+        max_wait: float = 10.0,
+        cache_service: Optional[CacheService] = None
+    ):
+        limits = DEFAULT_PROVIDER_LIMITS if limits is None else limits
+        self._limiters = {
+            model_name: ProviderLimiter(model_name, max_wait=max_wait, cache_service=cache_service, **config)
+            for model_name, config in limits.items()
+        }
+
+    @asynccontextmanager
+    async def acquire(self, model_name: str, text: str):
+        limiter = self._limiters.get(model_name)
+        if limiter is None:
+            yield
+            return
+        async with limiter.acquire(estimate_tokens(text)):
+            yield
+
+    def get_stats(self) -> dict:
+        return {model_name: limiter.get_stats() for model_name, limiter in self._limiters.items()}
@@ -0,0 +1,71 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+class RequestTiming:
+    """Where the time of one request went, filled in along the correction path.
+
+    Stages that run more than once (retries, hedged calls, batch items) are
+    summed. Tasks started while a timing is active share it, because the
+    context is copied with a reference to the same object.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.model: Optional[str] = None
+        self.source: Optional[str] = None
+        self.cache_tier: Optional[str] = None
+        self.fallback_from: Optional[str] = None
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        self.tokens_in += input_tokens
+        self.tokens_out += output_tokens
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def to_meta(self) -> dict:
+        stages_ms = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        return {
+            "model": self.model,
+            "source": self.source,
+            # A tier is only meaningful when the answer actually came from the cache
+            "cache_tier": self.cache_tier if self.source == "cache" else None,
+            "fallback_from": self.fallback_from,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "provider_ms": stages_ms.get("provider_call"),
+            "queue_ms": stages_ms.get("queue_wait"),
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "stages_ms": stages_ms
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: one metric per stage plus the total"""
+        metrics = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        if self.source == "cache" and self.cache_tier:
+            metrics.append(f'cache;desc="{self.cache_tier}"')
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+_current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+def current_timing() -> Optional[RequestTiming]:
+    """The timing of the request being handled, or None outside one"""
+    return _current_timing.get()
+
+@contextmanager
+def track_timing():
+    timing = RequestTiming()
+    token = _current_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _current_timing.reset(token)
@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+from typing import Optional
+from .ai_model_factory import AIModelFactory
+from .cache_service import CacheService
+from .similarity_index import SimilarityIndex
+from .correction_service import CorrectionService
+from .batch_job_service import BatchJobService
+from .error_handler import ErrorHandler, error_handler
+from .history_writer import HistoryWriter
+from .history_service import HistoryService
+from .history_retention import HistoryRetentionService
+from .user_settings_cache import UserSettingsCache
+from .local_llm_service import LocalLLMService
+from .model_router import ModelRouter
+from .profiling import EventLoopMonitor, SamplingProfiler, SlowRequestLog
+from .rate_limiter import DEFAULT_PROVIDER_LIMITS, ProviderLimiters
+from database.models import create_tables, engine
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """Process-wide service graph shared by all requests"""
+
+    def __init__(self):
+        self.ai_factory = AIModelFactory()
+        self.cache_service = CacheService(
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379"),
+            default_ttl=int(os.getenv("CACHE_TTL", "3600")),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "1.0")),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0")),
+            l1_max_entries=int(os.getenv("CACHE_L1_MAX_ENTRIES", "1000")),
+            l1_max_bytes=int(os.getenv("CACHE_L1_MAX_BYTES", str(16 * 1024 * 1024))),
+            l1_ttl=float(os.getenv("CACHE_L1_TTL", "300")),
+            canonicalize=os.getenv("CACHE_CANONICALIZE", "true").lower() == "true",
+            similarity_index=SimilarityIndex(
+                threshold=float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.8")),
+                max_entries=int(os.getenv("CACHE_SIMILARITY_MAX_ENTRIES", "10000"))
+            ) if os.getenv("CACHE_SIMILARITY_ENABLED", "false").lower() == "true" else None
+        )
+        self.error_handler: ErrorHandler = error_handler
+        self.engine = engine
+        self.history_writer = HistoryWriter(
+            max_queue_size=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+            flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "500")) / 1000,
+            drop_policy=os.getenv("HISTORY_DROP_POLICY", "drop_newest")
+        )
+        self.history_service = HistoryService(
+            count_cache_ttl=float(os.getenv("HISTORY_COUNT_CACHE_TTL", "30"))
+        )
+        self.history_retention = HistoryRetentionService(
+            archive_dir=os.getenv("HISTORY_ARCHIVE_DIR", "./history_archive"),
+            max_age_days=int(os.getenv("HISTORY_MAX_AGE_DAYS", "0")),
+            max_rows_per_user=int(os.getenv("HISTORY_MAX_ROWS_PER_USER", "0")),
+            batch_size=int(os.getenv("HISTORY_RETENTION_BATCH_SIZE", "500")),
+            interval=float(os.getenv("HISTORY_RETENTION_INTERVAL", "3600")),
+            cache_service=self.cache_service,
+            lock_ttl=float(os.getenv("HISTORY_RETENTION_LOCK_TTL", "3600"))
+        )
+        self.settings_cache = UserSettingsCache(
+            cache_service=self.cache_service if os.getenv("SETTINGS_CACHE_REDIS", "false").lower() == "true" else None,
+            ttl=float(os.getenv("SETTINGS_CACHE_TTL", "60"))
+        )
+        self.correction_service = CorrectionService(
+            ai_factory=self.ai_factory,
+            cache_service=self.cache_service,
+            history_writer=self.history_writer,
+            settings_cache=self.settings_cache,
+            distributed_single_flight=os.getenv("SINGLE_FLIGHT_DISTRIBUTED", "false").lower() == "true",
+            single_flight_lock_ttl=float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "30")),
+            batch_concurrency=int(os.getenv("BATCH_CONCURRENCY", "8")),
+            batch_max_items=int(os.getenv("BATCH_MAX_ITEMS", "1000")),
+            batch_pack_size=int(os.getenv("BATCH_PACK_SIZE", "4")),
+            batch_pack_max_chars=int(os.getenv("BATCH_PACK_MAX_CHARS", "150")),
+            limiters=ProviderLimiters(
+                limits={**DEFAULT_PROVIDER_LIMITS, **json.loads(os.getenv("PROVIDER_LIMITS", "{}"))},
+                max_wait=float(os.getenv("PROVIDER_LIMIT_MAX_WAIT", "10")),
+                cache_service=self.cache_service if os.getenv("PROVIDER_LIMITS_REDIS", "true").lower() == "true" else None
+            ),
+            router=ModelRouter(
+                mode=os.getenv("ROUTING_MODE", "preference"),
+                adaptive_models=[m.strip() for m in os.getenv("ROUTER_MODELS", "openai-gpt4o,claude-3-sonnet").split(",") if m.strip()],
+                window=int(os.getenv("ROUTER_WINDOW", "200")),
+                min_samples=int(os.getenv("ROUTER_MIN_SAMPLES", "20")),
+                max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5")),
+                switch_ratio=float(os.getenv("ROUTER_SWITCH_RATIO", "1.5")),
+                hedge=os.getenv("ROUTER_HEDGE", "false").lower() == "true",
+                hedge_percentile=float(os.getenv("ROUTER_HEDGE_PERCENTILE", "95")),
+                hedge_default_delay=float(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY", "2.0"))
+            )
+        )
+        self.batch_jobs = BatchJobService(
+            correction_service=self.correction_service,
+            chunk_size=int(os.getenv("BATCH_JOB_CHUNK_SIZE", "50")),
+            poll_interval=float(os.getenv("BATCH_JOB_POLL_INTERVAL", "1.0")),
+            lease_seconds=float(os.getenv("BATCH_JOB_LEASE_SECONDS", "300")),
+            max_items=int(os.getenv("BATCH_JOB_MAX_ITEMS", "100000")),
+            max_chunk_attempts=int(os.getenv("BATCH_JOB_CHUNK_ATTEMPTS", "5")),
+            retry_delay=float(os.getenv("BATCH_JOB_RETRY_DELAY", "5.0")),
+            rate_limit_delay=float(os.getenv("BATCH_JOB_RATE_LIMIT_DELAY", "10.0")),
+            rate_limit_timeout=float(os.getenv("BATCH_JOB_RATE_LIMIT_TIMEOUT", "1800"))
+        )
+        self.profiler = SamplingProfiler(
+            interval=float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000,
+            max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+        )
+        self.slow_requests = SlowRequestLog(
+            threshold=float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000")) / 1000,
+            capacity=int(os.getenv("SLOW_REQUEST_CAPACITY", "100"))
+        )
+        self.loop_monitor = EventLoopMonitor(
+            interval=float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000,
+            threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+        )
+
+    async def startup(self, worker: bool = False) -> None:
+        """Prepare shared resources before serving requests.
+
+        A standalone batch worker (worker=True) only starts what correcting
+        jobs needs; retention, the event loop monitor and the local model
+        warm-up stay with the API processes.
+        """
+        await create_tables()
+        self.history_writer.start()
+        if worker:
+            logger.info("Service container started for a batch worker")
+            return
+        if os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true":
+            self.loop_monitor.start()
+        if os.getenv("HISTORY_RETENTION_SCHEDULED", "true").lower() == "true":
+            self.history_retention.start()
+        if os.getenv("BATCH_JOB_WORKER_EMBEDDED", "true").lower() == "true":
+            # Otherwise jobs are processed by separate batch_worker.py processes
+            self.batch_jobs.start()
+        if os.getenv("LOCAL_LLM_WARMUP", "true").lower() == "true":
+            # Resolve and load the offline model before the first user request
+            local_llm = self.ai_factory.get_model("local-llm")
+            if isinstance(local_llm, LocalLLMService):
+                await local_llm.start()
+        logger.info("Service container started")
+
+    async def shutdown(self) -> None:
+        """Release shared resources at process shutdown"""
+        # Flush buffered history before the engine goes away
+        await self.batch_jobs.stop()
+        await self.history_retention.close()
+        await self.history_writer.stop()
+        await self.cache_service.close()
+        await self.ai_factory.close_all()
+        await self.engine.dispose()
+        self.profiler.stop()
+        await self.loop_monitor.stop()
+        logger.info("Service container stopped")
+
+_container: Optional[ServiceContainer] = None
+
+async def init_container(worker: bool = False) -> ServiceContainer:
+    """Build and start the process-wide container (idempotent)"""
+    global _container
+    if _container is None:
+        _container = ServiceContainer()
+        await _container.startup(worker=worker)
+    return _container
+
+def get_container() -> ServiceContainer:
+    """Return the running container"""
+    if _container is None:
+        raise RuntimeError("Service container is not initialized")
+    return _container
+
+async def shutdown_container() -> None:
+    """Shut down and discard the process-wide container"""
+    global _container
+    if _container is not None:
+        await _container.shutdown()
+        _container = None
@@ -0,0 +1,200 @@
+import difflib
+import hashlib
+import random
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+# Spaces next to Japanese (non-ASCII) characters carry no meaning
+_SPACE_AROUND_WIDE = re.compile(r" ?([^\x00-\x7f]) ?")
+# Only a plain full stop is dropped; "?" and "!" change what the sentence means
+_TRAILING_PUNCTUATION = re.compile(r"[\s。.]+$")
+_MERSENNE_PRIME = (1 << 61) - 1
+# Shorter differing spans are too ambiguous to carry over into corrected text
+MIN_SUBSTITUTION_LENGTH = 2
+
+def canonicalize_text(text: str) -> str:
+    """Fold differences that don't change what needs correcting.
+
+    NFKC unifies full-/half-width forms, whitespace collapses to one space
+    between ASCII words and disappears next to Japanese text, and a
+    sentence-final "。" or "." is dropped.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    text = _SPACE_AROUND_WIDE.sub(r"\1", text)
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def _char_class(char: str) -> str:
+    """Script of a character; a token is a run of one script (Japanese has no word spaces)"""
+    if char.isdigit():
+        return "digit"
+    if char.isascii() and char.isalpha():
+        return "latin"
+    name = unicodedata.name(char, "")
+    if name.startswith("CJK UNIFIED") or char in "々〆":
+        return "kanji"
+    if name.startswith("HIRAGANA"):
+        return "hiragana"
+    if name.startswith("KATAKANA") or char == "ー":
+        return "katakana"
+    return "other"
+
+def _is_boundary(text: str, index: int) -> bool:
+    """Whether a token boundary falls between text[index - 1] and text[index]"""
+    if index <= 0 or index >= len(text):
+        return True
+    return _char_class(text[index - 1]) != _char_class(text[index])
+
+def _token_spans(source: str, target: str) -> List[Tuple[int, int, int, int]]:
+    """Differing (i1, i2, j1, j2) spans between source and target, widened to whole tokens"""
+    spans = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, source, target, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        # The text around a difference is shared, so widening moves both sides together
+        while i1 > 0 and j1 > 0 and not (_is_boundary(source, i1) and _is_boundary(target, j1)):
+            i1, j1 = i1 - 1, j1 - 1
+        while i2 < len(source) and j2 < len(target) and not (_is_boundary(source, i2) and _is_boundary(target, j2)):
+            i2, j2 = i2 + 1, j2 + 1
+        if spans and i1 <= spans[-1][1]:
+            # Two differences inside one token become one span
+            i1, j1 = spans[-1][0], spans[-1][2]
+            spans.pop()
+        spans.append((i1, i2, j1, j2))
+    return spans
+
+def substitute_differences(source: str, target: str, texts: List[str]) -> Optional[List[str]]:
+    """Rewrite texts derived from source so they derive from target instead.
+
+    Differences are widened to whole tokens (runs of one script) and must be
+    at least MIN_SUBSTITUTION_LENGTH characters, so a changed verb ending is
+    never spliced into a different conjugation. Each differing token must
+    occur exactly once in each text, as a whole token (e.g. a name carried
+    over into each corrected variant); otherwise None is returned because
+    the texts can't be adapted safely.
+    """
+    spans = _token_spans(source, target)
+    adapted = []
+    for text in texts:
+        for i1, i2, j1, j2 in spans:
+            old, new = source[i1:i2], target[j1:j2]
+            if min(len(old), len(new)) < MIN_SUBSTITUTION_LENGTH or text.count(old) != 1:
+                return None
+            index = text.index(old)
+            if not (_is_boundary(text, index) and _is_boundary(text, index + len(old))):
+                return None
+            text = text[:index] + new + text[index + len(old):]
+        adapted.append(text)
+    return adapted
+
+class SimilarityIndex:
+    """In-process MinHash/LSH index over character n-grams of canonical text.
+
+    Maps near-duplicate texts to the cache key of a previously cached
+    correction. Entries are grouped by namespace (model and style) and the
+    least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 10000,
+        ngram: int = 3,
+        num_perm: int = 64,
+        bands: int = 16,
+        seed: int = 1
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self._rows = num_perm // bands
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        # cache_key -> (namespace, signature, original text)
+        self._entries: "OrderedDict[str, Tuple[str, Tuple[int, ...], str]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def _shingles(self, text: str) -> Set[str]:
+        canonical = canonicalize_text(text)
+        if len(canonical) <= self.ngram:
+            return {canonical}
+        return {canonical[i:i + self.ngram] for i in range(len(canonical) - self.ngram + 1)}
+
+    def _signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+            for shingle in self._shingles(text)
+        ]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, namespace: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield (namespace, band, signature[band * self._rows:(band + 1) * self._rows])
+
+    def add(self, namespace: str, text: str, cache_key: str) -> None:
+        self.discard(cache_key)
+        signature = self._signature(text)
+        self._entries[cache_key] = (namespace, signature, text)
+        for band_key in self._band_keys(namespace, signature):
+            self._buckets.setdefault(band_key, set()).add(cache_key)
+        while len(self._entries) > self.max_entries:
+            self.discard(next(iter(self._entries)))
+
+    def discard(self, cache_key: str) -> None:
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        namespace, signature, _ = entry
+        for band_key in self._band_keys(namespace, signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(cache_key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, namespace: str, text: str) -> Optional[Tuple[str, str, float]]:
+        """Return (cache_key, original text, similarity) of the closest entry above threshold"""
+        self.lookups += 1
+        signature = self._signature(text)
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(namespace, signature):
+            candidates.update(self._buckets.get(band_key, ()))
+
+        best = None
+        for cache_key in candidates:
+            _, candidate_signature, original_text = self._entries[cache_key]
+            similarity = sum(a == b for a, b in zip(signature, candidate_signature)) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (cache_key, original_text, similarity)
+
+        if best is not None:
+            self.hits += 1
+            self._entries.move_to_end(best[0])
+        return best
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "candidate_hits": self.hits
+        }
@@ -0,0 +1,79 @@
+import logging
+import os
+from contextlib import contextmanager
+from typing import Optional
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+# Without a configured SDK this is a no-op tracer, so instrumented code costs next to nothing
+tracer = trace.get_tracer("ai-message-correction")
+
+TRACING_EXPORTERS = ("otlp", "file", "console")
+
+def configure_tracing() -> bool:
+    """Install an SDK tracer provider when TRACING_ENABLED is set.
+
+    Needs the optional tracing dependencies (opentelemetry-sdk and the OTLP
+    exporter). TRACING_EXPORTER selects "otlp" (configured through the
+    standard OTEL_EXPORTER_OTLP_* variables), "file" (one JSON span per line
+    in TRACING_FILE) or "console".
+    """
+    if os.getenv("TRACING_ENABLED", "false").lower() != "true":
+        return False
+    exporter_name = os.getenv("TRACING_EXPORTER", "otlp")
+    if exporter_name not in TRACING_EXPORTERS:
+        raise ValueError(f"Unknown tracing exporter: {exporter_name}")
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing stays disabled")
+        return False
+
+    if exporter_name == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTLP exporter is not installed; tracing stays disabled")
+            return False
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "file":
+        trace_file = open(os.getenv("TRACING_FILE", "./traces.jsonl"), "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=trace_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "ai-message-correction")}),
+        # Follow the caller's sampling decision, sample new traces at the configured ratio
+        sampler=ParentBasedTraceIdRatio(float(os.getenv("TRACING_SAMPLE_RATIO", "1.0")))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled with {exporter_name} exporter")
+    return True
+
+def shutdown_tracing() -> None:
+    """Flush buffered spans (no-op unless configure_tracing installed a provider)"""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+@contextmanager
+def start_span(name: str, attributes: Optional[dict] = None):
+    """Start a child span of the current one; None-valued attributes are left out"""
+    with tracer.start_as_current_span(
+        name, attributes={key: value for key, value in (attributes or {}).items() if value is not None}
+    ) as span:
+        yield span
+
+def set_span_attributes(attributes: dict) -> None:
+    """Add attributes to the current span, if any is recording"""
+    span = trace.get_current_span()
+    if span.is_recording():
+        for key, value in attributes.items():
+            if value is not None:
+                span.set_attribute(key, value)
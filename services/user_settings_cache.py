@@ -0,0 +1,56 @@
+import json
+import logging
+from typing import Optional
+from .cache_service import CacheService
+from .memory_cache import MemoryCache
+
+logger = logging.getLogger(__name__)
+
+class UserSettingsCache:
+    """Per-user settings cache with an in-process TTL tier and optional Redis tier.
+
+    The in-process TTL is kept short because another worker's write only
+    updates Redis and its own memory; this worker sees it once its entry expires.
+    """
+
+    def __init__(
+        self,
+        cache_service: Optional[CacheService] = None,
+        ttl: float = 60.0,
+        redis_ttl: int = 3600,
+        max_entries: int = 10000
+    ):
+        self._local = MemoryCache(max_entries=max_entries, default_ttl=ttl)
+        # None keeps the cache process-local
+        self._cache_service = cache_service
+        self.redis_ttl = redis_ttl
+
+    def _key(self, user_id: str) -> str:
+        return f"user_settings:{user_id}"
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        key = self._key(user_id)
+        cached = self._local.get(key)
+        if cached is None and self._cache_service:
+            cached = await self._cache_service.get_value(key)
+            if cached is not None:
+                self._local.set(key, cached)
+        return json.loads(cached) if cached is not None else None
+
+    async def set(self, user_id: str, settings: dict) -> None:
+        key = self._key(user_id)
+        payload = json.dumps(settings, ensure_ascii=False)
+        self._local.set(key, payload)
+        if self._cache_service:
+            await self._cache_service.set_value(key, payload, self.redis_ttl)
+
+    async def invalidate(self, user_id: str) -> None:
+        key = self._key(user_id)
+        self._local.delete(key)
+        if self._cache_service:
+            await self._cache_service.delete_value(key)
+
+    def get_stats(self) -> dict:
+        stats = self._local.get_stats()
+        stats["redis_backed"] = self._cache_service is not None
+        return stats
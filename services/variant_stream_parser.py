@@ -0,0 +1,73 @@
+import json
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+class VariantStreamParser:
+    """Incrementally extract objects from the "variants" array of a streamed JSON response.
+
+    Feed raw text chunks as they arrive; each call returns the variant dicts
+    whose closing brace has been seen since the previous call.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._object_start = -1
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        self._buffer += chunk
+        completed = []
+
+        if not self._in_array and not self._done:
+            key_index = self._buffer.find('"variants"')
+            if key_index == -1:
+                return completed
+            array_index = self._buffer.find("[", key_index)
+            if array_index == -1:
+                return completed
+            self._in_array = True
+            self._pos = array_index + 1
+
+        while self._in_array and self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    raw_object = self._buffer[self._object_start:self._pos + 1]
+                    try:
+                        completed.append(json.loads(raw_object))
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Failed to parse streamed variant: {str(e)}")
+            elif char == "]" and self._depth == 0:
+                self._in_array = False
+                self._done = True
+
+            self._pos += 1
+
+        return completed
+
+    @property
+    def text(self) -> str:
+        """The full text received so far"""
+        return self._buffer
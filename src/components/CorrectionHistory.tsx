@@ -17,30 +17,32 @@ const CorrectionHistory: React.FC<CorrectionHistoryProps> = ({
   const [historyItems, setHistoryItems] = useState<HistoryItem[]>([])
   const [loading, setLoading] = useState(false)
   const [totalCount, setTotalCount] = useState(0)
-  const [currentPage, setCurrentPage] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const itemsPerPage = 20
 
   useEffect(() => {
     if (isOpen) {
-      loadHistory()
+      loadHistory(null)
     }
-  }, [isOpen, userId, currentPage])
+  }, [isOpen, userId])
 
-  const loadHistory = async () => {
+  const loadHistory = async (cursor: string | null) => {
     setLoading(true)
     try {
-      const response = await correctionAPI.getCorrectionHistory(
+      // Cursor paging keeps deep pages as cheap as the first one
+      const response = await correctionAPI.getCorrectionHistoryPage(
         userId, 
         itemsPerPage, 
-        currentPage * itemsPerPage
+        cursor
       )
       
-      if (currentPage === 0) {
+      if (cursor === null) {
         setHistoryItems(response.items)
       } else {
         setHistoryItems(prev => [...prev, ...response.items])
       }
       
+      setNextCursor(response.next_cursor)
       setTotalCount(response.total_count)
     } catch (error) {
       console.error('Failed to load history:', error)
@@ -50,8 +52,8 @@ const CorrectionHistory: React.FC<CorrectionHistoryProps> = ({
   }
 
   const loadMore = () => {
-    if (!loading && historyItems.length < totalCount) {
-      setCurrentPage(prev => prev + 1)
+    if (!loading && nextCursor) {
+      loadHistory(nextCursor)
     }
   }
 
@@ -162,7 +164,7 @@ const CorrectionHistory: React.FC<CorrectionHistoryProps> = ({
                 ))}
               </div>
 
-              {historyItems.length < totalCount && (
+              {nextCursor && (
                 <div className="load-more-section">
                   <button 
                     className="load-more-button"
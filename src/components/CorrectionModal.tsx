@@ -25,28 +25,41 @@ const CorrectionModal: React.FC<CorrectionModalProps> = ({
   const [error, setError] = useState<string | null>(null)
 
   useEffect(() => {
+    // Abort the stream when the inputs change or the modal closes, so an old
+    // stream can't add its variants to the new list
+    const controller = new AbortController()
+    const { signal } = controller
+
     const fetchCorrections = async () => {
       try {
         setLoading(true)
         setError(null)
+        setVariants([])
         
-        const response = await correctionAPI.correctText({
-          text: originalText,
-          user_id: userId,
-          preferred_model: preferredModel,
-          correction_style: correctionStyle
-        })
-        
-        setVariants(response.variants)
+        // Show each suggestion as soon as the server finishes it
+        await correctionAPI.correctTextStream(
+          {
+            text: originalText,
+            user_id: userId,
+            preferred_model: preferredModel,
+            correction_style: correctionStyle
+          },
+          (variant) => {
+            if (!signal.aborted) setVariants(prev => [...prev, variant])
+          },
+          signal
+        )
       } catch (err) {
+        if (signal.aborted) return
         setError('添削処理中にエラーが発生しました')
         console.error('Correction error:', err)
       } finally {
-        setLoading(false)
+        if (!signal.aborted) setLoading(false)
       }
     }
 
     fetchCorrections()
+    return () => controller.abort()
   }, [originalText, correctionStyle])
 
   const handleVariantSelect = (variant: CorrectionVariant) => {
@@ -87,7 +100,7 @@ const CorrectionModal: React.FC<CorrectionModalProps> = ({
             <p>{originalText}</p>
           </div>
 
-          {loading && (
+          {loading && variants.length === 0 && (
             <div className="loading-state">
               <Loader2 className="spinner" size={24} />
               <p>AI が添削中...</p>
@@ -103,7 +116,7 @@ const CorrectionModal: React.FC<CorrectionModalProps> = ({
             </div>
           )}
 
-          {!loading && !error && variants.length > 0 && (
+          {!error && variants.length > 0 && (
             <div className="variants-container">
               {variants.map((variant, index) => (
                 <div
@@ -6,9 +6,31 @@ export interface CorrectionVariant {
   reason: string
 }
 
+export interface CorrectionMeta {
+  model: string | null
+  source: 'cache' | 'provider' | 'fallback' | 'shared' | 'error' | null
+  cache_tier: string | null
+  fallback_from: string | null
+  total_ms: number
+  provider_ms: number | null
+  queue_ms: number | null
+  tokens_in: number
+  tokens_out: number
+  stages_ms: Record<string, number>
+}
+
 export interface CorrectionResponse {
   original_text: string
   variants: CorrectionVariant[]
+  meta?: CorrectionMeta | null
+}
+
+export interface CorrectionStreamEvent {
+  event: 'variant' | 'done' | 'error'
+  variant?: CorrectionVariant
+  original_text?: string
+  meta?: CorrectionMeta | null
+  detail?: string
 }
 
 export interface CorrectionRequest {
@@ -41,6 +63,7 @@ export interface HistoryItem {
 export interface HistoryResponse {
   total_count: number
   items: HistoryItem[]
+  next_cursor: string | null
 }
 
 const api = axios.create({
@@ -48,12 +71,64 @@ const api = axios.create({
   timeout: 10000,
 })
 
+const randomHex = (bytes: number): string =>
+  Array.from(crypto.getRandomValues(new Uint8Array(bytes)), (b) => b.toString(16).padStart(2, '0')).join('')
+
+// W3C trace context, so each backend trace starts from the browser request that caused it
+export const newTraceparent = (): string => `00-${randomHex(16)}-${randomHex(8)}-01`
+
+api.interceptors.request.use((config) => {
+  config.headers.set('traceparent', newTraceparent())
+  return config
+})
+
 export const correctionAPI = {
   correctText: async (request: CorrectionRequest): Promise<CorrectionResponse> => {
     const response = await api.post<CorrectionResponse>('/correct', request)
     return response.data
   },
 
+  correctTextStream: async (
+    request: CorrectionRequest,
+    onVariant: (variant: CorrectionVariant) => void,
+    signal?: AbortSignal
+  ): Promise<void> => {
+    // axios can't consume a streamed body in the browser, so use fetch
+    const response = await fetch('/api/correct/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', traceparent: newTraceparent() },
+      body: JSON.stringify(request),
+      signal
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`Stream request failed: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    const handleLine = (line: string) => {
+      if (!line.trim()) return
+      const event: CorrectionStreamEvent = JSON.parse(line)
+      if (event.event === 'variant' && event.variant) {
+        onVariant(event.variant)
+      } else if (event.event === 'error') {
+        throw new Error(event.detail || 'Stream error')
+      }
+    }
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() ?? ''
+      lines.forEach(handleLine)
+    }
+    handleLine(buffer)
+  },
+
   getAvailableModels: async (): Promise<{ models: Record<string, string> }> => {
     const response = await api.get('/models')
     return response.data
@@ -74,6 +149,13 @@ export const correctionAPI = {
       params: { limit, offset }
     })
     return response.data
+  },
+
+  getCorrectionHistoryPage: async (userId: string, limit = 50, cursor?: string | null): Promise<HistoryResponse> => {
+    const response = await api.get<HistoryResponse>(`/user/${userId}/history`, {
+      params: cursor ? { limit, cursor } : { limit }
+    })
+    return response.data
   }
 }
 